@@ -0,0 +1,3 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
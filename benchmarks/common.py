@@ -0,0 +1,58 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+Names, versions and entries shared by the benchmark runner and the mock
+upstream server, so that both agree on what should be found.
+'''
+
+from typing import Dict, List, Sequence
+
+from nvchecker.util import Entries, Entry
+
+SOURCES = ['github', 'pypi', 'aur', 'apt', 'rpmrepo', 'regex']
+
+APT_MIRROR = 'https://deb.example.org/debian'
+RPM_REPO = 'https://rpm.example.org/repo'
+
+def entry_names(n: int, sources: Sequence[str]) -> Dict[str, List[str]]:
+  '''Names of ``n`` entries, spread evenly over ``sources``.'''
+  names: Dict[str, List[str]] = {s: [] for s in sources}
+  for i in range(n):
+    source = sources[i % len(sources)]
+    names[source].append(f'{source}-{i:06d}')
+  return names
+
+def version_of(name: str) -> str:
+  return f'1.{int(name.rsplit("-", 1)[1])}.0'
+
+def make_entry(source: str, name: str) -> Entry:
+  if source == 'github':
+    return {
+      'source': 'github', 'github': f'bench/{name}',
+      'use_latest_release': True,
+    }
+  elif source == 'pypi':
+    return {'source': 'pypi', 'pypi': name}
+  elif source == 'aur':
+    return {'source': 'aur', 'aur': name}
+  elif source == 'apt':
+    return {
+      'source': 'apt', 'mirror': APT_MIRROR, 'suite': 'stable', 'pkg': name,
+    }
+  elif source == 'rpmrepo':
+    return {'source': 'rpmrepo', 'repo': RPM_REPO, 'pkg': name}
+  elif source == 'regex':
+    return {
+      'source': 'regex', 'url': f'https://example.org/{name}.html',
+      'regex': r'version ([\d.]+)',
+    }
+  else:
+    raise ValueError('unknown source', source)
+
+def make_entries(n: int, sources: Sequence[str]) -> Entries:
+  return {
+    name: make_entry(source, name)
+    for source, names in entry_names(n, sources).items()
+    for name in names
+  }
@@ -0,0 +1,59 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+Compare sorting the versions in an APT ``Packages`` file with the dpkg sort
+key against the comparison function of the apt source.
+'''
+
+import argparse
+import functools
+import gzip
+import lzma
+import time
+from typing import Callable, List
+
+from nvchecker.sortversion import dpkg_version, _dpkg_chars
+from nvchecker_source.apt import compare_version
+
+def read_versions(path: str) -> List[str]:
+  if path.endswith('.xz'):
+    f = lzma.open(path, 'rt', encoding='utf-8')
+  elif path.endswith('.gz'):
+    f = gzip.open(path, 'rt', encoding='utf-8')
+  else:
+    f = open(path, encoding='utf-8')
+  with f:
+    return [line[9:].rstrip('\n') for line in f if line.startswith('Version: ')]
+
+def best_of(n: int, fn: Callable[[], object]) -> float:
+  ret = float('inf')
+  for _ in range(n):
+    # start every round cold
+    _dpkg_chars.cache_clear()
+    t = time.perf_counter()
+    fn()
+    ret = min(ret, time.perf_counter() - t)
+  return ret
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description='dpkg version sorting benchmark')
+  parser.add_argument('file', nargs='?', default='/var/lib/dpkg/status',
+                      help='a Packages file, optionally .xz or .gz compressed '
+                           '(default: /var/lib/dpkg/status)')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='report the best of this many rounds (default: 3)')
+  args = parser.parse_args()
+
+  versions = read_versions(args.file)
+  print(f'{len(versions)} versions')
+
+  cmp = best_of(args.repeat, lambda: sorted(
+    versions, key=functools.cmp_to_key(compare_version)))
+  key = best_of(args.repeat, lambda: sorted(versions, key=dpkg_version))
+  print(f'{"cmp_to_key(compare_version)":>28} {cmp * 1000:>9.1f} ms')
+  print(f'{"dpkg_version":>28} {key * 1000:>9.1f} ms')
+  print(f'{"speedup":>28} {cmp / key:>9.1f}x')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,226 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+Check generated entries against the mock upstream server with each HTTP
+backend, and report the throughput, request latencies and peak memory.
+
+Every (size, backend) combination runs in a fresh process so that memory
+usage can be measured separately.
+'''
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import logging
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import structlog
+
+from nvchecker import core
+from nvchecker import __main__ as nvchecker_main
+from nvchecker.httpclient import session
+from nvchecker.httpclient.base import BaseSession, Response, StreamResponse
+from nvchecker.util import RawResult, KeyManager, EntryWaiter, ResultData
+
+from .common import SOURCES, make_entries, version_of
+
+HTTPLIBS = ['aiohttp', 'httpx', 'tornado']
+
+class RewritingSession(BaseSession):
+  '''Send all requests to the mock server, and time them.'''
+  def __init__(self, inner: BaseSession, port: int) -> None:
+    self.inner = inner
+    self.base = f'http://127.0.0.1:{port}/'
+    self.latencies: List[float] = []
+
+  def _rewrite(self, url: str) -> str:
+    u = urlsplit(url)
+    return self.base + u.netloc + u._replace(scheme='', netloc='').geturl()
+
+  async def request_impl(self, url: str, **kwargs) -> Response:
+    t = time.perf_counter()
+    try:
+      return await self.inner.request_impl(self._rewrite(url), **kwargs)
+    finally:
+      self.latencies.append(time.perf_counter() - t)
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(
+    self, url: str, **kwargs,
+  ) -> AsyncIterator[StreamResponse]:
+    t = time.perf_counter()
+    try:
+      async with self.inner.stream_impl(self._rewrite(url), **kwargs) as res:
+        yield res
+    finally:
+      self.latencies.append(time.perf_counter() - t)
+
+def setup_session(httplib: str, port: int, concurrency: int) -> RewritingSession:
+  core.setup_httpclient(concurrency, httplib)
+  inner = session._obj
+  assert inner is not None
+  s = RewritingSession(inner, port)
+  session.set_obj(s)
+  return s
+
+def percentile(values: List[float], p: float) -> float:
+  if not values:
+    return 0
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+async def check(
+  entries: Dict[str, Any], concurrency: int,
+) -> ResultData:
+  task_sem = asyncio.Semaphore(concurrency)
+  result_q: asyncio.Queue[RawResult] = asyncio.Queue()
+  entry_waiter = EntryWaiter()
+  session.begin_run()
+  futures = core.Dispatcher().dispatch(
+    entries, task_sem, result_q,
+    KeyManager(None), entry_waiter, 1, {},
+  )
+  result_coro = core.process_result({}, result_q, entry_waiter)
+  runner_coro = core.run_tasks(futures)
+  results, _ = await nvchecker_main.run(result_coro, runner_coro)
+  return results
+
+def run_one(args: argparse.Namespace) -> Dict[str, Any]:
+  # only report problems, on stderr
+  structlog.configure(
+    wrapper_class = structlog.make_filtering_bound_logger(logging.WARNING),
+    logger_factory = structlog.PrintLoggerFactory(sys.stderr),
+  )
+
+  sources = args.sources.split(',')
+  entries = make_entries(args.entries, sources)
+
+  async def run() -> Tuple[ResultData, RewritingSession, float]:
+    s = setup_session(args.httplib, args.port, args.concurrency)
+    t = time.perf_counter()
+    results = await check(entries, args.concurrency)
+    return results, s, time.perf_counter() - t
+
+  results, s, elapsed = asyncio.run(run())
+  ok = sum(
+    1 for name, r in results.items()
+    if r.version and version_of(name) in r.version
+  )
+  return {
+    'httplib': args.httplib,
+    'entries': len(entries),
+    'ok': ok,
+    'seconds': elapsed,
+    'entries_per_second': len(entries) / elapsed,
+    'requests': len(s.latencies),
+    'p50_ms': percentile(s.latencies, 0.5) * 1000,
+    'p99_ms': percentile(s.latencies, 0.99) * 1000,
+    # KiB on Linux
+    'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+  }
+
+def free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+  deadline = time.monotonic() + timeout
+  while True:
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return
+    except OSError:
+      if time.monotonic() > deadline:
+        raise
+      time.sleep(0.1)
+
+def available_httplibs() -> List[str]:
+  ret = []
+  for lib in HTTPLIBS:
+    try:
+      importlib.import_module(lib)
+    except ImportError:
+      continue
+    ret.append(lib)
+  return ret
+
+def run_all(args: argparse.Namespace) -> List[Dict[str, Any]]:
+  httplibs = args.httplib.split(',') if args.httplib else available_httplibs()
+  reports = []
+  for n in (int(x) for x in args.entries.split(',')):
+    port = free_port()
+    server = subprocess.Popen([
+      sys.executable, '-m', 'benchmarks.server',
+      '--port', str(port), '--entries', str(n),
+      '--sources', args.sources, '--delay', str(args.delay),
+    ])
+    try:
+      wait_for_port(port)
+      for lib in httplibs:
+        out = subprocess.run([
+          sys.executable, '-m', 'benchmarks.run', '--single',
+          '--port', str(port), '--entries', str(n), '--httplib', lib,
+          '--sources', args.sources, '--concurrency', str(args.concurrency),
+        ], stdout=subprocess.PIPE, check=True).stdout
+        report = json.loads(out)
+        reports.append(report)
+        if not args.json:
+          print_report(report)
+    finally:
+      server.terminate()
+      server.wait()
+  return reports
+
+HEADER = f'{"httplib":>8} {"entries":>8} {"ok":>8} {"entries/s":>10} {"p50 ms":>8} {"p99 ms":>8} {"RSS MiB":>8}'
+
+def print_report(r: Dict[str, Any]) -> None:
+  print(
+    f'{r["httplib"]:>8} {r["entries"]:>8} {r["ok"]:>8} '
+    f'{r["entries_per_second"]:>10.1f} {r["p50_ms"]:>8.2f} '
+    f'{r["p99_ms"]:>8.2f} {r["peak_rss_mib"]:>8.1f}',
+    flush=True,
+  )
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description='nvchecker end-to-end benchmark')
+  parser.add_argument('--entries', default='1000,10000',
+                      help='comma-separated numbers of entries to check '
+                           '(default: 1000,10000)')
+  parser.add_argument('--httplib',
+                      help='comma-separated HTTP backends (default: all installed)')
+  parser.add_argument('--sources', default=','.join(SOURCES),
+                      help='comma-separated sources of the generated entries')
+  parser.add_argument('--concurrency', type=int, default=20,
+                      help='max_concurrency (default: 20)')
+  parser.add_argument('--delay', type=float, default=0, metavar='SECONDS',
+                      help='delay of each response from the mock server')
+  parser.add_argument('--json', action='store_true',
+                      help='print the reports as JSON')
+  # internal: run one benchmark in this process
+  parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+  parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.single:
+    args.entries = int(args.entries)
+    print(json.dumps(run_one(args)))
+    return
+
+  if not args.json:
+    print(HEADER, flush=True)
+  reports = run_all(args)
+  if args.json:
+    print(json.dumps(reports, indent=2))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,185 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+A mock upstream server with synthetic GitHub, PyPI, AUR, apt and rpm
+repository payloads. Requests are expected as ``/<host>/<path>``, which is
+what the URL rewriting in ``run.py`` produces.
+'''
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import lzma
+from typing import Dict, List, Optional
+
+import tornado.web
+
+from .common import SOURCES, entry_names, version_of
+
+def github_release(name: str) -> bytes:
+  ver = version_of(name)
+  return json.dumps({
+    'tag_name': f'v{ver}',
+    'name': f'v{ver}',
+    'html_url': f'https://github.com/bench/{name}/releases/tag/v{ver}',
+    'published_at': '2024-01-01T00:00:00Z',
+    'prerelease': False,
+  }).encode()
+
+def pypi_project(name: str) -> bytes:
+  ver = version_of(name)
+  files = [{
+    'yanked': False,
+    'upload_time_iso_8601': '2024-01-01T00:00:00.000000Z',
+  }]
+  releases = {f'0.{i}.0': files for i in range(30)}
+  releases[ver] = files
+  return json.dumps({
+    'info': {
+      'version': ver,
+      'project_urls': {'Changelog': f'https://example.org/{name}/changes'},
+    },
+    'releases': releases,
+  }).encode()
+
+def aur_info(names: List[str]) -> bytes:
+  results = [{
+    'Name': name,
+    'Version': version_of(name) + '-1',
+    'LastModified': 1700000000,
+  } for name in names]
+  return json.dumps({
+    'version': 5, 'type': 'multiinfo',
+    'resultcount': len(results), 'results': results,
+  }).encode()
+
+def apt_release(packages: bytes) -> bytes:
+  return (
+    'Origin: bench\nSuite: stable\nSHA256:\n'
+    f' {hashlib.sha256(packages).hexdigest()} {len(packages)} '
+    'main/binary-amd64/Packages.xz\n'
+  ).encode()
+
+def apt_packages(names: List[str]) -> bytes:
+  data = ''.join(
+    f'Package: {name}\nVersion: {version_of(name)}-1\n'
+    f'Architecture: amd64\nDescription: benchmark package\n\n'
+    for name in names
+  )
+  return lzma.compress(data.encode())
+
+RPM_REPOMD = b'''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <data type="primary"><location href="repodata/primary.xml.gz"/></data>
+</repomd>
+'''
+
+def rpm_primary(names: List[str]) -> bytes:
+  packages = ''.join(
+    f'<package type="rpm"><name>{name}</name><arch>x86_64</arch>'
+    f'<version epoch="0" ver="{version_of(name)}" rel="1"/>'
+    f'<summary>benchmark package</summary></package>\n'
+    for name in names
+  )
+  data = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<metadata xmlns="http://linux.duke.edu/metadata/common" '
+    'xmlns:rpm="http://linux.duke.edu/metadata/rpm" '
+    f'packages="{len(names)}">\n{packages}</metadata>\n'
+  )
+  return gzip.compress(data.encode())
+
+def html_page(name: str) -> bytes:
+  filler = '<p>Lorem ipsum dolor sit amet.</p>\n' * 500
+  return (
+    f'<html><body><h1>{name}</h1>\n<p>Latest: version {version_of(name)}</p>\n'
+    f'{filler}</body></html>\n'
+  ).encode()
+
+class UpstreamHandler(tornado.web.RequestHandler):
+  def initialize(self, upstream: 'Upstream') -> None:
+    self.upstream = upstream
+
+  async def get(self, path: str) -> None:
+    if self.upstream.delay:
+      await asyncio.sleep(self.upstream.delay)
+
+    body = self.upstream.respond(path, self.request.query_arguments)
+    if body is None:
+      raise tornado.web.HTTPError(404)
+    if path.endswith('.html'):
+      self.set_header('Content-Type', 'text/html')
+    elif path.endswith(('.xz', '.gz')):
+      self.set_header('Content-Type', 'application/octet-stream')
+    else:
+      self.set_header('Content-Type', 'application/json')
+    self.write(body)
+
+class Upstream:
+  def __init__(self, entries: int, sources: List[str], delay: float) -> None:
+    self.names = entry_names(entries, sources)
+    self.delay = delay
+    self._files: Dict[str, bytes] = {}
+
+  def _file(self, key: str) -> bytes:
+    # big index files are generated once
+    if key not in self._files:
+      if key == 'apt':
+        self._files[key] = apt_packages(self.names.get('apt', []))
+      elif key == 'rpm':
+        self._files[key] = rpm_primary(self.names.get('rpmrepo', []))
+    return self._files[key]
+
+  def respond(
+    self, path: str, query: Dict[str, List[bytes]],
+  ) -> Optional[bytes]:
+    host, _, path = path.partition('/')
+    if host == 'api.github.com' and path.endswith('/releases/latest'):
+      return github_release(path.split('/')[2])
+    elif host == 'pypi.org' and path.startswith('pypi/'):
+      return pypi_project(path.split('/')[1])
+    elif host == 'aur.archlinux.org' and path == 'rpc/':
+      return aur_info([a.decode() for a in query.get('arg[]', [])])
+    elif host == 'deb.example.org':
+      if path == 'debian/dists/stable/Release':
+        return apt_release(self._file('apt'))
+      elif path == 'debian/dists/stable/main/binary-amd64/Packages.xz':
+        return self._file('apt')
+    elif host == 'rpm.example.org':
+      if path == 'repo/repodata/repomd.xml':
+        return RPM_REPOMD
+      elif path == 'repo/repodata/primary.xml.gz':
+        return self._file('rpm')
+    elif host == 'example.org' and path.endswith('.html'):
+      return html_page(path[:-5])
+    return None
+
+def make_app(upstream: Upstream) -> tornado.web.Application:
+  return tornado.web.Application([
+    (r'/(.*)', UpstreamHandler, {'upstream': upstream}),
+  ])
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description='mock upstream server for benchmarks')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--entries', type=int, default=1000,
+                      help='number of entries to serve data for')
+  parser.add_argument('--sources', default=','.join(SOURCES),
+                      help='comma-separated sources of the entries')
+  parser.add_argument('--delay', type=float, default=0, metavar='SECONDS',
+                      help='delay of each response')
+  args = parser.parse_args()
+
+  upstream = Upstream(args.entries, args.sources.split(','), args.delay)
+  asyncio.run(serve(upstream, args.port))
+
+async def serve(upstream: Upstream, port: int) -> None:
+  app = make_app(upstream)
+  app.listen(port, address='127.0.0.1')
+  await asyncio.Event().wait()
+
+if __name__ == '__main__':
+  main()
@@ -4,20 +4,33 @@
 
 from __future__ import annotations
 
+import os
 import sys
+import time
 import argparse
 import asyncio
-from typing import Coroutine, Tuple
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Coroutine, Tuple, Dict, Any, TypeVar, Optional, NamedTuple
 from pathlib import Path
+from datetime import datetime, timezone
 
 import structlog
 
 from . import core
-from .util import ResultData, RawResult, KeyManager, EntryWaiter
+from . import jsonutil
+from .util import (
+  ResultData, RawResult, KeyManager, EntryWaiter, Entry, Entries,
+)
 from .ctxvars import proxy as ctx_proxy
+from .ctxvars import metrics as ctx_metrics
+from .metrics import Metrics
+from .httpclient import session
 
 logger = structlog.get_logger(logger_name=__name__)
 
+T = TypeVar('T')
+
 def main() -> None:
   parser = argparse.ArgumentParser(description='New version checker for software')
   parser.add_argument('-k', '--keyfile',
@@ -29,75 +42,439 @@ def main() -> None:
                       help='exit with code 3 if failures / errors happen during checking')
   parser.add_argument('-e', '--entry', type=str,
                       help='only execute on specified entry (useful for debugging)')
+  parser.add_argument('--daemon', action='store_true',
+                      help='keep running and check entries periodically')
+  parser.add_argument('--interval', default=3600, type=int, metavar='SECONDS',
+                      help='default check interval in daemon mode, '
+                           'if check_interval is not configured (default: 3600)')
+  parser.add_argument('--shard', type=parse_shard, metavar='K/N',
+                      help='only check the K-th of N shards of the entries')
+  parser.add_argument('--parallel', type=int, metavar='N',
+                      help='check entries in N processes')
+  parser.add_argument('--resume', action='store_true',
+                      help='don\'t check again entries checked by the last run '
+                           'before it was interrupted')
+  parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                      help='stop checking after SECONDS and write the results '
+                           'so far; unfinished entries are failures')
+  cassette = parser.add_mutually_exclusive_group()
+  cassette.add_argument('--record', type=Path, metavar='DIR',
+                        help='record HTTP responses into DIR')
+  cassette.add_argument('--replay', type=Path, metavar='DIR',
+                        help='serve HTTP responses recorded in DIR '
+                             'instead of sending requests')
+  parser.add_argument('--replay-latency', default=0, type=float, metavar='SECONDS',
+                      help='delay each replayed response by SECONDS')
+  parser.add_argument('--metrics-file', type=Path, metavar='FILE',
+                      help='write timings and HTTP statistics of the run to FILE, '
+                           'as JSON if it ends with ".json", or in Prometheus '
+                           'text format otherwise')
   core.add_common_arguments(parser)
   args = parser.parse_args()
   if core.process_common_arguments(args):
     return
+  if args.replay is not None and not args.replay.is_dir():
+    parser.error(f'--replay: {args.replay} is not a directory')
+  if args.parallel is not None:
+    if args.parallel < 1:
+      parser.error('--parallel requires a positive number')
+    if args.daemon:
+      parser.error('--parallel can\'t be used with --daemon')
 
   try:
-    entries, options = core.load_file(
-      args.file, use_keymanager=not bool(args.keyfile))
+    entries, options, keymanager = load_config(args)
+  except core.FileLoadError as e:
+    sys.exit(str(e))
+  except EntryNotFound:
+    sys.exit('Specified entry not found in config')
 
-    if args.entry:
-      if args.entry not in entries:
-        sys.exit('Specified entry not found in config')
-      entries = {args.entry: entries[args.entry]}
+  if args.daemon:
+    try:
+      run_async(run_daemon(args, entries, options, keymanager))
+    except KeyboardInterrupt:
+      pass
+    return
 
-    if args.keyfile:
-      keymanager = KeyManager(Path(args.keyfile))
+  run_options = RunOptions.from_args(args)
+  journal_file = None
+  resumed: ResultData = {}
+  if options.ver_files is not None:
+    newvers = core.read_verfile(options.ver_files[1])
+    journal_file = core.journal_file(options.ver_files[1])
+    if args.resume:
+      resumed = core.read_journal(journal_file)
+      logger.info('resuming', checked=len(resumed))
+    # start a new journal, or continue the old one; it's opened again by
+    # every process checking entries
+    core.Journal(journal_file, append=args.resume).close()
+  else:
+    newvers = {}
+
+  try:
+    if args.parallel and args.parallel > 1:
+      results, has_failures, metrics = run_parallel(
+        args.parallel, run_options, entries, options, keymanager,
+        newvers, resumed, journal_file)
     else:
-      keymanager = options.keymanager
-  except core.FileLoadError as e:
-    sys.exit(str(e))
+      results, has_failures, metrics = run_shard(
+        run_options, entries, options, keymanager,
+        newvers, resumed, journal_file)
+  except ModuleNotFoundError as e:
+    sys.exit(f'Error: {e}')
 
-  if options.proxy is not None:
-    ctx_proxy.set(options.proxy)
+  write_newver(args, options, newvers, results)
+  if journal_file is not None:
+    journal_file.unlink()
+  if metrics is not None:
+    write_metrics(args.metrics_file, metrics)
 
-  task_sem = asyncio.Semaphore(options.max_concurrency)
-  result_q: asyncio.Queue[RawResult] = asyncio.Queue()
-  dispatcher = core.setup_httpclient(
+  if args.failures and has_failures:
+    sys.exit(3)
+
+class EntryNotFound(Exception):
+  pass
+
+class RunOptions(NamedTuple):
+  '''Command line options used while checking.
+
+  Unlike the parsed arguments, these hold no open files, so they can be
+  passed to other processes.
+  '''
+  entry: Optional[str]
+  tries: int
+  deadline: Optional[float]
+  record: Optional[Path]
+  replay: Optional[Path]
+  replay_latency: float
+  # whether to collect metrics
+  metrics: bool
+
+  @classmethod
+  def from_args(cls, args: argparse.Namespace) -> RunOptions:
+    return cls(
+      entry = args.entry,
+      tries = args.tries,
+      deadline = args.deadline,
+      record = args.record,
+      replay = args.replay,
+      replay_latency = args.replay_latency,
+      metrics = args.metrics_file is not None,
+    )
+
+def parse_shard(s: str) -> Tuple[int, int]:
+  try:
+    k, n = (int(x) for x in s.split('/'))
+  except ValueError:
+    raise argparse.ArgumentTypeError(f'invalid shard: {s!r}')
+  if not 1 <= k <= n:
+    raise argparse.ArgumentTypeError(f'invalid shard: {s!r}')
+  return k, n
+
+def run_shard(
+  run_options: RunOptions,
+  entries: Entries,
+  options: core.Options,
+  keymanager: KeyManager,
+  newvers: ResultData,
+  resumed: ResultData = {},
+  journal_file: Optional[Path] = None,
+) -> Tuple[ResultData, bool, Optional[Metrics]]:
+  '''Check ``entries``, except those with ``resumed`` results.
+
+  Results are appended to the journal ``journal_file`` if given.
+  '''
+  if run_options.entry:
+    # always check the specified entry
+    skipped: ResultData = {}
+  else:
+    entries, skipped = core.split_due_entries(
+      entries, newvers, options.check_interval,
+      datetime.now(timezone.utc),
+    )
+
+  if resumed:
+    skipped = {
+      **skipped,
+      **{name: r for name, r in resumed.items() if name in entries},
+    }
+    entries = {
+      name: entry for name, entry in entries.items() if name not in resumed
+    }
+
+  setup_httpclient(run_options, options)
+  metrics = Metrics() if run_options.metrics else None
+  journal = core.Journal(journal_file, append=True) if journal_file else None
+  try:
+    results, has_failures = run_async(check_entries(
+      run_options, entries, options, keymanager, skipped, metrics, journal,
+    ))
+  finally:
+    if journal is not None:
+      journal.close()
+  return results, has_failures, metrics
+
+def run_parallel(
+  n: int,
+  run_options: RunOptions,
+  entries: Entries,
+  options: core.Options,
+  keymanager: KeyManager,
+  newvers: ResultData,
+  resumed: ResultData = {},
+  journal_file: Optional[Path] = None,
+) -> Tuple[ResultData, bool, Optional[Metrics]]:
+  '''Check entries in ``n`` forked processes and merge the results.'''
+  ctx = multiprocessing.get_context('fork')
+  with ProcessPoolExecutor(max_workers=n, mp_context=ctx) as executor:
+    futures = [
+      executor.submit(
+        run_shard, run_options, core.shard_entries(entries, i, n),
+        options, keymanager, newvers, resumed, journal_file,
+      ) for i in range(n)
+    ]
+    results: ResultData = {}
+    has_failures = False
+    metrics = None
+    for fu in futures:
+      r, failed, m = fu.result()
+      results.update(r)
+      has_failures = has_failures or failed
+      if m is not None:
+        if metrics is None:
+          metrics = m
+        else:
+          metrics.merge(m)
+
+  return results, has_failures, metrics
+
+def load_config(
+  args: argparse.Namespace,
+) -> Tuple[Entries, core.Options, KeyManager]:
+  entries, options = core.load_file(
+    args.file, use_keymanager=not bool(args.keyfile))
+
+  if args.entry:
+    if args.entry not in entries:
+      raise EntryNotFound(args.entry)
+    entries = {args.entry: entries[args.entry]}
+  elif args.shard:
+    k, n = args.shard
+    entries = core.shard_entries(entries, k - 1, n)
+
+  if args.keyfile:
+    keymanager = KeyManager(Path(args.keyfile))
+  else:
+    keymanager = options.keymanager
+
+  return entries, options, keymanager
+
+def setup_httpclient(
+  run_options: RunOptions, options: core.Options,
+) -> None:
+  core.setup_httpclient(
     options.max_concurrency,
     options.httplib,
     options.http_timeout,
     options.resolver,
+    options.host_limits,
+    options.http_cache,
+    options.retry_policy,
+    options.breaker_policy,
+    record = run_options.record,
+    replay = run_options.replay,
+    replay_latency = run_options.replay_latency,
+  )
+
+def _httpclient_options(options: core.Options) -> Tuple[Any, ...]:
+  return (
+    options.max_concurrency, options.httplib, options.http_timeout,
+    options.resolver, options.host_limits, options.http_cache,
+    options.retry_policy, options.breaker_policy,
   )
+
+def run_async(coro: Coroutine[None, None, T]) -> T:
+  if sys.version_info >= (3, 10):
+    # Python 3.10 has deprecated asyncio.get_event_loop
+    return asyncio.run(coro)
+  else:
+    # Python < 3.10 will create an eventloop when asyncio.Queue is initialized
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+async def check_entries(
+  run_options: RunOptions,
+  entries: Entries,
+  options: core.Options,
+  keymanager: KeyManager,
+  skipped: ResultData,
+  metrics: Optional[Metrics] = None,
+  journal: Optional[core.Journal] = None,
+) -> Tuple[ResultData, bool]:
+  '''Check ``entries`` and return the results together with ``skipped``.
+
+  ``skipped`` are the last results of the entries not to be checked this time.
+  Timings and HTTP statistics are collected into ``metrics`` if given.
+  '''
+  if options.proxy is not None:
+    ctx_proxy.set(options.proxy)
+  ctx_metrics.set(metrics)
+  start = time.monotonic()
+  session.begin_run()
+
+  task_sem = asyncio.Semaphore(options.max_concurrency)
+  result_q: asyncio.Queue[RawResult] = asyncio.Queue()
+  dispatcher = core.Dispatcher()
   entry_waiter = EntryWaiter()
-  try:
-    futures = dispatcher.dispatch(
-      entries, task_sem, result_q,
-      keymanager, entry_waiter,
-      args.tries,
-      options.source_configs,
-    )
-  except ModuleNotFoundError as e:
-    sys.exit(f'Error: {e}')
+  futures = dispatcher.dispatch(
+    entries, task_sem, result_q,
+    keymanager, entry_waiter,
+    run_options.tries,
+    options.source_configs,
+  )
 
   if options.ver_files is not None:
     oldvers = core.read_verfile(options.ver_files[0])
   else:
     oldvers = {}
-  result_coro = core.process_result(oldvers, result_q, entry_waiter, verbose=bool(args.entry))
-  runner_coro = core.run_tasks(futures)
+  result_coro = core.process_result(
+    oldvers, result_q, entry_waiter,
+    verbose = bool(run_options.entry),
+    skipped = skipped,
+    entries = entries,
+    journal = journal,
+  )
+  runner_coro = core.run_tasks(futures, run_options.deadline)
+  try:
+    return await run(result_coro, runner_coro)
+  finally:
+    session.end_run()
+    if metrics is not None:
+      metrics.seconds = time.monotonic() - start
 
-  if sys.version_info >= (3, 10):
-    # Python 3.10 has deprecated asyncio.get_event_loop
-    results, has_failures = asyncio.run(run(result_coro, runner_coro))
+def write_newver(
+  args: argparse.Namespace,
+  options: core.Options,
+  newvers: ResultData,
+  results: ResultData,
+) -> None:
+  if options.ver_files is None:
+    return
+
+  if args.entry or args.shard:
+    # don't remove other entries when only some entries are checked
+    vers = dict(newvers)
   else:
-    # Python < 3.10 will create an eventloop when asyncio.Queue is initialized
-    results, has_failures = asyncio.get_event_loop().run_until_complete(run(result_coro, runner_coro))
+    vers = {}
+  vers.update(results)
+  core.write_verfile(options.ver_files[1], vers)
+
+def write_metrics(file: Path, metrics: Metrics) -> None:
+  if file.suffix == '.json':
+    data = jsonutil.dumps(metrics.to_dict(), indent=True) + '\n'
+  else:
+    data = metrics.to_prometheus()
+  core.safe_overwrite(file, data)
+
+# how often to look for configuration changes in daemon mode
+CONFIG_POLL_INTERVAL = 60
+
+async def run_daemon(
+  args: argparse.Namespace,
+  entries: Entries,
+  options: core.Options,
+  keymanager: KeyManager,
+) -> None:
+  '''Check entries on their own intervals forever.
+
+  The HTTP client (with its connections) and imported source modules are
+  reused between checks. The configuration file is reloaded when changed.
+  '''
+  mtime = os.stat(args.file).st_mtime
+  run_options = RunOptions.from_args(args)
+  setup_httpclient(run_options, options)
+  http_options = _httpclient_options(options)
 
   if options.ver_files is not None:
-    newverf = options.ver_files[1]
-    if args.entry:
-      # don't remove other entries when only one entry is specified on cmdline
-      vers = core.read_verfile(newverf)
-    else:
-      vers = {}
-    vers.update(results)
-    core.write_verfile(newverf, vers)
+    newvers = core.read_verfile(options.ver_files[1])
+  else:
+    newvers = {}
 
-  if args.failures and has_failures:
-    sys.exit(3)
+  # name -> when to check next (as a timestamp)
+  schedule: Dict[str, float] = {}
+  for name, r in newvers.items():
+    if r.last_checked:
+      try:
+        schedule[name] = core.parse_time(r.last_checked).timestamp()
+      except ValueError:
+        pass
+  # schedule holds last check times until the first round
+  first_round = True
+
+  while True:
+    try:
+      new_mtime = os.stat(args.file).st_mtime
+    except OSError as e:
+      logger.error('failed to stat configuration file', error=repr(e))
+      new_mtime = mtime
+    if new_mtime != mtime:
+      mtime = new_mtime
+      try:
+        entries, options, keymanager = load_config(args)
+      except (core.FileLoadError, EntryNotFound) as e:
+        logger.error('failed to reload configuration, keeping the old one',
+                     error=str(e))
+      else:
+        logger.info('configuration reloaded')
+        if _httpclient_options(options) != http_options:
+          setup_httpclient(run_options, options)
+          http_options = _httpclient_options(options)
+
+    default_interval = options.check_interval or args.interval
+    def interval_of(entry: Entry) -> int:
+      return entry.get('check_interval') or default_interval
+
+    if first_round:
+      for name, entry in entries.items():
+        if name in schedule:
+          schedule[name] += interval_of(entry)
+      first_round = False
+
+    now = time.time()
+    due = {
+      name: entry for name, entry in entries.items()
+      if schedule.get(name, 0) <= now
+    }
+    if due:
+      skipped = {
+        name: r for name, r in newvers.items()
+        if name in entries and name not in due
+      }
+      logger.debug('checking due entries', count=len(due))
+      metrics = Metrics() if args.metrics_file else None
+      try:
+        results, _ = await check_entries(
+          run_options, due, options, keymanager, skipped, metrics,
+        )
+      except ModuleNotFoundError as e:
+        logger.error('failed to load source', error=str(e))
+      else:
+        write_newver(args, options, newvers, results)
+        if metrics is not None:
+          write_metrics(args.metrics_file, metrics)
+        if args.entry or args.shard:
+          newvers.update(results)
+        else:
+          newvers = results
+      now = time.time()
+      for name, entry in due.items():
+        # failed entries are retried on their interval, too
+        schedule[name] = now + interval_of(entry)
+
+    next_check = min(
+      (schedule.get(name, 0) for name in entries),
+      default = now + CONFIG_POLL_INTERVAL,
+    )
+    delay = min(max(next_check - now, 1), CONFIG_POLL_INTERVAL)
+    await asyncio.sleep(delay)
 
 async def run(
   result_coro: Coroutine[None, None, Tuple[ResultData, bool]],
@@ -2,9 +2,12 @@
 # Copyright (c) 2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
 from .httpclient import session, TemporaryError, HTTPError
+from .httpclient.base import Response, StreamResponse
 from .util import (
   Entry, BaseWorker, RawResult, VersionResult, RichResult,
   AsyncCache, KeyManager, GetVersionError, EntryWaiter,
+  FunctionWorker, decompress_stream, compression_of, iter_lines,
+  shortest_timeout,
 )
 from .sortversion import sort_version_keys
 
@@ -5,6 +5,7 @@ from __future__ import annotations
 
 import os
 import sys
+import time
 import asyncio
 from asyncio import Queue
 import logging
@@ -18,9 +19,11 @@ import types
 from pathlib import Path
 from importlib import import_module
 import re
+import zlib
 import contextvars
 import json
 import dataclasses
+from datetime import datetime, timezone
 
 import structlog
 
@@ -36,16 +39,20 @@ import platformdirs
 
 from .lib import nicelogger
 from . import slogconf
+from . import jsonutil
 from .util import (
   Entry, Entries, KeyManager, RawResult, RichResult, ResultData,
-  FunctionWorker, GetVersionError,
-  FileLoadError, EntryWaiter,
+  BaseWorker, FunctionWorker, GetVersionError,
+  FileLoadError, EntryWaiter, shortest_timeout,
 )
 from . import __version__
 from .sortversion import sort_version_keys
 from .ctxvars import tries as ctx_tries
 from .ctxvars import entry_waiter as ctx_entry_waiter
+from .ctxvars import metrics as ctx_metrics
+from .ctxvars import source as ctx_source
 from . import httpclient
+from .httpclient import RetryPolicy, BreakerPolicy
 
 logger = structlog.get_logger(logger_name=__name__)
 
@@ -54,6 +61,10 @@ def get_default_config() -> str:
   file = os.path.join(confdir, 'nvchecker.toml')
   return file
 
+def get_default_http_cache_dir() -> Path:
+  cachedir = platformdirs.user_cache_dir(appname='nvchecker')
+  return Path(cachedir) / 'http'
+
 def add_common_arguments(parser: argparse.ArgumentParser) -> None:
   parser.add_argument('-l', '--logging',
                       choices=('debug', 'info', 'warning', 'error'), default='info',
@@ -136,7 +147,7 @@ def read_verfile(file: Path) -> ResultData:
     return {}
 
   try:
-    v = json.loads(data)
+    v = jsonutil.loads(data)
   except json.decoder.JSONDecodeError:
     # old format
     v = {}
@@ -159,14 +170,69 @@ def write_verfile(file: Path, versions: ResultData) -> None:
     # sort and indent to make it friendly to human and git
     'data': dict(sorted(versions.items())),
   }
-  data = json.dumps(
+  data = jsonutil.dumps(
     d,
-    indent = 2,
-    ensure_ascii = False,
+    indent = True,
     default = json_encode,
   ) + '\n'
   safe_overwrite(file, data)
 
+def journal_file(newver: Path) -> Path:
+  '''The journal of a run writing to the ``newver`` file.'''
+  return newver.with_name(newver.name + '.journal')
+
+class Journal:
+  '''Record results as they arrive, so that they survive a crash.
+
+  The journal is a file of JSON lines with ``name`` and ``result``. Every line
+  is written with a single ``write`` call to a file opened for appending, so
+  it can be shared by processes checking in parallel.
+  '''
+  def __init__(self, file: Path, append: bool = False) -> None:
+    flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+    if not append:
+      flags |= os.O_TRUNC
+    self.file = file
+    self.fd = os.open(file, flags, 0o644)
+    if append:
+      # end a line cut off by a crash
+      with open(file, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+          f.seek(size - 1)
+          if f.read(1) != b'\n':
+            os.write(self.fd, b'\n')
+
+  def append(self, name: str, result: RichResult) -> None:
+    line = jsonutil.dumps({
+      'name': name,
+      'result': _rich_result_to_dict(result),
+    }) + '\n'
+    os.write(self.fd, line.encode('utf-8'))
+
+  def close(self) -> None:
+    os.close(self.fd)
+
+  def remove(self) -> None:
+    '''Close and remove the journal, after the results have been written.'''
+    self.close()
+    self.file.unlink()
+
+def read_journal(file: Path) -> ResultData:
+  '''Read results from a journal. A line cut off by a crash is ignored.'''
+  ret = {}
+  try:
+    with open(file, 'rb') as f:
+      for line in f:
+        try:
+          d = jsonutil.loads(line)
+        except ValueError:
+          continue
+        ret[d['name']] = RichResult(**d['result'])
+  except FileNotFoundError:
+    pass
+  return ret
+
 def _rich_result_to_dict(result: RichResult) -> Dict[str, Any]:
   return {
     k: v
@@ -188,6 +254,11 @@ class Options(NamedTuple):
   httplib: Optional[str]
   http_timeout: int
   resolver: Optional[str]
+  host_limits: Dict[str, int]
+  http_cache: Optional[Path]
+  check_interval: Optional[int]
+  retry_policy: RetryPolicy
+  breaker_policy: BreakerPolicy
 
 def load_file(
   file: str, *,
@@ -232,16 +303,48 @@ def load_file(
     httplib = c.get('httplib', None)
     http_timeout = c.get('http_timeout', 20)
     resolver = c.get('resolver', None)
+    host_limits = c.get('host_limits', {})
+
+    http_cache_c = c.get('http_cache', False)
+    if http_cache_c is True:
+      http_cache = get_default_http_cache_dir()
+    elif http_cache_c:
+      http_cache = d / os.path.expandvars(
+        os.path.expanduser(http_cache_c))
+    else:
+      http_cache = None
+
+    check_interval = c.get('check_interval', None)
+
+    default_retry = RetryPolicy()
+    retry_policy = RetryPolicy(
+      backoff = c.get('retry_backoff', default_retry.backoff),
+      max_delay = c.get('retry_backoff_max', default_retry.max_delay),
+      budget = c.get('retry_budget', None),
+    )
+
+    default_breaker = BreakerPolicy()
+    breaker_policy = BreakerPolicy(
+      threshold = c.get('circuit_breaker_threshold', default_breaker.threshold),
+      cooldown = c.get('circuit_breaker_cooldown', default_breaker.cooldown),
+    )
   else:
     max_concurrency = 20
     proxy = None
     httplib = None
     http_timeout = 20
     resolver = None
+    host_limits = {}
+    http_cache = None
+    check_interval = None
+    retry_policy = RetryPolicy()
+    breaker_policy = BreakerPolicy()
 
   return cast(Entries, config), Options(
     ver_files, max_concurrency, proxy, keymanager,
     source_configs, httplib, http_timeout, resolver,
+    host_limits, http_cache, check_interval, retry_policy,
+    breaker_policy,
   )
 
 def setup_httpclient(
@@ -249,11 +352,93 @@ def setup_httpclient(
   httplib: Optional[str] = None,
   http_timeout: int = 20,
   resolver: Optional[str] = None,
+  host_limits: Optional[Dict[str, int]] = None,
+  http_cache: Optional[Path] = None,
+  retry_policy: Optional[RetryPolicy] = None,
+  breaker_policy: Optional[BreakerPolicy] = None,
+  record: Optional[Path] = None,
+  replay: Optional[Path] = None,
+  replay_latency: float = 0,
 ) -> Dispatcher:
-  httplib_ = httplib or httpclient.find_best_httplib()
-  httpclient.setup(httplib_, max_concurrency, http_timeout, resolver)
+  httplib_ = httplib
+  if httplib_ is None and replay is None:
+    httplib_ = httpclient.find_best_httplib()
+  httpclient.setup(
+    httplib_, max_concurrency, http_timeout, resolver,
+    host_limits = host_limits,
+    http_cache = http_cache,
+    retry_policy = retry_policy,
+    breaker_policy = breaker_policy,
+    record = record,
+    replay = replay,
+    replay_latency = replay_latency,
+  )
   return Dispatcher()
 
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def format_time(t: datetime) -> str:
+  return t.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+def parse_time(s: str) -> datetime:
+  return datetime.strptime(s, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+def split_due_entries(
+  entries: Entries,
+  last_results: ResultData,
+  check_interval: Optional[int],
+  now: datetime,
+) -> Tuple[Entries, ResultData]:
+  '''Split out entries that have been checked within their ``check_interval``.
+
+  Returns the entries to check, and the last results of the others.
+  '''
+  due = {}
+  skipped = {}
+  for name, entry in entries.items():
+    interval = entry.get('check_interval', check_interval)
+    r = last_results.get(name)
+    if interval and r is not None and r.last_checked:
+      try:
+        elapsed = (now - parse_time(r.last_checked)).total_seconds()
+      except ValueError:
+        elapsed = None
+      if elapsed is not None and 0 <= elapsed < interval:
+        logger.debug('checked recently, skipped', name=name,
+                     last_checked=r.last_checked)
+        skipped[name] = r
+        continue
+    due[name] = entry
+  return due, skipped
+
+def shard_entries(entries: Entries, index: int, total: int) -> Entries:
+  '''Return the entries in shard ``index`` (0-based) of ``total`` shards.
+
+  Entries are assigned by a hash of their names so that the split is stable
+  between runs. Entries of the ``combiner`` source are kept in the same
+  shard as the entries they combine.
+  '''
+  parent: Dict[str, str] = {}
+  def find(name: str) -> str:
+    while (p := parent.get(name, name)) != name:
+      name = p
+    return name
+
+  for name, entry in entries.items():
+    if entry.get('source') != 'combiner':
+      continue
+    for dep in entry.get('from', []):
+      if dep not in entries:
+        continue
+      a, b = find(name), find(dep)
+      if a != b:
+        parent[max(a, b)] = min(a, b)
+
+  return {
+    name: entry for name, entry in entries.items()
+    if zlib.crc32(find(name).encode()) % total == index
+  }
+
 class Dispatcher:
   def dispatch(
     self,
@@ -264,7 +449,7 @@ class Dispatcher:
     entry_waiter: EntryWaiter,
     tries: int,
     source_configs: Dict[str, Dict[str, Any]],
-  ) -> List[asyncio.Future]:
+  ) -> List[Awaitable[None]]:
     mods: Dict[str, Tuple[types.ModuleType, List]] = {}
     ctx_tries.set(tries)
     ctx_entry_waiter.set(entry_waiter)
@@ -283,8 +468,8 @@ class Dispatcher:
         tasks = mods[source][1]
       tasks.append((name, entry))
 
-    ret = []
-    for mod, tasks in mods.values():
+    ret: List[Awaitable[None]] = []
+    for source, (mod, tasks) in mods.items():
       if hasattr(mod, 'Worker'):
         worker_cls = mod.Worker
       else:
@@ -299,10 +484,28 @@ class Dispatcher:
         func = mod.get_version
         ctx.run(worker.initialize, func)
 
-      ret.append(ctx.run(worker._run_maynot_raise))
+      ret.append(ctx.run(_run_worker, source, worker))
 
     return ret
 
+async def _run_worker(source: str, worker: BaseWorker) -> None:
+  ctx_source.set(source)
+  start = time.monotonic()
+
+  timeout = None
+  if not isinstance(worker, FunctionWorker):
+    # FunctionWorker applies timeouts to entries one by one, while other
+    # workers check their entries together
+    timeout = shortest_timeout(worker.tasks)
+
+  try:
+    await asyncio.wait_for(worker._run_maynot_raise(), timeout)
+  except asyncio.TimeoutError:
+    logger.warning('timed out, cancelled', source=source, timeout=timeout)
+  finally:
+    if (m := ctx_metrics.get()) is not None:
+      m.source(source).worker_seconds = time.monotonic() - start
+
 def substitute_version(
   version: str, conf: Entry,
 ) -> str:
@@ -433,31 +636,79 @@ async def process_result(
   result_q: Queue[RawResult],
   entry_waiter: EntryWaiter,
   verbose: bool = False,
+  skipped: ResultData = {},
+  entries: Optional[Entries] = None,
+  journal: Optional[Journal] = None,
 ) -> Tuple[ResultData, bool]:
-  ret = {}
+  '''Process results from ``result_q`` until cancelled.
+
+  ``skipped`` are the results of entries that are not checked this time; they
+  are passed through as-is. If ``entries`` (those being checked) is given,
+  the ones that got no results (e.g. cancelled at the deadline) are reported
+  as failures. New results are recorded in ``journal`` if given.
+  '''
+  ret = dict(skipped)
+  for name, skipped_r in skipped.items():
+    entry_waiter.set_result(name, skipped_r.version)
   has_failures = False
+  metrics = ctx_metrics.get()
+  seen = set()
+
+  def fail(name: str, conf: Entry, e: Exception) -> None:
+    nonlocal has_failures
+    if metrics is not None:
+      metrics.entry_result(conf.get('source', 'none'), False)
+    entry_waiter.set_exception(name, e)
+    # no versions are returned from "apply_list_options"?
+    logger.error('no-result', name=name, error=repr(e))
+    has_failures = True
+
+  def process(r: RawResult) -> None:
+    seen.add(r.name)
+    try:
+      r1 = _process_result(r)
+    except Exception as e:
+      logger.exception('error processing result', result=r)
+      r1 = e
+    if isinstance(r1, Exception):
+      fail(r.name, r.conf, r1)
+      return
+    if metrics is not None:
+      metrics.entry_result(r.conf.get('source', 'none'), True)
+    check_version_update(oldvers, r.name, r1, verbose)
+    entry_waiter.set_result(r.name, r1.version)
+    ret[r.name] = r2 = dataclasses.replace(
+      r1, last_checked=format_time(datetime.now(timezone.utc)))
+    if journal is not None:
+      journal.append(r.name, r2)
+
   try:
     while True:
-      r = await result_q.get()
-      try:
-        r1 = _process_result(r)
-      except Exception as e:
-        logger.exception('error processing result', result=r)
-        r1 = e
-      if isinstance(r1, Exception):
-        entry_waiter.set_exception(r.name, r1)
-        # no versions are returned from "apply_list_options"?
-        logger.error('no-result', name=r.name, error=repr(r1))
-        has_failures = True
-        continue
-      check_version_update(oldvers, r.name, r1, verbose)
-      entry_waiter.set_result(r.name, r1.version)
-      ret[r.name] = r1
+      process(await result_q.get())
   except asyncio.CancelledError:
+    # results put right before all tasks finished
+    while not result_q.empty():
+      process(result_q.get_nowait())
+    if entries is not None:
+      for name, entry in entries.items():
+        if name not in seen:
+          fail(name, entry, GetVersionError('not finished'))
     return ret, has_failures
 
 async def run_tasks(
-  futures: Sequence[Awaitable[None]]
+  futures: Sequence[Awaitable[None]],
+  deadline: Optional[float] = None,
 ) -> None:
-  for fu in asyncio.as_completed(futures):
-    await fu
+  '''Wait for ``futures``; cancel the unfinished ones after ``deadline`` seconds.'''
+  tasks = [asyncio.ensure_future(fu) for fu in futures]
+  try:
+    for fu in asyncio.as_completed(tasks, timeout=deadline):
+      await fu
+  except asyncio.TimeoutError:
+    logger.warning('deadline reached, cancelling unfinished checks',
+                   deadline=deadline)
+  finally:
+    for task in tasks:
+      task.cancel()
+    # let them handle the cancellation
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -12,6 +12,7 @@ DEFAULT_USER_AGENT = f'lilydjwg/nvchecker {__version__}'
 
 if TYPE_CHECKING:
   from .util import EntryWaiter
+  from .metrics import Metrics, EntryMetrics
 
 tries = ContextVar('tries', default=1)
 proxy: ContextVar[Optional[str]] = ContextVar('proxy', default=None)
@@ -19,3 +20,8 @@ user_agent = ContextVar('user_agent', default=DEFAULT_USER_AGENT)
 httptoken: ContextVar[Optional[str]] = ContextVar('httptoken', default=None)
 entry_waiter: ContextVar[EntryWaiter] = ContextVar('entry_waiter')
 verify_cert = ContextVar('verify_cert', default=True)
+metrics: ContextVar[Optional[Metrics]] = ContextVar('metrics', default=None)
+# the source being checked, and the entry if checked by FunctionWorker
+source: ContextVar[Optional[str]] = ContextVar('source', default=None)
+entry_metrics: ContextVar[Optional[EntryMetrics]] = ContextVar(
+  'entry_metrics', default=None)
@@ -1,9 +1,11 @@
 # MIT licensed
 # Copyright (c) 2013-2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
-from typing import Optional
+from typing import Optional, Dict
+from pathlib import Path
 
-from .base import TemporaryError, HTTPError
+from .base import TemporaryError, HTTPError, RetryPolicy
+from .circuitbreaker import BreakerPolicy
 
 class Proxy:
   _obj = None
@@ -24,15 +26,38 @@ def setup(
   concurrency: int = 20,
   timeout: int = 20,
   resolver: Optional[str] = None,
+  host_limits: Optional[Dict[str, int]] = None,
+  http_cache: Optional[Path] = None,
+  retry_policy: Optional[RetryPolicy] = None,
+  breaker_policy: Optional[BreakerPolicy] = None,
+  record: Optional[Path] = None,
+  replay: Optional[Path] = None,
+  replay_latency: float = 0,
 ) -> None:
-  if which is None:
-    which = find_best_httplib()
+  if replay is not None:
+    from .cassette import ReplaySession
+    session.set_obj(ReplaySession(replay, replay_latency))
+  else:
+    if which is None:
+      which = find_best_httplib()
 
-  m = __import__(
-    '%s_httpclient' % which, globals(), locals(), level=1)
+    m = __import__(
+      '%s_httpclient' % which, globals(), locals(), level=1)
+
+    if record is not None:
+      from .cassette import RecordingSession
+      session.set_obj(RecordingSession(m.session, record))
+    else:
+      session.set_obj(m.session)
 
-  session.set_obj(m.session)
   session.setup(concurrency, timeout, resolver)
+  session.set_host_limits(host_limits or {})
+  if record is not None or replay is not None:
+    # cached responses would make recordings depend on the cache
+    http_cache = None
+  session.set_http_cache(http_cache)
+  session.set_retry_policy(retry_policy or RetryPolicy())
+  session.set_breaker_policy(breaker_policy or BreakerPolicy())
 
 def find_best_httplib() -> str:
   try:
@@ -2,17 +2,40 @@
 # Copyright (c) 2013-2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
 import asyncio
-from typing import Optional, Dict
+import contextlib
+import socket
+from typing import Optional, Dict, List, Any, AsyncIterator
 
 import structlog
 import aiohttp
+from aiohttp.abc import AbstractResolver
 
-from .base import BaseSession, TemporaryError, Response, HTTPError
+from .base import (
+  BaseSession, TemporaryError, Response, HTTPError, StreamResponse,
+  STREAM_CHUNK_SIZE,
+)
+from .resolver import CachingResolver, make_resolver
 
 __all__ = ['session']
 
 logger = structlog.get_logger(logger_name=__name__)
 
+class AiohttpResolver(AbstractResolver):
+  def __init__(self, resolver: CachingResolver) -> None:
+    self.resolver = resolver
+
+  async def resolve( # type: ignore[override]
+    self, host: str, port: int = 0, family: int = socket.AF_INET,
+  ) -> List[Dict[str, Any]]:
+    addrs = await self.resolver.resolve(host, family)
+    return [{
+      'hostname': host, 'host': ip, 'port': port,
+      'family': fam, 'proto': 0, 'flags': socket.AI_NUMERICHOST,
+    } for fam, ip in addrs]
+
+  async def close(self) -> None:
+    pass
+
 class AiohttpSession(BaseSession):
   session = None
 
@@ -24,6 +47,50 @@ class AiohttpSession(BaseSession):
   ) -> None:
     self._concurrency = concurrency
     self._timeout = timeout
+    self._resolver = make_resolver(resolver)
+
+  def _get_session(self) -> aiohttp.ClientSession:
+    if self.session is None:
+      # need to create in async context
+      if self._resolver is not None:
+        connector = aiohttp.TCPConnector(
+          limit = self._concurrency,
+          resolver = AiohttpResolver(self._resolver),
+          use_dns_cache = False,
+        )
+      else:
+        connector = aiohttp.TCPConnector(limit=self._concurrency)
+      self.session = aiohttp.ClientSession(
+        connector = connector,
+        timeout = aiohttp.ClientTimeout(total=self._timeout),
+        trust_env = True,
+      )
+    return self.session
+
+  async def _send(
+    self, url: str, *,
+    method: str,
+    kwargs: Dict[str, Any],
+  ) -> aiohttp.ClientResponse:
+    session = self._get_session()
+    try:
+      logger.debug('send request', method=method, url=url, kwargs=kwargs)
+      res = await session.request(
+        method, url, **kwargs)
+    except (
+      asyncio.TimeoutError, aiohttp.ClientConnectorError,
+    ) as e:
+      raise TemporaryError(599, repr(e), None)
+
+    err_cls: Optional[type] = None
+    if res.status >= 500:
+      err_cls = TemporaryError
+    elif res.status >= 400:
+      err_cls = HTTPError
+    if err_cls is not None:
+      raise err_cls(res.status, res.reason, res)
+
+    return res
 
   async def request_impl(
     self, url: str, *,
@@ -36,15 +103,7 @@ class AiohttpSession(BaseSession):
     body = None,
     verify_cert: bool = True,
   ) -> Response:
-    if self.session is None:
-      # need to create in async context
-      self.session = aiohttp.ClientSession(
-        connector = aiohttp.TCPConnector(limit=self._concurrency),
-        timeout = aiohttp.ClientTimeout(total=self._timeout),
-        trust_env = True,
-      )
-
-    kwargs = {
+    kwargs: Dict[str, Any] = {
       'headers': headers,
       'params': params,
       'allow_redirects': follow_redirects,
@@ -63,24 +122,46 @@ class AiohttpSession(BaseSession):
     elif json is not None:
       kwargs['json'] = json
 
-    try:
-      logger.debug('send request', method=method, url=url, kwargs=kwargs)
-      res = await self.session.request(
-        method, url, **kwargs)
-    except (
-      asyncio.TimeoutError, aiohttp.ClientConnectorError,
-    ) as e:
-      raise TemporaryError(599, repr(e), None)
+    res = await self._send(url, method=method, kwargs=kwargs)
+    body = await res.content.read()
+    return Response(res.headers, body, res.status)
 
-    err_cls: Optional[type] = None
-    if res.status >= 500:
-      err_cls = TemporaryError
-    elif res.status >= 400:
-      err_cls = HTTPError
-    if err_cls is not None:
-      raise err_cls(res.status, res.reason, res)
+  @contextlib.asynccontextmanager
+  async def stream_impl(
+    self, url: str, *,
+    method: str,
+    proxy: Optional[str] = None,
+    headers: Dict[str, str] = {},
+    follow_redirects: bool = True,
+    params = (),
+    verify_cert: bool = True,
+  ) -> AsyncIterator[StreamResponse]:
+    kwargs: Dict[str, Any] = {
+      'headers': headers,
+      'params': params,
+      'allow_redirects': follow_redirects,
+      # big files may take longer; only limit the time between reads
+      'timeout': aiohttp.ClientTimeout(
+        sock_connect=self._timeout, sock_read=self._timeout),
+    }
+    if not verify_cert:
+      kwargs['ssl'] = False
+    if proxy is not None:
+      kwargs['proxy'] = proxy
 
-    body = await res.content.read()
-    return Response(res.headers, body)
+    res = await self._send(url, method=method, kwargs=kwargs)
+    try:
+      yield StreamResponse(res.headers, res.status, self._iter_chunks(res))
+    finally:
+      res.release()
+
+  async def _iter_chunks(
+    self, res: aiohttp.ClientResponse,
+  ) -> AsyncIterator[bytes]:
+    try:
+      async for chunk in res.content.iter_chunked(STREAM_CHUNK_SIZE):
+        yield chunk
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+      raise TemporaryError(599, repr(e), None)
 
 session = AiohttpSession()
@@ -1,14 +1,34 @@
 # MIT licensed
 # Copyright (c) 2019-2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
+import asyncio
+import contextlib
+import functools
+import random
+import time
+import email.utils
 import structlog
-from typing import Optional, Dict, Mapping
-import json as _json
+from typing import (
+  Optional, Dict, Mapping, AsyncIterator, Iterator, Hashable, Callable,
+  Awaitable, NamedTuple, AsyncContextManager,
+)
+from urllib.parse import urlsplit
+from pathlib import Path
 
 from ..ctxvars import tries, proxy, user_agent, httptoken, verify_cert
+from .. import jsonutil
+from ..metrics import RequestTimer, measure_request, record_retry
+from .httpcache import HTTPCache
+from .circuitbreaker import BreakerPolicy, CircuitBreaker
 
 logger = structlog.get_logger(logger_name=__name__)
 
+# the max total size of finished responses kept for later identical
+# requests; the least recently used ones are dropped first
+MAX_SHARED_SIZE = 64 * 1024 * 1024
+# preferred size of chunks from session.stream
+STREAM_CHUNK_SIZE = 64 * 1024
+
 class Response:
   '''The response of an HTTP request.
 
@@ -17,21 +37,85 @@ class Response:
 
   .. py:attribute:: headers
      :type: Mapping[str, str]
+
+  .. py:attribute:: status
+     :type: int
   '''
   def __init__(
     self,
     headers: Mapping[str, str],
     body: bytes,
+    status: int = 200,
   ) -> None:
     self.headers = headers
     self.body = body
+    self.status = status
 
   def json(self):
     '''Convert response content to JSON.'''
-    return _json.loads(self.body.decode('utf-8'))
+    return jsonutil.loads(self.body)
+
+class RetryPolicy(NamedTuple):
+  '''How to wait between retries of failed requests.'''
+  # the max delay before the first retry; doubled for each retry after it
+  backoff: float = 1
+  # the max delay between retries, also the max Retry-After to wait for
+  max_delay: float = 60
+  # the max number of retries in a run, None for unlimited
+  budget: Optional[int] = None
+
+def parse_retry_after(value: str) -> Optional[float]:
+  '''Parse a ``Retry-After`` header into seconds to wait.'''
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  try:
+    t = email.utils.parsedate_to_datetime(value)
+  except (TypeError, ValueError):
+    return None
+  return max(0.0, t.timestamp() - time.time())
+
+class StreamResponse:
+  '''The response of an HTTP request whose body is read in chunks.
+
+  Iterate over it asynchronously to get the chunks (as bytes).
+
+  .. py:attribute:: headers
+     :type: Mapping[str, str]
+
+  .. py:attribute:: status
+     :type: int
+  '''
+  def __init__(
+    self,
+    headers: Mapping[str, str],
+    status: int,
+    chunks: AsyncIterator[bytes],
+  ) -> None:
+    self.headers = headers
+    self.status = status
+    self._chunks = chunks
+
+  def __aiter__(self) -> AsyncIterator[bytes]:
+    return self._chunks
 
 class BaseSession:
   '''The base class for different HTTP backend.'''
+  host_limits: Dict[str, int] = {}
+  _host_sems: Dict[str, asyncio.Semaphore] = {}
+  http_cache: Optional[HTTPCache] = None
+  # responses shared between identical requests; see clear_response_cache
+  _responses: Dict[Hashable, asyncio.Future] = {}
+  # body sizes of the finished ones, least recently used first
+  _response_sizes: Dict[Hashable, int] = {}
+  _responses_size = 0
+  _responses_loop: Optional[asyncio.AbstractEventLoop] = None
+  retry_policy = RetryPolicy()
+  _retries = 0
+  breaker_policy = BreakerPolicy()
+  _breakers: Dict[str, CircuitBreaker] = {}
+
   def setup(
     self,
     concurrency: int = 20,
@@ -40,6 +124,148 @@ class BaseSession:
   ) -> None:
     pass
 
+  def set_host_limits(self, limits: Dict[str, int]) -> None:
+    '''Limit the number of concurrent requests to some hosts.
+
+    ``limits`` maps host names to the max number of concurrent requests.
+    '''
+    self.host_limits = {k.lower(): v for k, v in limits.items()}
+    self._host_sems = {}
+
+  def set_http_cache(self, directory: Optional[Path]) -> None:
+    '''Store responses in ``directory`` and revalidate them on later requests.
+
+    Pass ``None`` to disable the cache.
+    '''
+    if directory is None:
+      self.http_cache = None
+    else:
+      self.http_cache = HTTPCache(directory)
+
+  def set_retry_policy(self, policy: RetryPolicy) -> None:
+    self.retry_policy = policy
+
+  def set_breaker_policy(self, policy: BreakerPolicy) -> None:
+    self.breaker_policy = policy
+    self._breakers = {}
+
+  def begin_run(self) -> None:
+    '''Reset per-run states: shared responses and the retry budget.'''
+    self.clear_response_cache()
+    self._retries = 0
+
+  def end_run(self) -> None:
+    '''Called when a run has finished.'''
+
+  def clear_response_cache(self) -> None:
+    '''Forget the responses shared between identical requests.
+
+    Identical ``GET`` and ``HEAD`` requests made in the same context (tries,
+    proxy, headers, etc) are sent only once, and their response is reused.
+    Finished responses are kept up to ``MAX_SHARED_SIZE`` bytes in total.
+    This is called at the start of every run.
+    '''
+    self._responses = {}
+    self._response_sizes = {}
+    self._responses_size = 0
+    self._responses_loop = None
+
+  async def _shared_request(
+    self, key: Hashable,
+    func: Callable[[], Awaitable[Response]],
+  ) -> Response:
+    loop = asyncio.get_running_loop()
+    if self._responses_loop is not loop:
+      # futures can't be shared across event loops
+      self.clear_response_cache()
+      self._responses_loop = loop
+
+    fu = self._responses.get(key)
+    if fu is None:
+      fu = asyncio.ensure_future(func())
+      self._responses[key] = fu
+      fu.add_done_callback(functools.partial(self._response_done, key))
+    elif key in self._response_sizes:
+      # mark as recently used
+      self._response_sizes[key] = self._response_sizes.pop(key)
+
+    # don't let a cancelled waiter cancel the request for others
+    return await asyncio.shield(fu)
+
+  def _response_done(self, key: Hashable, fu: asyncio.Future) -> None:
+    if self._responses.get(key) is not fu:
+      # cleared meanwhile
+      return
+    if fu.cancelled() or fu.exception() is not None:
+      # failed requests will be tried again
+      del self._responses[key]
+      return
+
+    size = len(fu.result().body)
+    self._response_sizes[key] = size
+    self._responses_size += size
+    while self._responses_size > MAX_SHARED_SIZE:
+      old = next(iter(self._response_sizes))
+      self._responses_size -= self._response_sizes.pop(old)
+      del self._responses[old]
+
+  @contextlib.contextmanager
+  def _circuit(self, url: str) -> Iterator[None]:
+    '''Fail fast if ``host`` has been unreachable; track the result otherwise.'''
+    host = urlsplit(url).hostname
+    if not host or not self.breaker_policy.threshold:
+      yield
+      return
+
+    breaker = self._breakers.get(host)
+    if breaker is None:
+      breaker = self._breakers[host] = CircuitBreaker(self.breaker_policy)
+    if not breaker.allow():
+      # import here to avoid circular imports
+      from ..util import GetVersionError
+      raise GetVersionError(
+        'host is unreachable, not trying', host=host,
+        failures=breaker.failures,
+      )
+
+    try:
+      yield
+    except TemporaryError as e:
+      if e.code == 599:
+        if breaker.failed():
+          logger.warning('host is unreachable, failing fast', host=host,
+                         cooldown=self.breaker_policy.cooldown)
+      else:
+        # the host replied
+        breaker.succeeded()
+      raise
+    except HTTPError:
+      breaker.succeeded()
+      raise
+    except BaseException:
+      breaker.cancelled()
+      raise
+    else:
+      if breaker.is_open:
+        logger.info('host is reachable again', host=host)
+      breaker.succeeded()
+
+  @contextlib.asynccontextmanager
+  async def _host_slot(self, url: str) -> AsyncIterator[None]:
+    host = urlsplit(url).hostname
+    limit = self.host_limits.get(host) if host else None
+    if not limit:
+      yield
+      return
+
+    assert host is not None
+    sem = self._host_sems.get(host)
+    if sem is None:
+      # created lazily so that it's bound to the running event loop
+      sem = self._host_sems[host] = asyncio.Semaphore(limit)
+    async with sem:
+      yield
+
   async def head(self, *args, **kwargs):
     '''Shortcut for ``HEAD`` request.'''
     return await self.request(
@@ -55,6 +281,116 @@ class BaseSession:
     return await self.request(
       method='POST', *args, **kwargs)
 
+  @contextlib.asynccontextmanager
+  async def stream(
+    self, url: str, *,
+    method: str = 'GET',
+    headers: Dict[str, str] = {},
+    follow_redirects: bool = True,
+    params = (),
+  ) -> AsyncIterator[StreamResponse]:
+    '''Send a request and read the response body in chunks as it arrives.
+
+    Use like this::
+
+      async with session.stream(url) as res:
+        async for chunk in res:
+          ...
+
+    Errors are retried (according to ``tries``) only before the body is
+    being read. Like other ``GET`` requests, streamed ones are revalidated
+    with ``http_cache``; their bodies are stored if read to the end. They
+    aren't shared between identical requests.
+    '''
+    headers = self._prepare_headers(headers)
+    http_cache = self.http_cache if method == 'GET' else None
+    async with contextlib.AsyncExitStack() as stack:
+      cached = None
+      if http_cache is not None:
+        cache_key = http_cache.key(url, params, headers)
+        cached = await http_cache.load_stream(cache_key)
+        if cached is not None:
+          stack.callback(cached.close)
+          for k, v in cached.validators().items():
+            headers.setdefault(k, v)
+
+      res = await stack.enter_async_context(self._stream_with_retries(
+        url,
+        method = method,
+        headers = headers,
+        follow_redirects = follow_redirects,
+        params = params,
+        proxy = proxy.get() or None,
+        verify_cert = verify_cert.get(),
+      ))
+
+      if http_cache is not None:
+        if cached is not None and res.status == 304:
+          logger.debug('not modified, using cached response', url=url)
+          res = StreamResponse(
+            cached.merged_headers(res.headers), 200,
+            cached.chunks(STREAM_CHUNK_SIZE),
+          )
+        elif res.status == 200:
+          chunks = http_cache.store_stream(
+            cache_key, url, res.headers, res.__aiter__())
+          stack.push_async_callback(chunks.aclose)
+          res = StreamResponse(res.headers, res.status, chunks)
+      yield res
+
+  @contextlib.asynccontextmanager
+  async def _stream_with_retries(
+    self, url: str, **kwargs,
+  ) -> AsyncIterator[StreamResponse]:
+    t = tries.get()
+    for i in range(1, t+1):
+      stack = contextlib.AsyncExitStack()
+      timer = RequestTimer(url)
+      try:
+        await stack.enter_async_context(self._host_slot(url))
+        timer.start()
+        with self._circuit(url):
+          res = await stack.enter_async_context(
+            self.stream_impl(url, **kwargs))
+      except (TemporaryError, HTTPError) as e:
+        timer.finish(error=True)
+        await stack.aclose()
+        delay = self._should_retry(i, t, e)
+        if delay is None:
+          raise
+        record_retry(url)
+        logger.warning('temporary error, retrying',
+                       tries = i, delay = round(delay, 2), exc_info = e)
+        await asyncio.sleep(delay)
+        continue
+      except Exception:
+        timer.finish(error=True)
+        await stack.aclose()
+        raise
+      except BaseException:
+        await stack.aclose()
+        raise
+
+      if timer.enabled:
+        res = StreamResponse(res.headers, res.status, timer.count(res))
+      async with stack:
+        try:
+          yield res
+        except BaseHTTPError:
+          timer.finish(error=True)
+          raise
+        finally:
+          timer.finish()
+      return
+
+  def _prepare_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+    headers = headers.copy()
+    headers.setdefault('User-Agent', user_agent.get())
+    httpt = httptoken.get()
+    if httpt is not None:
+      headers.setdefault('Authorization', httpt)
+    return headers
+
   async def request(
     self, url: str, *,
     method: str,
@@ -63,41 +399,152 @@ class BaseSession:
     params = (),
     json = None,
     body = None,
+    retry_rate_limited: bool = True,
   ) -> Response:
+    '''Send a request.
+
+    HTTP 429 errors are retried like temporary ones (according to
+    ``tries``), unless ``retry_rate_limited`` is false, e.g. for sources
+    that handle rate limits themselves.
+    '''
     t = tries.get()
     p = proxy.get()
-    ua = user_agent.get()
-    httpt = httptoken.get()
     verify = verify_cert.get()
+    headers = self._prepare_headers(headers)
 
-    headers = headers.copy()
-    headers.setdefault('User-Agent', ua)
-    if httpt is not None:
-      headers.setdefault('Authorization', httpt)
+    do_request = functools.partial(
+      self._request_maybe_cached,
+      url,
+      method = method,
+      headers = headers,
+      params = params,
+      follow_redirects = follow_redirects,
+      json = json,
+      body = body,
+      proxy = p or None,
+      verify_cert = verify,
+      tries = t,
+      retry_rate_limited = retry_rate_limited,
+    )
 
-    for i in range(1, t+1):
+    if method in ('GET', 'HEAD') and json is None and body is None:
+      if isinstance(params, dict):
+        params_key = tuple(params.items())
+      else:
+        params_key = tuple(tuple(x) for x in params)
+      key = (
+        method, url, params_key, tuple(sorted(headers.items())),
+        follow_redirects, p, verify, t, retry_rate_limited,
+      )
       try:
-        return await self.request_impl(
-          url,
-          method = method,
-          headers = headers,
-          params = params,
-          follow_redirects = follow_redirects,
-          json = json,
-          body = body,
-          proxy = p or None,
-          verify_cert = verify,
+        hash(key)
+      except TypeError:
+        pass
+      else:
+        return await self._shared_request(key, do_request)
+
+    return await do_request()
+
+  async def _request_maybe_cached(
+    self, url: str, *,
+    method: str,
+    headers: Dict[str, str],
+    params,
+    json,
+    body,
+    tries: int,
+    **kwargs,
+  ) -> Response:
+    http_cache = self.http_cache if method == 'GET' else None
+    if http_cache is not None:
+      cache_key = http_cache.key(url, params, headers)
+      cached = await http_cache.load(cache_key)
+      if cached is not None:
+        for k, v in cached.validators().items():
+          headers.setdefault(k, v)
+
+    res = await self._request_with_retries(
+      url,
+      method = method,
+      headers = headers,
+      params = params,
+      json = json,
+      body = body,
+      tries = tries,
+      **kwargs,
+    )
+
+    if http_cache is not None:
+      if cached is not None and res.status == 304:
+        logger.debug('not modified, using cached response', url=url)
+        return Response(
+          cached.merged_headers(res.headers), cached.body, 200,
         )
-      except TemporaryError as e:
-        if i == t:
+      elif res.status == 200:
+        await http_cache.store(cache_key, url, res.headers, res.body)
+
+    return res
+
+  async def _request_with_retries(
+    self, url: str, *,
+    tries: int,
+    retry_rate_limited: bool,
+    **kwargs,
+  ) -> Response:
+    t = tries
+    for i in range(1, t+1):
+      try:
+        async with self._host_slot(url):
+          with measure_request(url) as timer, self._circuit(url):
+            res = await self.request_impl(url, **kwargs)
+            timer.bytes = len(res.body)
+            return res
+      except (TemporaryError, HTTPError) as e:
+        delay = self._should_retry(i, t, e, retry_rate_limited)
+        if delay is None:
           raise
-        else:
-          logger.warning('temporary error, retrying',
-                         tries = i, exc_info = e)
-          continue
+        record_retry(url)
+        logger.warning('temporary error, retrying',
+                       tries = i, delay = round(delay, 2), exc_info = e)
+        await asyncio.sleep(delay)
 
     raise Exception('should not reach')
 
+  def _should_retry(
+    self, i: int, tries: int, e: 'BaseHTTPError',
+    retry_rate_limited: bool = True,
+  ) -> Optional[float]:
+    '''Return the delay before retrying the ``i``-th try, or None to give up.'''
+    if isinstance(e, HTTPError) and (e.code != 429 or not retry_rate_limited):
+      return None
+    if i == tries:
+      return None
+    return self._retry_delay(i, e)
+
+  def _retry_delay(self, i: int, e: 'BaseHTTPError') -> Optional[float]:
+    '''How long to wait before retry ``i``, or None not to retry.'''
+    policy = self.retry_policy
+    retry_after = None
+    if e.response is not None:
+      value = e.response.headers.get('Retry-After')
+      if value:
+        retry_after = parse_retry_after(value)
+    if retry_after is not None and retry_after > policy.max_delay:
+      logger.debug('Retry-After too long, not retrying',
+                   retry_after=retry_after)
+      return None
+
+    if policy.budget is not None:
+      if self._retries >= policy.budget:
+        logger.debug('retry budget used up, not retrying')
+        return None
+    self._retries += 1
+
+    if retry_after is not None:
+      return retry_after
+    # exponential backoff with full jitter
+    return random.uniform(0, min(policy.max_delay, policy.backoff * 2 ** (i-1)))
+
   async def request_impl(
     self, url: str, *,
     method: str,
@@ -112,6 +559,18 @@ class BaseSession:
     ''':meta private:'''
     raise NotImplementedError
 
+  def stream_impl(
+    self, url: str, *,
+    method: str,
+    proxy: Optional[str] = None,
+    headers: Dict[str, str] = {},
+    follow_redirects: bool = True,
+    params = (),
+    verify_cert: bool = True,
+  ) -> AsyncContextManager[StreamResponse]:
+    ''':meta private:'''
+    raise NotImplementedError
+
 class BaseHTTPError(Exception):
   def __init__(self, code, message, response):
     self.code = code
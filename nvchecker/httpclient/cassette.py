@@ -0,0 +1,290 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+Record HTTP responses to a directory, and serve them back later without
+network access, e.g. for benchmarking or debugging.
+
+Each run is saved as a gzipped file of JSON lines in the directory. When
+replaying, all files are loaded; a request recorded in a later file
+overrides the same request in earlier ones.
+'''
+
+import asyncio
+import base64
+import contextlib
+import gzip
+import hashlib
+import json as _json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+from typing import (
+  Optional, Dict, Any, List, Tuple, AsyncIterator, Type, Mapping, cast,
+)
+
+import structlog
+
+from .base import (
+  BaseSession, BaseHTTPError, TemporaryError, HTTPError,
+  Response, StreamResponse, STREAM_CHUNK_SIZE,
+)
+from .httpcache import make_headers
+from .. import jsonutil
+
+logger = structlog.get_logger(logger_name=__name__)
+
+Key = Tuple[str, str, Optional[str], bool]
+
+ERROR_CLASSES: Dict[str, Type[BaseHTTPError]] = {
+  'TemporaryError': TemporaryError,
+  'HTTPError': HTTPError,
+}
+
+def request_key(
+  url: str, *,
+  method: str,
+  params = (),
+  json = None,
+  body = None,
+  stream: bool = False,
+) -> Key:
+  '''The key to match a request with a recorded one.
+
+  Request headers are ignored, since they may contain tokens.
+  '''
+  if params:
+    url += ('&' if '?' in url else '?') + urlencode(params)
+
+  data: Optional[str]
+  if json is not None:
+    data = _json.dumps(json, sort_keys=True)
+  elif body is not None:
+    data = body if isinstance(body, str) else repr(body)
+  else:
+    data = None
+  if data is not None:
+    data = hashlib.sha256(data.encode()).hexdigest()
+
+  # a partially read stream can't be used for a full request
+  return method, url, data, stream
+
+def _headers_items(response: Any) -> Optional[List[Tuple[str, str]]]:
+  headers = getattr(response, 'headers', None)
+  if headers is None:
+    return None
+  return [(k, v) for k, v in headers.items()]
+
+def _encode_body(record: Dict[str, Any], body: bytes) -> None:
+  try:
+    record['text'] = body.decode('utf-8')
+  except UnicodeDecodeError:
+    record['base64'] = base64.b64encode(body).decode('ascii')
+
+def _decode_body(record: Dict[str, Any]) -> bytes:
+  if 'text' in record:
+    return record['text'].encode('utf-8')
+  elif 'base64' in record:
+    return base64.b64decode(record['base64'])
+  else:
+    return b''
+
+class RecordingSession(BaseSession):
+  '''Send requests with another session and record the responses.'''
+  def __init__(self, inner: BaseSession, directory: Path) -> None:
+    self.inner = inner
+    self.directory = directory
+    self._records: List[Dict[str, Any]] = []
+
+  def setup(
+    self,
+    concurrency: int = 20,
+    timeout: int = 20,
+    resolver: Optional[str] = None,
+  ) -> None:
+    self.inner.setup(concurrency, timeout, resolver)
+
+  def _record(
+    self, key: Key, *,
+    status: Optional[int] = None,
+    headers: Optional[List[Tuple[str, str]]] = None,
+    body: Optional[bytes] = None,
+    error: Optional[BaseHTTPError] = None,
+  ) -> None:
+    method, url, data, stream = key
+    record: Dict[str, Any] = {
+      'method': method, 'url': url, 'data': data, 'stream': stream,
+    }
+    if error is not None:
+      record['error'] = type(error).__name__
+      record['message'] = str(error.message)
+      status = error.code
+      if error.response is not None:
+        headers = _headers_items(error.response)
+    record['status'] = status
+    if headers is not None:
+      record['headers'] = headers
+    if body is not None:
+      _encode_body(record, body)
+    self._records.append(record)
+
+  async def request_impl(
+    self, url: str, *,
+    method: str,
+    params = (),
+    json = None,
+    body = None,
+    **kwargs,
+  ) -> Response:
+    key = request_key(
+      url, method=method, params=params, json=json, body=body)
+    try:
+      res = await self.inner.request_impl(
+        url, method=method, params=params, json=json, body=body, **kwargs)
+    except BaseHTTPError as e:
+      self._record(key, error=e)
+      raise
+
+    self._record(
+      key, status=res.status,
+      headers=_headers_items(res), body=res.body,
+    )
+    return res
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(
+    self, url: str, *,
+    method: str,
+    params = (),
+    **kwargs,
+  ) -> AsyncIterator[StreamResponse]:
+    key = request_key(url, method=method, params=params, stream=True)
+    async with contextlib.AsyncExitStack() as stack:
+      try:
+        res = await stack.enter_async_context(self.inner.stream_impl(
+          url, method=method, params=params, **kwargs))
+      except BaseHTTPError as e:
+        self._record(key, error=e)
+        raise
+
+      body = bytearray()
+
+      async def chunks() -> AsyncIterator[bytes]:
+        async for chunk in res:
+          body.extend(chunk)
+          yield chunk
+
+      try:
+        yield StreamResponse(res.headers, res.status, chunks())
+      finally:
+        # only the part that has been read
+        self._record(
+          key, status=res.status,
+          headers=_headers_items(res), body=bytes(body),
+        )
+
+  def end_run(self) -> None:
+    super().end_run()
+    if not self._records:
+      return
+
+    records, self._records = self._records, []
+    self.directory.mkdir(parents=True, exist_ok=True)
+    name = f'{time.time_ns()}-{os.getpid()}.jsonl.gz'
+    path = self.directory / name
+    tmp = path.with_name(name + '.tmp')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+      for r in records:
+        f.write(jsonutil.dumps(r))
+        f.write('\n')
+    os.replace(tmp, path)
+    logger.debug('responses recorded', count=len(records), file=str(path))
+
+class ReplaySession(BaseSession):
+  '''Serve recorded responses instead of sending requests.
+
+  If the same request was recorded several times in a run (e.g. when
+  retrying), the responses are served in order, then the last one
+  repeatedly.
+  '''
+  def __init__(self, directory: Path, latency: float = 0) -> None:
+    self.latency = latency
+    self._records: Dict[Key, List[Dict[str, Any]]] = {}
+    self._served: Dict[Key, int] = {}
+    self._load(directory)
+
+  def _load(self, directory: Path) -> None:
+    for path in sorted(directory.glob('*.jsonl.gz')):
+      recorded: Dict[Key, List[Dict[str, Any]]] = {}
+      with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+          r = jsonutil.loads(line)
+          key = r['method'], r['url'], r['data'], r['stream']
+          recorded.setdefault(key, []).append(r)
+      self._records.update(recorded)
+    logger.debug('responses loaded', count=len(self._records))
+
+  def setup(
+    self,
+    concurrency: int = 20,
+    timeout: int = 20,
+    resolver: Optional[str] = None,
+  ) -> None:
+    pass
+
+  def begin_run(self) -> None:
+    super().begin_run()
+    self._served.clear()
+
+  async def _replay(self, key: Key) -> Tuple[int, Any, bytes]:
+    records = self._records.get(key)
+    if not records:
+      from ..util import GetVersionError
+      raise GetVersionError('request not recorded', method=key[0], url=key[1])
+
+    i = self._served.get(key, 0)
+    self._served[key] = i + 1
+    r = records[min(i, len(records) - 1)]
+
+    if self.latency:
+      await asyncio.sleep(self.latency)
+
+    status = r['status']
+    headers = cast(Mapping[str, str], make_headers(r.get('headers') or []))
+    body = _decode_body(r)
+    if 'error' in r:
+      response = None
+      if 'headers' in r:
+        response = Response(headers, body, status)
+      raise ERROR_CLASSES[r['error']](status, r['message'], response)
+    return status, headers, body
+
+  async def request_impl(
+    self, url: str, *,
+    method: str,
+    params = (),
+    json = None,
+    body = None,
+    **kwargs,
+  ) -> Response:
+    key = request_key(
+      url, method=method, params=params, json=json, body=body)
+    status, headers, res_body = await self._replay(key)
+    return Response(headers, res_body, status)
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(
+    self, url: str, *,
+    method: str,
+    params = (),
+    **kwargs,
+  ) -> AsyncIterator[StreamResponse]:
+    key = request_key(url, method=method, params=params, stream=True)
+    status, headers, body = await self._replay(key)
+
+    async def chunks() -> AsyncIterator[bytes]:
+      for i in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[i:i+STREAM_CHUNK_SIZE]
+
+    yield StreamResponse(headers, status, chunks())
@@ -0,0 +1,63 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+Per-host circuit breakers. After some consecutive connection failures to a
+host, further requests to it fail immediately for a while. Then a single
+request is let through to probe whether the host is back.
+'''
+
+import time
+from typing import NamedTuple, Optional
+
+class BreakerPolicy(NamedTuple):
+  '''When to stop sending requests to an unreachable host.'''
+  # consecutive connection failures or timeouts to open the circuit; 0 to disable
+  threshold: int = 5
+  # seconds to fail fast before probing the host again
+  cooldown: float = 60
+
+class CircuitBreaker:
+  def __init__(self, policy: BreakerPolicy) -> None:
+    self.policy = policy
+    self.failures = 0
+    self.opened_at: Optional[float] = None
+    self.probing = False
+
+  @property
+  def is_open(self) -> bool:
+    return self.opened_at is not None
+
+  def allow(self) -> bool:
+    '''Whether a request may be sent now.'''
+    if self.opened_at is None:
+      return True
+    if self.probing:
+      return False
+    if time.monotonic() - self.opened_at >= self.policy.cooldown:
+      # half-open: let one request through
+      self.probing = True
+      return True
+    return False
+
+  def succeeded(self) -> None:
+    self.failures = 0
+    self.opened_at = None
+    self.probing = False
+
+  def failed(self) -> bool:
+    '''Record a connection failure. Return whether the circuit has just opened.'''
+    self.failures += 1
+    if self.probing:
+      # the probe failed; wait for another cooldown
+      self.opened_at = time.monotonic()
+      self.probing = False
+      return False
+    if self.opened_at is None and self.failures >= self.policy.threshold:
+      self.opened_at = time.monotonic()
+      return True
+    return False
+
+  def cancelled(self) -> None:
+    '''The request ended without telling whether the host is reachable.'''
+    self.probing = False
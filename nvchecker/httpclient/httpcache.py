@@ -0,0 +1,275 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+A persistent HTTP response cache. Responses carrying an ``ETag`` or
+``Last-Modified`` header are stored on disk, and are revalidated with a
+conditional request the next time the same request is made.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import os
+import json
+import hashlib
+import tempfile
+from email.message import Message
+from pathlib import Path
+from typing import (
+  Optional, Dict, Mapping, Any, Tuple, List, BinaryIO, AsyncIterator,
+  AsyncGenerator, cast,
+)
+
+import structlog
+
+logger = structlog.get_logger(logger_name=__name__)
+
+# Request headers that may differ between runs without changing the response.
+# Authorization is kept (only hashed, like the rest of the key), so that a
+# response is never served to requests without the credential that fetched it.
+IGNORED_HEADERS = {'user-agent'}
+# bigger streamed responses aren't stored
+MAX_STREAM_SIZE = 256 * 1024 * 1024
+
+def make_headers(items: List[Tuple[str, str]]) -> Message:
+  # case-insensitive lookup like the headers from the backends
+  headers = Message()
+  for k, v in items:
+    headers[k] = v
+  return headers
+
+def has_validators(items: List[Tuple[str, str]]) -> bool:
+  return any(k.lower() in ('etag', 'last-modified') for k, _ in items)
+
+class CachedHeaders:
+  def __init__(self, headers: List[Tuple[str, str]]) -> None:
+    self.headers = headers
+
+  def validators(self) -> Dict[str, str]:
+    '''Return the headers to send for a conditional request.'''
+    ret = {}
+    for k, v in self.headers:
+      k = k.lower()
+      if k == 'etag':
+        ret['If-None-Match'] = v
+      elif k == 'last-modified':
+        ret['If-Modified-Since'] = v
+    return ret
+
+  def merged_headers(self, fresh: Mapping[str, str]) -> Mapping[str, str]:
+    '''Headers of the stored response updated by those of a 304 response.'''
+    headers = make_headers(self.headers)
+    for k, v in fresh.items():
+      del headers[k]
+      headers[k] = v
+    return cast(Mapping[str, str], headers)
+
+class CachedResponse(CachedHeaders):
+  def __init__(
+    self,
+    headers: List[Tuple[str, str]],
+    body: bytes,
+  ) -> None:
+    super().__init__(headers)
+    self.body = body
+
+class CachedStream(CachedHeaders):
+  '''A stored response whose body is read from its file in chunks.'''
+  def __init__(
+    self,
+    headers: List[Tuple[str, str]],
+    file: BinaryIO,
+  ) -> None:
+    super().__init__(headers)
+    self.file = file
+
+  async def chunks(self, size: int) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    while True:
+      chunk = await loop.run_in_executor(None, self.file.read, size)
+      if not chunk:
+        return
+      yield chunk
+
+  def close(self) -> None:
+    self.file.close()
+
+class HTTPCache:
+  def __init__(self, directory: Path) -> None:
+    self.directory = directory
+
+  def key(
+    self, url: str, params: Any, headers: Mapping[str, str],
+  ) -> str:
+    if isinstance(params, dict):
+      params = list(params.items())
+    data = json.dumps([
+      url, [list(p) for p in params],
+      sorted((k.lower(), v) for k, v in headers.items()
+             if k.lower() not in IGNORED_HEADERS),
+    ])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+  def _paths(self, key: str) -> Tuple[Path, Path]:
+    d = self.directory / key[:2]
+    return d / f'{key}.json', d / f'{key}.body'
+
+  def _open(
+    self, key: str,
+  ) -> Optional[Tuple[List[Tuple[str, str]], BinaryIO]]:
+    meta_path, body_path = self._paths(key)
+    try:
+      with open(meta_path) as f:
+        meta = json.load(f)
+      body = open(body_path, 'rb')
+    except FileNotFoundError:
+      return None
+    except (OSError, ValueError) as e:
+      logger.warning('failed to load cached response', key=key, error=repr(e))
+      return None
+    return [(k, v) for k, v in meta['headers']], body
+
+  def _load(self, key: str) -> Optional[CachedResponse]:
+    r = self._open(key)
+    if r is None:
+      return None
+    headers, f = r
+    try:
+      with f:
+        body = f.read()
+    except OSError as e:
+      logger.warning('failed to load cached response', key=key, error=repr(e))
+      return None
+    return CachedResponse(headers, body)
+
+  def _load_stream(self, key: str) -> Optional[CachedStream]:
+    r = self._open(key)
+    if r is None:
+      return None
+    return CachedStream(*r)
+
+  def _write_meta(
+    self, key: str, url: str, headers: List[Tuple[str, str]],
+  ) -> None:
+    meta_path, _ = self._paths(key)
+    tmp = meta_path.with_name(meta_path.name + '.tmp')
+    with open(tmp, 'w') as f:
+      json.dump({'url': url, 'headers': headers}, f)
+    os.replace(tmp, meta_path)
+
+  def _store(
+    self, key: str, url: str,
+    headers: List[Tuple[str, str]], body: bytes,
+  ) -> None:
+    _, body_path = self._paths(key)
+    body_path.parent.mkdir(parents=True, exist_ok=True)
+    # write the body first, so that the metadata never refers to a partial body
+    tmp = body_path.with_name(body_path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+      f.write(body)
+    os.replace(tmp, body_path)
+    self._write_meta(key, url, headers)
+
+  def _create_stream_file(self, key: str) -> BinaryIO:
+    _, body_path = self._paths(key)
+    body_path.parent.mkdir(parents=True, exist_ok=True)
+    # concurrent streams of the same request each get their own file
+    return cast(BinaryIO, tempfile.NamedTemporaryFile(
+      dir=body_path.parent, prefix=body_path.name + '.',
+      suffix='.tmp', delete=False,
+    ))
+
+  def _finish_stream_file(
+    self, key: str, url: str,
+    headers: List[Tuple[str, str]], f: BinaryIO,
+  ) -> None:
+    _, body_path = self._paths(key)
+    f.close()
+    os.replace(f.name, body_path)
+    self._write_meta(key, url, headers)
+
+  def _discard_stream_file(self, f: BinaryIO) -> None:
+    f.close()
+    try:
+      os.unlink(f.name)
+    except OSError:
+      pass
+
+  async def load(self, key: str) -> Optional[CachedResponse]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, self._load, key)
+
+  async def load_stream(self, key: str) -> Optional[CachedStream]:
+    '''Like :meth:`load`, but the body is to be read in chunks.
+
+    The returned object should be closed when no longer used.
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, self._load_stream, key)
+
+  async def store(
+    self, key: str, url: str,
+    headers: Mapping[str, str], body: bytes,
+  ) -> None:
+    items = list(headers.items())
+    if not has_validators(items):
+      return
+
+    loop = asyncio.get_running_loop()
+    try:
+      await loop.run_in_executor(
+        None, self._store, key, url, items, body)
+    except OSError as e:
+      logger.warning('failed to store response in cache', url=url, error=repr(e))
+
+  async def store_stream(
+    self, key: str, url: str,
+    headers: Mapping[str, str], chunks: AsyncIterator[bytes],
+  ) -> AsyncGenerator[bytes, None]:
+    '''Pass ``chunks`` through, and store them if they are read to the end.
+
+    Close the returned iterator when no longer used, so that a partial body
+    is cleaned up.
+    '''
+    items = list(headers.items())
+    loop = asyncio.get_running_loop()
+    f: Optional[BinaryIO] = None
+    if has_validators(items):
+      try:
+        f = await loop.run_in_executor(None, self._create_stream_file, key)
+      except OSError as e:
+        logger.warning('failed to store response in cache',
+                       url=url, error=repr(e))
+
+    size = 0
+    try:
+      async for chunk in chunks:
+        if f is not None:
+          size += len(chunk)
+          if size > MAX_STREAM_SIZE:
+            logger.debug('response too big to store', url=url)
+            self._discard_stream_file(f)
+            f = None
+          else:
+            try:
+              await loop.run_in_executor(None, f.write, chunk)
+            except OSError as e:
+              logger.warning('failed to store response in cache',
+                             url=url, error=repr(e))
+              self._discard_stream_file(f)
+              f = None
+        yield chunk
+
+      if f is not None:
+        complete, f = f, None
+        try:
+          await loop.run_in_executor(
+            None, self._finish_stream_file, key, url, items, complete)
+        except OSError as e:
+          logger.warning('failed to store response in cache',
+                         url=url, error=repr(e))
+          self._discard_stream_file(complete)
+    finally:
+      if f is not None:
+        self._discard_stream_file(f)
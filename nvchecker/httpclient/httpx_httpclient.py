@@ -1,14 +1,56 @@
 # MIT licensed
 # Copyright (c) 2020-2022,2024 lilydjwg <lilydjwg@gmail.com>, et al.
 
-from typing import Dict, Optional, Tuple
+import contextlib
+from typing import Dict, Optional, Tuple, Any, AsyncIterator
 
 import httpx
+import httpcore
 
-from .base import BaseSession, TemporaryError, Response, HTTPError
+from .base import (
+  BaseSession, TemporaryError, Response, HTTPError, StreamResponse,
+  STREAM_CHUNK_SIZE,
+)
+from .resolver import CachingResolver, make_resolver
 
 __all__ = ['session']
 
+class ResolvingNetworkBackend(httpcore.AsyncNetworkBackend):
+  '''Connect to addresses from our resolver instead of host names.'''
+  def __init__(
+    self,
+    backend: httpcore.AsyncNetworkBackend,
+    resolver: CachingResolver,
+  ) -> None:
+    self.backend = backend
+    self.resolver = resolver
+
+  async def connect_tcp(
+    self, host: str, port: int, timeout: Optional[float] = None,
+    local_address: Optional[str] = None, socket_options: Any = None,
+  ) -> httpcore.AsyncNetworkStream:
+    try:
+      addrs = await self.resolver.resolve(host)
+    except OSError as e:
+      raise httpcore.ConnectError(repr(e))
+
+    for i, (_, ip) in enumerate(addrs):
+      try:
+        return await self.backend.connect_tcp(
+          ip, port, timeout = timeout,
+          local_address = local_address, socket_options = socket_options,
+        )
+      except (httpcore.ConnectError, httpcore.ConnectTimeout):
+        if i == len(addrs) - 1:
+          raise
+    raise Exception('should not reach')
+
+  async def connect_unix_socket(self, *args, **kwargs):
+    return await self.backend.connect_unix_socket(*args, **kwargs)
+
+  async def sleep(self, seconds: float) -> None:
+    await self.backend.sleep(seconds)
+
 class HttpxSession(BaseSession):
   def setup(
     self,
@@ -18,6 +60,44 @@ class HttpxSession(BaseSession):
   ) -> None:
     self.clients: Dict[Tuple[Optional[str], bool], httpx.AsyncClient] = {}
     self.timeout = timeout
+    self.resolver = make_resolver(resolver)
+
+  def _make_transport(self, verify_cert: bool) -> Optional[httpx.AsyncHTTPTransport]:
+    if self.resolver is None:
+      return None
+    transport = httpx.AsyncHTTPTransport(http2=True, verify=verify_cert)
+    # httpx has no API for custom name resolution
+    pool = transport._pool
+    pool._network_backend = ResolvingNetworkBackend(
+      pool._network_backend, self.resolver)
+    return transport
+
+  def _get_client(self, proxy: Optional[str], verify_cert: bool) -> httpx.AsyncClient:
+    client = self.clients.get((proxy, verify_cert))
+    if not client:
+      client = httpx.AsyncClient(
+        timeout = httpx.Timeout(self.timeout, pool=None),
+        http2 = True,
+        proxy = proxy,
+        verify = verify_cert,
+        # with a proxy, names are resolved by it
+        transport = self._make_transport(verify_cert) if proxy is None else None,
+      )
+      self.clients[(proxy, verify_cert)] = client
+    return client
+
+  def _check_status(self, r: httpx.Response) -> None:
+    err_cls: Optional[type] = None
+    if r.status_code >= 500:
+      err_cls = TemporaryError
+    elif r.status_code >= 400:
+      err_cls = HTTPError
+    if err_cls is not None:
+      raise err_cls(
+        r.status_code,
+        r.reason_phrase,
+        r,
+      )
 
   async def request_impl(
     self, url: str, *,
@@ -30,15 +110,7 @@ class HttpxSession(BaseSession):
     body = None,
     verify_cert: bool = True,
   ) -> Response:
-    client = self.clients.get((proxy, verify_cert))
-    if not client:
-      client = httpx.AsyncClient(
-        timeout = httpx.Timeout(self.timeout, pool=None),
-        http2 = True,
-        proxy = proxy,
-        verify = verify_cert,
-      )
-      self.clients[(proxy, verify_cert)] = client
+    client = self._get_client(proxy, verify_cert)
 
     try:
       if body is not None:
@@ -53,23 +125,45 @@ class HttpxSession(BaseSession):
         # httpx checks for None but not ()
         params = params or None,
       )
-      err_cls: Optional[type] = None
-      if r.status_code >= 500:
-        err_cls = TemporaryError
-      elif r.status_code >= 400:
-        err_cls = HTTPError
-      if err_cls is not None:
-        raise err_cls(
-          r.status_code,
-          r.reason_phrase,
-          r,
-        )
+      self._check_status(r)
 
     except httpx.TransportError as e:
       raise TemporaryError(599, repr(e), None)
 
     body = await r.aread()
-    return Response(r.headers, body)
+    return Response(r.headers, body, r.status_code)
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(
+    self, url: str, *,
+    method: str,
+    proxy: Optional[str] = None,
+    headers: Dict[str, str] = {},
+    follow_redirects: bool = True,
+    params = (),
+    verify_cert: bool = True,
+  ) -> AsyncIterator[StreamResponse]:
+    client = self._get_client(proxy, verify_cert)
+    req = client.build_request(
+      method, url, headers = headers, params = params or None)
+    try:
+      r = await client.send(
+        req, stream = True, follow_redirects = follow_redirects)
+    except httpx.TransportError as e:
+      raise TemporaryError(599, repr(e), None)
+
+    try:
+      self._check_status(r)
+      yield StreamResponse(r.headers, r.status_code, self._iter_chunks(r))
+    finally:
+      await r.aclose()
+
+  async def _iter_chunks(self, r: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+      async for chunk in r.aiter_bytes(STREAM_CHUNK_SIZE):
+        yield chunk
+    except httpx.TransportError as e:
+      raise TemporaryError(599, repr(e), None)
 
   async def aclose(self):
     for client in self.clients.values():
@@ -0,0 +1,134 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+An in-process DNS cache shared by the HTTP backends, so that each host name
+is looked up once rather than for every connection.
+'''
+
+import asyncio
+import functools
+import ipaddress
+import socket
+import time
+from typing import Dict, List, Optional, Tuple, Any
+
+import structlog
+
+logger = structlog.get_logger(logger_name=__name__)
+
+# (family, IP address)
+Address = Tuple[int, str]
+
+# how long to keep results of the system resolver, which doesn't tell the TTL
+SYSTEM_TTL = 60
+# bounds for TTLs from DNS answers
+MIN_TTL = 5
+MAX_TTL = 3600
+
+class CachingResolver:
+  '''Resolve host names and cache the results until their TTL expires.
+
+  ``backend`` is ``system`` to use the system resolver (``getaddrinfo``), or
+  ``aiodns`` to query DNS servers directly and respect TTLs of the answers.
+  '''
+  def __init__(self, backend: str = 'system') -> None:
+    self.backend = backend
+    self._aiodns: Any = None
+    self._cache: Dict[Tuple[str, int], Tuple[float, List[Address]]] = {}
+    self._pending: Dict[Tuple[str, int], asyncio.Future] = {}
+
+  async def resolve(
+    self, host: str, family: int = socket.AF_UNSPEC,
+  ) -> List[Address]:
+    '''Return the addresses of ``host``; raise :class:`socket.gaierror` on failure.'''
+    try:
+      ip = ipaddress.ip_address(host.strip('[]'))
+    except ValueError:
+      pass
+    else:
+      ip_family = socket.AF_INET6 if ip.version == 6 else socket.AF_INET
+      return [(ip_family, str(ip))]
+
+    key = host.lower(), family
+    cached = self._cache.get(key)
+    if cached is not None:
+      expires, addrs = cached
+      if expires > time.monotonic():
+        return addrs
+      del self._cache[key]
+
+    fu = self._pending.get(key)
+    if fu is None:
+      fu = asyncio.ensure_future(self._lookup(host, family))
+      self._pending[key] = fu
+      fu.add_done_callback(functools.partial(self._lookup_done, key))
+    # don't let a cancelled waiter cancel the lookup for others
+    addrs, _ = await asyncio.shield(fu)
+    return addrs
+
+  def _lookup_done(self, key: Tuple[str, int], fu: asyncio.Future) -> None:
+    del self._pending[key]
+    if not fu.cancelled() and fu.exception() is None:
+      addrs, ttl = fu.result()
+      self._cache[key] = time.monotonic() + ttl, addrs
+
+  async def _lookup(
+    self, host: str, family: int,
+  ) -> Tuple[List[Address], float]:
+    if self.backend == 'aiodns':
+      return await self._lookup_aiodns(host, family)
+
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(
+      host, None, family=family, type=socket.SOCK_STREAM)
+    addrs = _dedup([(info[0], str(info[4][0])) for info in infos])
+    logger.debug('resolved', host=host, addrs=addrs)
+    return addrs, SYSTEM_TTL
+
+  async def _lookup_aiodns(
+    self, host: str, family: int,
+  ) -> Tuple[List[Address], float]:
+    import aiodns
+    if self._aiodns is None:
+      self._aiodns = aiodns.DNSResolver()
+
+    try:
+      res = await self._aiodns.getaddrinfo(
+        host, family=family, type=socket.SOCK_STREAM)
+    except aiodns.error.DNSError as e:
+      raise socket.gaierror(socket.EAI_NONAME, f'{host}: {e.args[-1]}')
+
+    addrs = []
+    for node in res.nodes:
+      ip = node.addr[0]
+      if isinstance(ip, bytes):
+        ip = ip.decode()
+      addrs.append((node.family, ip))
+    if not addrs:
+      raise socket.gaierror(socket.EAI_NONAME, f'{host}: no address')
+
+    ttl = min(node.ttl for node in res.nodes)
+    ttl = max(MIN_TTL, min(MAX_TTL, ttl))
+    addrs = _dedup(addrs)
+    logger.debug('resolved', host=host, addrs=addrs, ttl=ttl)
+    return addrs, ttl
+
+def _dedup(addrs: List[Address]) -> List[Address]:
+  return list(dict.fromkeys(addrs))
+
+def make_resolver(name: Optional[str]) -> Optional[CachingResolver]:
+  '''Create a resolver for the ``resolver`` configuration option.'''
+  if name is None:
+    return None
+  if name == 'aiodns':
+    try:
+      import aiodns
+      assert aiodns # for pyflakes
+    except ImportError:
+      logger.warning('aiodns is not installed, using the system resolver')
+      name = 'system'
+  elif name != 'system':
+    logger.warning('unknown resolver, using the system resolver', resolver=name)
+    name = 'system'
+  return CachingResolver(name)
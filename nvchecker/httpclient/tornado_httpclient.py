@@ -2,18 +2,32 @@
 # Copyright (c) 2013-2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
 import json as _json
-from urllib.parse import urlencode
-from typing import Optional, Dict, Any
+from urllib.parse import urlencode, urlsplit
+from typing import (
+  Optional, Dict, Any, List, Tuple, AsyncIterator, Awaitable,
+)
 import os
+import asyncio
+import socket
+import functools
+import contextlib
 
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httpclient import (
+  AsyncHTTPClient, HTTPRequest, HTTPResponse, HTTPClientError,
+)
+from tornado.httputil import HTTPHeaders
+from tornado.simple_httpclient import SimpleAsyncHTTPClient, _HTTPConnection
+from tornado.netutil import Resolver
 
 try:
   import pycurl
 except ImportError:
   pycurl = None # type: ignore
 
-from .base import BaseSession, TemporaryError, Response, HTTPError
+from .base import (
+  BaseSession, TemporaryError, Response, HTTPError, StreamResponse,
+)
+from .resolver import CachingResolver, make_resolver
 
 __all__ = ['session']
 
@@ -35,6 +49,20 @@ def setup_curl(curl):
     curl.setopt_string(pycurl.CAINFO, SSL_CERT_FILE)
   curl.setopt_string(pycurl.ACCEPT_ENCODING, "")
 
+def setup_curl_resolve(resolve: List[str], curl):
+  setup_curl(curl)
+  curl.setopt(pycurl.RESOLVE, resolve)
+
+class TornadoResolver(Resolver):
+  def initialize(self, resolver: CachingResolver) -> None:
+    self.resolver = resolver
+
+  async def resolve(
+    self, host: str, port: int, family: socket.AddressFamily = socket.AF_UNSPEC,
+  ) -> List[Tuple[int, Any]]:
+    addrs = await self.resolver.resolve(host, family)
+    return [(fam, (ip, port)) for fam, ip in addrs]
+
 class TornadoSession(BaseSession):
   def setup(
     self,
@@ -42,26 +70,30 @@ class TornadoSession(BaseSession):
     timeout: int = 20,
     resolver: Optional[str] = None,
   ) -> None:
-    impl: Optional[str]
+    impl: Any
+    kwargs: Dict[str, Any] = {}
+    self.resolver = make_resolver(resolver)
     if pycurl:
       impl = "tornado.curl_httpclient.CurlAsyncHTTPClient"
     else:
-      impl = None
+      impl = StreamingHTTPClient
+      # streamed bodies (e.g. package indices) may exceed the default limit
+      kwargs['max_body_size'] = MAX_STREAM_BODY_SIZE
+      if self.resolver is not None:
+        kwargs['resolver'] = TornadoResolver(resolver=self.resolver)
     AsyncHTTPClient.configure(
-      impl, max_clients = concurrency)
+      impl, max_clients = concurrency, **kwargs)
     self.timeout = timeout
 
-  async def request_impl(
+  async def _prepare(
     self, url: str, *,
     method: str,
-    proxy: Optional[str] = None,
-    headers: Dict[str, str] = {},
-    follow_redirects: bool = True,
-    params = (),
-    json = None,
-    body = None,
-    verify_cert: bool = True,
-  ) -> Response:
+    proxy: Optional[str],
+    headers: Dict[str, str],
+    follow_redirects: bool,
+    params,
+    verify_cert: bool,
+  ) -> Tuple[str, Dict[str, Any]]:
     kwargs: Dict[str, Any] = {
       'method': method,
       'headers': headers,
@@ -69,12 +101,6 @@ class TornadoSession(BaseSession):
       'follow_redirects': follow_redirects,
       'validate_cert': verify_cert,
     }
-
-    if body:
-      # By default the content type is already 'application/x-www-form-urlencoded'
-      kwargs['body'] = body
-    elif json:
-      kwargs['body'] = _json.dumps(json)
     kwargs['prepare_curl_callback'] = setup_curl
 
     if proxy:
@@ -86,9 +112,47 @@ class TornadoSession(BaseSession):
       q = urlencode(params)
       url += '?' + q
 
+    if pycurl and self.resolver is not None and not proxy:
+      # feed curl with our cached addresses
+      u = urlsplit(url)
+      if u.hostname:
+        try:
+          addrs = await self.resolver.resolve(u.hostname)
+        except OSError as e:
+          raise TemporaryError(599, repr(e), None)
+        dport = u.port or (443 if u.scheme == 'https' else 80)
+        ips = ','.join(
+          f'[{ip}]' if fam == socket.AF_INET6 else ip for fam, ip in addrs)
+        kwargs['prepare_curl_callback'] = functools.partial(
+          setup_curl_resolve, [f'{u.hostname}:{dport}:{ips}'])
+
+    return url, kwargs
+
+  async def request_impl(
+    self, url: str, *,
+    method: str,
+    proxy: Optional[str] = None,
+    headers: Dict[str, str] = {},
+    follow_redirects: bool = True,
+    params = (),
+    json = None,
+    body = None,
+    verify_cert: bool = True,
+  ) -> Response:
+    url, kwargs = await self._prepare(
+      url, method = method, proxy = proxy, headers = headers,
+      follow_redirects = follow_redirects, params = params,
+      verify_cert = verify_cert,
+    )
+
+    if body:
+      # By default the content type is already 'application/x-www-form-urlencoded'
+      kwargs['body'] = body
+    elif json:
+      kwargs['body'] = _json.dumps(json)
+
     r = HTTPRequest(url, **kwargs)
-    res = await AsyncHTTPClient().fetch(
-      r, raise_error=False)
+    res = await _fetch(AsyncHTTPClient().fetch(r, raise_error=False))
     err_cls: Optional[type] = None
     if res.code >= 500:
       err_cls = TemporaryError
@@ -99,6 +163,178 @@ class TornadoSession(BaseSession):
         res.code, res.reason, res
       )
 
-    return Response(res.headers, res.body)
+    return Response(res.headers, res.body, res.code)
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(
+    self, url: str, *,
+    method: str,
+    proxy: Optional[str] = None,
+    headers: Dict[str, str] = {},
+    follow_redirects: bool = True,
+    params = (),
+    verify_cert: bool = True,
+  ) -> AsyncIterator[StreamResponse]:
+    url, kwargs = await self._prepare(
+      url, method = method, proxy = proxy, headers = headers,
+      follow_redirects = follow_redirects, params = params,
+      verify_cert = verify_cert,
+    )
+    # big files may take longer; only limit the time between reads (for the
+    # simple client, see StreamingHTTPConnection)
+    kwargs['connect_timeout'] = self.timeout
+
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue[Optional[bytes]] = asyncio.Queue()
+    head: asyncio.Future[Tuple[int, str, HTTPHeaders]] = loop.create_future()
+    header_lines: List[str] = []
+    closed = False
+
+    def on_header(line: str) -> None:
+      if line.startswith('HTTP/'):
+        header_lines.clear()
+      header_lines.append(line)
+      if line.strip() or head.done():
+        return
+      # end of a header block
+      status_line = header_lines[0].split(' ', 2)
+      code = int(status_line[1])
+      reason = status_line[2].strip() if len(status_line) > 2 else ''
+      headers = HTTPHeaders.parse(''.join(header_lines[1:]))
+      if code == 100:
+        return
+      if follow_redirects and code in REDIRECT_CODES and 'Location' in headers:
+        return
+      head.set_result((code, reason, headers))
+
+    def on_chunk(chunk: bytes) -> None:
+      if closed:
+        # abort the transfer (see StreamingHTTPConnection)
+        raise StreamClosed
+      chunks.put_nowait(chunk)
+
+    def on_curl_write(chunk: bytes) -> Optional[int]:
+      if closed:
+        # writing less than given makes curl abort the transfer
+        return 0
+      chunks.put_nowait(chunk)
+      return None
+
+    if pycurl:
+      kwargs['request_timeout'] = 0
+      prepare = kwargs['prepare_curl_callback']
+      def prepare_curl(curl) -> None:
+        prepare(curl)
+        curl.setopt(pycurl.WRITEFUNCTION, on_curl_write)
+        # abort if less than a byte is received per second for that long
+        curl.setopt(pycurl.LOW_SPEED_LIMIT, 1)
+        curl.setopt(pycurl.LOW_SPEED_TIME, max(1, int(self.timeout)))
+      kwargs['prepare_curl_callback'] = prepare_curl
+
+    def on_done(fu: asyncio.Future[HTTPResponse]) -> None:
+      chunks.put_nowait(None)
+      if not fu.cancelled():
+        # an aborted transfer fails after we are no longer interested
+        fu.exception()
+
+    kwargs['header_callback'] = on_header
+    kwargs['streaming_callback'] = on_chunk
+    r = HTTPRequest(url, **kwargs)
+    fetch = asyncio.ensure_future(_fetch(
+      AsyncHTTPClient().fetch(r, raise_error=False)))
+    fetch.add_done_callback(on_done)
+
+    try:
+      await asyncio.wait(
+        [head, fetch], return_when=asyncio.FIRST_COMPLETED) # type: ignore
+      if head.done():
+        code, reason, res_headers = head.result()
+      else:
+        # finished (or failed) without a body
+        full_res = fetch.result()
+        if full_res.code == 599:
+          raise TemporaryError(599, repr(full_res.error), None)
+        code, reason, res_headers = full_res.code, full_res.reason, full_res.headers
+
+      res = StreamResponse(
+        res_headers, code, self._iter_chunks(chunks, fetch))
+      err_cls: Optional[type] = None
+      if code >= 500:
+        err_cls = TemporaryError
+      elif code >= 400:
+        err_cls = HTTPError
+      if err_cls is not None:
+        raise err_cls(code, reason, res)
+
+      yield res
+    finally:
+      closed = True
+      head.cancel()
+
+  async def _iter_chunks(
+    self,
+    chunks: asyncio.Queue[Optional[bytes]],
+    fetch: asyncio.Future[HTTPResponse],
+  ) -> AsyncIterator[bytes]:
+    while True:
+      chunk = await chunks.get()
+      if chunk is None:
+        break
+      yield chunk
+
+    res = fetch.result()
+    if res.code == 599:
+      raise TemporaryError(599, repr(res.error), None)
+
+class StreamClosed(Exception):
+  '''Raised in the streaming callback to abort a transfer.'''
+
+class StreamingHTTPConnection(_HTTPConnection):
+  '''A connection that can abort a streamed transfer, and for which
+  ``request_timeout`` limits the time between reads instead.'''
+  async def headers_received(self, first_line, headers) -> None:
+    self._restart_timeout()
+    await super().headers_received(first_line, headers)
+
+  def data_received(self, chunk: bytes) -> None:
+    self._restart_timeout()
+    try:
+      super().data_received(chunk)
+    except StreamClosed:
+      # the fetch fails with HTTPStreamClosedError then
+      self.stream.close()
+
+  def _restart_timeout(self) -> None:
+    timeout = self.request.request_timeout
+    if self.request.streaming_callback is None or not timeout:
+      return
+    if self._timeout is None:
+      # not connected yet, or already timed out or finished
+      return
+    self._remove_timeout()
+    self._timeout = self.io_loop.add_timeout(
+      self.io_loop.time() + timeout,
+      functools.partial(self._on_timeout, 'while streaming'),
+    )
+
+class StreamingHTTPClient(SimpleAsyncHTTPClient):
+  '''The simple HTTP client, which can abort a streamed transfer.'''
+  def _connection_class(self) -> type:
+    return StreamingHTTPConnection
+
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+MAX_STREAM_BODY_SIZE = 16 * 1024 * 1024 * 1024
+
+async def _fetch(fu: Awaitable[HTTPResponse]) -> HTTPResponse:
+  try:
+    return await fu
+  except OSError as e:
+    # connection errors from the simple_httpclient
+    raise TemporaryError(599, repr(e), None)
+  except HTTPClientError as e:
+    # e.g. the connection is closed while streaming
+    if e.code == 599:
+      raise TemporaryError(599, repr(e), None)
+    raise
 
 session = TornadoSession()
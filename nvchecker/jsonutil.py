@@ -0,0 +1,78 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+JSON encoding and decoding. orjson or msgspec is used if installed, which is
+much faster than the standard library. The results are the same, except that
+orjson decodes integers that don't fit in 64 bits as floats.
+'''
+
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+  import orjson
+except ImportError:
+  orjson = None # type: ignore
+
+try:
+  import msgspec
+except ImportError:
+  msgspec = None # type: ignore
+
+if orjson is not None:
+  _fast_loads: Optional[Callable[[Union[bytes, str]], Any]] = orjson.loads
+  _fast_errors: Any = orjson.JSONDecodeError
+elif msgspec is not None:
+  _fast_loads = msgspec.json.decode
+  _fast_errors = msgspec.DecodeError
+else:
+  _fast_loads = None
+  _fast_errors = ()
+
+def loads(data: Union[bytes, str]) -> Any:
+  '''Decode a JSON document. UTF-8 is assumed for bytes.
+
+  :raises json.JSONDecodeError: if the document is invalid
+  '''
+  if _fast_loads is not None:
+    try:
+      return _fast_loads(data)
+    except _fast_errors:
+      # The standard library accepts a little more (e.g. NaN), or raises
+      # the usual error.
+      pass
+
+  if isinstance(data, bytes):
+    data = data.decode('utf-8')
+  return json.loads(data)
+
+def dumps(
+  obj: Any, *,
+  indent: bool = False,
+  default: Optional[Callable[[Any], Any]] = None,
+) -> str:
+  '''Encode ``obj`` as JSON, like :func:`json.dumps` with
+  ``ensure_ascii=False`` and either ``indent=2`` or compact separators.
+
+  ``default`` is called for objects that aren't JSON types, including
+  dataclasses and datetimes.
+  '''
+  # msgspec always encodes dataclasses itself, so it's only used to decode
+  if orjson is not None:
+    option = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+    if indent:
+      option |= orjson.OPT_INDENT_2
+    try:
+      return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+    except TypeError:
+      # e.g. non-str keys or huge integers; let the standard library
+      # decide.
+      pass
+
+  if indent:
+    return json.dumps(
+      obj, indent=2, ensure_ascii=False, default=default)
+  else:
+    return json.dumps(
+      obj, separators=(',', ':'), ensure_ascii=False, default=default)
@@ -0,0 +1,282 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+'''
+Timings and HTTP statistics of a run, aggregated per entry, source and host.
+
+Collecting is enabled by setting the ``metrics`` context variable to a
+:class:`Metrics` object; everything here is a no-op otherwise. Requests are
+attributed to the entry and source whose context they are made in, so a
+response shared between entries is counted for the first one only.
+'''
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import time
+from typing import (
+  Dict, Any, List, Iterator, AsyncIterable, AsyncIterator, Tuple, Optional,
+)
+from urllib.parse import urlsplit
+
+from .ctxvars import metrics as ctx_metrics
+from .ctxvars import source as ctx_source
+from .ctxvars import entry_metrics as ctx_entry_metrics
+
+@dataclasses.dataclass
+class Counters:
+  '''HTTP statistics.'''
+  http_requests: int = 0
+  http_errors: int = 0
+  http_retries: int = 0
+  # of response bodies
+  http_bytes: int = 0
+  # time spent on requests, including reading the bodies
+  http_seconds: float = 0
+
+  def add(self, other: Counters) -> None:
+    for f in dataclasses.fields(Counters):
+      setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+@dataclasses.dataclass
+class EntryMetrics(Counters):
+  '''Statistics of one entry checked by a function-based source.'''
+  source: str = ''
+  # from starting to wait for the task semaphore to the result
+  seconds: float = 0
+  # time spent waiting for the task semaphore
+  wait_seconds: float = 0
+
+@dataclasses.dataclass
+class SourceMetrics(Counters):
+  entries: int = 0
+  failures: int = 0
+  # sums of the entries' ones
+  seconds: float = 0
+  wait_seconds: float = 0
+  # wall time of the source's worker
+  worker_seconds: float = 0
+
+  def add(self, other: Counters) -> None:
+    super().add(other)
+    if isinstance(other, SourceMetrics):
+      self.entries += other.entries
+      self.failures += other.failures
+      self.seconds += other.seconds
+      self.wait_seconds += other.wait_seconds
+      self.worker_seconds = max(self.worker_seconds, other.worker_seconds)
+
+class Metrics:
+  '''Statistics collected in one run.'''
+  def __init__(self) -> None:
+    self.entries: Dict[str, EntryMetrics] = {}
+    self.sources: Dict[str, SourceMetrics] = {}
+    self.hosts: Dict[str, Counters] = {}
+    self.timestamp = time.time()
+    self.seconds = 0.0
+
+  def source(self, name: str) -> SourceMetrics:
+    s = self.sources.get(name)
+    if s is None:
+      s = self.sources[name] = SourceMetrics()
+    return s
+
+  def host(self, name: str) -> Counters:
+    h = self.hosts.get(name)
+    if h is None:
+      h = self.hosts[name] = Counters()
+    return h
+
+  def entry_result(self, source: str, ok: bool) -> None:
+    s = self.source(source)
+    s.entries += 1
+    if not ok:
+      s.failures += 1
+
+  def merge(self, other: Metrics) -> None:
+    '''Add statistics of a run done at the same time (e.g. another process).'''
+    self.entries.update(other.entries)
+    for name, s in other.sources.items():
+      self.source(name).add(s)
+    for name, h in other.hosts.items():
+      self.host(name).add(h)
+    self.timestamp = min(self.timestamp, other.timestamp)
+    self.seconds = max(self.seconds, other.seconds)
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {
+      'timestamp': self.timestamp,
+      'seconds': self.seconds,
+      'sources': {k: dataclasses.asdict(v) for k, v in sorted(self.sources.items())},
+      'hosts': {k: dataclasses.asdict(v) for k, v in sorted(self.hosts.items())},
+      'entries': {k: dataclasses.asdict(v) for k, v in sorted(self.entries.items())},
+    }
+
+  def to_prometheus(self) -> str:
+    '''Format as Prometheus text exposition format, for the textfile collector.
+
+    All values are of this run, so they are gauges.
+    '''
+    lines: List[str] = []
+
+    def metric(
+      name: str, help: str, samples: List[Tuple[Dict[str, str], float]],
+    ) -> None:
+      name = 'nvchecker_' + name
+      lines.append(f'# HELP {name} {help}')
+      lines.append(f'# TYPE {name} gauge')
+      for labels, value in samples:
+        if labels:
+          l = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+          lines.append(f'{name}{{{l}}} {value!r}')
+        else:
+          lines.append(f'{name} {value!r}')
+
+    metric('run_timestamp_seconds', 'When the run started.',
+           [({}, self.timestamp)])
+    metric('run_seconds', 'Duration of the run.', [({}, self.seconds)])
+
+    sources = sorted(self.sources.items())
+    for field, help in SOURCE_FIELDS:
+      metric(f'source_{field}', help, [
+        ({'source': k}, getattr(v, field)) for k, v in sources
+      ])
+
+    hosts = sorted(self.hosts.items())
+    for field, help in HTTP_FIELDS:
+      metric(f'host_{field}', help, [
+        ({'host': k}, getattr(v, field)) for k, v in hosts
+      ])
+
+    entries = sorted(self.entries.items())
+    for field, help in ENTRY_FIELDS:
+      metric(f'entry_{field}', help, [
+        ({'name': k, 'source': v.source}, getattr(v, field))
+        for k, v in entries
+      ])
+
+    lines.append('')
+    return '\n'.join(lines)
+
+HTTP_FIELDS = [
+  ('http_requests', 'Number of HTTP requests sent.'),
+  ('http_errors', 'Number of HTTP requests that failed.'),
+  ('http_retries', 'Number of HTTP requests retried.'),
+  ('http_bytes', 'Bytes of HTTP response bodies received.'),
+  ('http_seconds', 'Time spent on HTTP requests.'),
+]
+
+SOURCE_FIELDS = [
+  ('entries', 'Number of entries checked.'),
+  ('failures', 'Number of entries that failed.'),
+  ('seconds', 'Sum of the time spent checking each entry.'),
+  ('wait_seconds', 'Sum of the time entries waited for max_concurrency.'),
+  ('worker_seconds', 'Time from starting to finishing checking the entries.'),
+] + HTTP_FIELDS
+
+ENTRY_FIELDS = [
+  ('seconds', 'Time spent checking the entry.'),
+  ('wait_seconds', 'Time the entry waited for max_concurrency.'),
+] + HTTP_FIELDS
+
+def _escape(v: str) -> str:
+  return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class RequestTimer:
+  '''Time one HTTP request and count it for its host, source and entry.'''
+  def __init__(self, url: str) -> None:
+    self.metrics = ctx_metrics.get()
+    self.url = url
+    self.bytes = 0
+    self._start = 0.0
+    self._finished = False
+
+  @property
+  def enabled(self) -> bool:
+    return self.metrics is not None
+
+  def start(self) -> None:
+    self._start = time.monotonic()
+
+  def _targets(self) -> List[Counters]:
+    assert self.metrics is not None
+    host = urlsplit(self.url).hostname or ''
+    ret = [self.metrics.host(host)]
+    source = ctx_source.get()
+    if source is not None:
+      ret.append(self.metrics.source(source))
+    entry = ctx_entry_metrics.get()
+    if entry is not None:
+      ret.append(entry)
+    return ret
+
+  def finish(self, error: bool = False) -> None:
+    if self.metrics is None or not self._start or self._finished:
+      return
+    self._finished = True
+    seconds = time.monotonic() - self._start
+    for c in self._targets():
+      c.http_requests += 1
+      c.http_errors += int(error)
+      c.http_bytes += self.bytes
+      c.http_seconds += seconds
+
+  def retried(self) -> None:
+    if self.metrics is None:
+      return
+    for c in self._targets():
+      c.http_retries += 1
+
+  async def count(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    '''Count the bytes of a streamed body.'''
+    async for chunk in chunks:
+      self.bytes += len(chunk)
+      yield chunk
+
+@contextlib.contextmanager
+def measure_request(url: str) -> Iterator[RequestTimer]:
+  '''Time a request. Set ``bytes`` of the yielded timer to the body size.'''
+  timer = RequestTimer(url)
+  timer.start()
+  try:
+    yield timer
+  except Exception:
+    timer.finish(error=True)
+    raise
+  else:
+    timer.finish()
+
+def record_retry(url: str) -> None:
+  RequestTimer(url).retried()
+
+class EntryTimer:
+  '''Time checking one entry, in the entry's own context.'''
+  def __init__(self, name: str) -> None:
+    self.metrics = m = ctx_metrics.get()
+    self.entry: Optional[EntryMetrics] = None
+    if m is None:
+      return
+
+    self.entry = EntryMetrics(source=ctx_source.get() or '')
+    m.entries[name] = self.entry
+    ctx_entry_metrics.set(self.entry)
+    self._start = self._acquired = time.monotonic()
+
+  def acquired(self) -> None:
+    '''Called when the task semaphore has been acquired.'''
+    if self.entry is not None:
+      self._acquired = time.monotonic()
+
+  def finish(self) -> None:
+    entry = self.entry
+    if entry is None:
+      return
+    self.entry = None
+    now = time.monotonic()
+    entry.seconds = now - self._start
+    entry.wait_seconds = self._acquired - self._start
+    assert self.metrics is not None
+    s = self.metrics.source(entry.source)
+    s.seconds += entry.seconds
+    s.wait_seconds += entry.wait_seconds
@@ -3,11 +3,15 @@
 
 '''
 Sort versions using deprecated pkg_resource / packaging.parse_version, pyalpm,
-or Portage comparators.
+Portage or dpkg comparators.
 '''
 
 __all__ = ["sort_version_keys"]
 
+import functools
+import re
+from typing import Tuple
+
 from .lib.packaging_version import parse as parse_version
 
 try:
@@ -38,9 +42,61 @@ except ImportError:
     raise NotImplementedError("Using portage but portage can not be imported!")
   portage_available = False
 
+_dpkg_part_re = re.compile(r'(\D*)(\d*)')
+
+DpkgPart = Tuple[Tuple[Tuple[int, ...], int], ...]
+DpkgVersion = Tuple[int, DpkgPart, DpkgPart]
+
+@functools.lru_cache(maxsize=4096)
+def _dpkg_chars(s: str) -> Tuple[int, ...]:
+  # '~' sorts before the end of the part, which sorts before letters, which
+  # sort before other characters
+  ret = []
+  for c in s:
+    if c == '~':
+      ret.append(-1)
+    elif c.isascii() and c.isalpha():
+      ret.append(ord(c))
+    else:
+      ret.append(ord(c) + 256)
+  ret.append(0)
+  return tuple(ret)
+
+# a missing part compares like an empty string followed by 0
+_dpkg_end = ((0,), 0)
+
+def _dpkg_part(s: str) -> DpkgPart:
+  ret = [
+    (_dpkg_chars(chars), int(digits or 0))
+    for chars, digits in _dpkg_part_re.findall(s)
+  ]
+  # only the first one (which may have no non-digits) can be equal to
+  # _dpkg_end and it's kept, so that "0" still sorts after "0~rc1"; trailing
+  # ones would break comparing to a shorter part
+  while len(ret) > 1 and ret[-1] == _dpkg_end:
+    ret.pop()
+  ret.append(_dpkg_end)
+  return tuple(ret)
+
+def dpkg_version(s: str) -> DpkgVersion:
+  '''Return a sort key that orders versions like ``dpkg --compare-versions``.'''
+  epoch_str, sep, rest = s.partition(':')
+  if sep and epoch_str.isdigit():
+    epoch = int(epoch_str)
+  else:
+    epoch = 0
+    rest = s
+
+  upstream, sep, revision = rest.rpartition('-')
+  if not sep:
+    upstream, revision = rest, ''
+
+  return epoch, _dpkg_part(upstream), _dpkg_part(revision)
+
 sort_version_keys = {
   "parse_version": parse_version,
   "vercmp": vercmp,
   "awesomeversion": AwesomeVersion,
   "portage": portage_vercmp,
+  "dpkg": dpkg_version,
 }
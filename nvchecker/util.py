@@ -9,11 +9,14 @@ from asyncio import Queue
 from typing import (
   Dict, Optional, List, NamedTuple, Union,
   Any, Tuple, Callable, Coroutine, Hashable,
+  AsyncIterable, AsyncIterator, Iterable,
   TYPE_CHECKING,
 )
 from pathlib import Path
 import contextvars
 import abc
+import codecs
+import importlib
 import netrc
 from dataclasses import dataclass
 
@@ -33,6 +36,7 @@ from .ctxvars import proxy as ctx_proxy
 from .ctxvars import user_agent as ctx_ua
 from .ctxvars import httptoken as ctx_httpt
 from .ctxvars import verify_cert as ctx_verify_cert
+from .metrics import EntryTimer
 
 logger = structlog.get_logger(logger_name=__name__)
 
@@ -57,6 +61,8 @@ if sys.version_info[:2] >= (3, 10):
     creation_time: Optional[str] = None
     # Creation time of the underlying revision object, if applicable.
     revision_creation_time: Optional[str] = None
+    # When this result was obtained; set by nvchecker, not by sources.
+    last_checked: Optional[str] = None
 
     def __str__(self):
       return self.version
@@ -72,6 +78,8 @@ else:
     creation_time: Optional[str] = None
     # Creation time of the underlying revision object, if applicable.
     revision_creation_time: Optional[str] = None
+    # When this result was obtained; set by nvchecker, not by sources.
+    last_checked: Optional[str] = None
 
     def __str__(self):
       return self.version
@@ -116,10 +124,25 @@ class KeyManager:
     self.netrc = netrc_hosts
 
   def get_key(self, name: str, legacy_name: Optional[str] = None) -> Optional[str]:
-    '''Get the named key (token) in the keyfile.'''
+    '''Get the named key (token) in the keyfile.
+
+    If several keys are given for the name, the first one is returned.
+    '''
+    keys = self.get_keys(name, legacy_name)
+    return keys[0] if keys else None
+
+  def get_keys(self, name: str, legacy_name: Optional[str] = None) -> List[str]:
+    '''Get all keys (tokens) with the name in the keyfile.
+
+    A key in the keyfile can be a string or a list of strings.
+    '''
     keyfile_token = self.keys.get(name) or self.keys.get(legacy_name)
+    if keyfile_token:
+      if isinstance(keyfile_token, str):
+        return [keyfile_token]
+      return list(keyfile_token)
     netrc_passwd = (e := self.netrc.get(name)) and e[2]
-    return keyfile_token or netrc_passwd
+    return [netrc_passwd] if netrc_passwd else []
 
 class EntryWaiter:
   def __init__(self) -> None:
@@ -146,6 +169,8 @@ class EntryWaiter:
       fu = asyncio.Future()
       self._waiting[name] = fu
     fu.set_exception(e)
+    # mark as retrieved, as there may be no one waiting on this entry
+    fu.exception()
 
 class RawResult(NamedTuple):
   '''The unprocessed result from a check.'''
@@ -208,14 +233,25 @@ class BaseWorker:
       # don't let an exception tear down the whole process
       logger.exception('exception raised by Worker.run')
 
+def shortest_timeout(tasks: Iterable[Tuple[str, Entry]]) -> Optional[float]:
+  '''Return the ``timeout`` for entries checked together: the shortest one
+  given, so that none of them is waited for longer than it asks.'''
+  timeouts = [
+    entry['timeout'] for _, entry in tasks
+    if entry.get('timeout') is not None
+  ]
+  return min(timeouts) if timeouts else None
+
 class AsyncCache:
   '''A cache for use with async functions.'''
   cache: Dict[Hashable, Any]
   lock: asyncio.Lock
+  waiters: Dict[Hashable, int]
 
   def __init__(self) -> None:
     self.cache = {}
     self.lock = asyncio.Lock()
+    self.waiters = {}
 
   async def _get_json(
     self, key: Tuple[str, str, Tuple[Tuple[str, str], ...]],
@@ -262,17 +298,31 @@ class AsyncCache:
       cached = self.cache.get(cache_key)
       if cached is None:
         coro = func(key)
-        fu = asyncio.create_task(coro)
-        self.cache[cache_key] = fu
+        cached = asyncio.create_task(coro)
+        self.cache[cache_key] = cached
 
-    if asyncio.isfuture(cached): # pending
-      return await cached
-    elif cached is not None: # cached
+    if not asyncio.isfuture(cached): # cached
       return cached
-    else: # not cached
-      r = await fu
-      self.cache[cache_key] = r
-      return r
+
+    # pending; cancelled only when all waiters are (e.g. timed out)
+    fu = cached
+    self.waiters[cache_key] = self.waiters.get(cache_key, 0) + 1
+    try:
+      r = await asyncio.shield(fu)
+    except asyncio.CancelledError:
+      if self.waiters[cache_key] == 1 and not fu.done():
+        fu.cancel()
+        if self.cache.get(cache_key) is fu:
+          del self.cache[cache_key]
+        # let it clean up
+        await asyncio.wait([fu])
+      raise
+    finally:
+      self.waiters[cache_key] -= 1
+      if not self.waiters[cache_key]:
+        del self.waiters[cache_key]
+    self.cache[cache_key] = r
+    return r
 
 if TYPE_CHECKING:
   from typing_extensions import Protocol
@@ -300,11 +350,17 @@ class FunctionWorker(BaseWorker):
     futures = []
     for name, entry in self.tasks:
       ctx = contextvars.copy_context()
-      fu = ctx.run(self.run_one, name, entry)
+      fu = asyncio.ensure_future(ctx.run(self.run_one, name, entry))
       futures.append(fu)
 
-    for fu2 in asyncio.as_completed(futures):
-      await fu2
+    try:
+      for fu2 in asyncio.as_completed(futures):
+        await fu2
+    finally:
+      # when cancelled
+      for fu in futures:
+        fu.cancel()
+      await asyncio.wait(futures)
 
   async def run_one(
     self, name: str, entry: Entry,
@@ -329,15 +385,28 @@ class FunctionWorker(BaseWorker):
     if verify_cert is not None:
       ctx_verify_cert.set(verify_cert)
 
+    timeout = entry.get('timeout', None)
+
+    timer = EntryTimer(name)
     try:
       async with self.task_sem:
-        version = await self.func(
+        timer.acquired()
+        coro = self.func(
           name, entry,
           cache = self.cache,
           keymanager = self.keymanager,
         )
+        if timeout is None:
+          version = await coro
+        else:
+          try:
+            version = await asyncio.wait_for(coro, timeout)
+          except asyncio.TimeoutError:
+            raise GetVersionError('timed out', timeout=timeout) from None
+      timer.finish()
       await self.result_q.put(RawResult(name, version, entry))
     except Exception as e:
+      timer.finish()
       await self.result_q.put(RawResult(name, e, entry))
 
 class GetVersionError(Exception):
@@ -351,3 +420,70 @@ class GetVersionError(Exception):
   def __init__(self, msg: LiteralString, **kwargs: Any) -> None:
     self.msg = msg
     self.kwargs = kwargs
+
+def _make_decompressor(kind: str) -> Any:
+  if kind == 'xz':
+    import lzma
+    return lzma.LZMADecompressor()
+  elif kind == 'gz':
+    import zlib
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+  elif kind == 'zst':
+    try:
+      # Python 3.14+
+      zstd = importlib.import_module('compression.zstd')
+      return zstd.ZstdDecompressor()
+    except ImportError:
+      import zstandard
+      return zstandard.ZstdDecompressor().decompressobj()
+  else:
+    raise ValueError('unsupported compression format', kind)
+
+async def decompress_stream(
+  chunks: AsyncIterable[bytes], kind: Optional[str],
+) -> AsyncIterator[bytes]:
+  '''Decompress chunks of data incrementally.
+
+  :param kind: ``xz``, ``gz``, ``zst``, or ``None`` for uncompressed data.
+    Use :func:`compression_of` to get it from a URL.
+  '''
+  if kind is None:
+    async for chunk in chunks:
+      yield chunk
+    return
+
+  d = _make_decompressor(kind)
+  async for chunk in chunks:
+    while chunk:
+      out = d.decompress(chunk)
+      if out:
+        yield out
+      chunk = b''
+      if d.eof:
+        # concatenated streams
+        chunk = d.unused_data
+        if chunk:
+          d = _make_decompressor(kind)
+
+def compression_of(url: str) -> Optional[str]:
+  '''Return the compression format of a file by its name, or None.'''
+  for suffix in ('xz', 'gz', 'zst'):
+    if url.endswith('.' + suffix):
+      return suffix
+  return None
+
+async def iter_lines(
+  chunks: AsyncIterable[bytes], encoding: str = 'utf-8',
+) -> AsyncIterator[str]:
+  '''Split chunks of data into lines (without line endings).'''
+  decoder = codecs.getincrementaldecoder(encoding)()
+  pending = ''
+  async for chunk in chunks:
+    text = pending + decoder.decode(chunk)
+    lines = text.split('\n')
+    pending = lines.pop()
+    for line in lines:
+      yield line
+  pending += decoder.decode(b'', final=True)
+  if pending:
+    yield pending
@@ -3,25 +3,57 @@
 
 from __future__ import annotations
 
-import re
 import asyncio
-from typing import Dict, Tuple
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Tuple, IO, Optional, Any, cast
 import itertools
-import functools
-from collections import defaultdict
+
+import platformdirs
+import structlog
 
 from nvchecker.api import (
   session, GetVersionError, VersionResult,
   RichResult, Entry, AsyncCache, KeyManager,
+  compression_of, sort_version_keys,
 )
 
+logger = structlog.get_logger(logger_name=__name__)
+
+dpkg_version = sort_version_keys['dpkg']
+
 APT_RELEASE_URL = "%s/dists/%s/Release"
 APT_PACKAGES_PATH = "%s/binary-%s/Packages%s"
 APT_PACKAGES_URL = "%s/dists/%s/%s"
 APT_PACKAGES_SUFFIX_PREFER = (".xz", ".gz", "")
 
 DpkgVersion = Tuple[int, str, str]
+PackagesIndex = Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]
+
+# where to keep the parsed Packages files, by their SHA256 sums
+INDEX_CACHE: Optional[Path] = None
+# bump when the format of the stored indexes changes; others are ignored
+INDEX_VERSION = 1
 
+def configure(config):
+  global INDEX_CACHE
+  index_cache = config.get('index_cache', False)
+  if index_cache is True:
+    INDEX_CACHE = Path(platformdirs.user_cache_dir(appname='nvchecker')) / 'apt'
+  elif index_cache:
+    INDEX_CACHE = Path(os.path.expandvars(os.path.expanduser(index_cache)))
+  else:
+    INDEX_CACHE = None
+
+# cmp-style comparing, kept for compatibility; dpkg_version is much faster for
+# finding the latest of many versions
 def parse_version(s: str) -> DpkgVersion:
   try:
     epoch_str, rest = s.split(':', 1)
@@ -74,56 +106,123 @@ def compare_version(a: str, b: str) -> int:
   vb = parse_version(b)
   return compare_version_parsed(va, vb)
 
-def _decompress_data(url: str, data: bytes) -> str:
-  if url.endswith(".xz"):
-    import lzma
-    data = lzma.decompress(data)
-  elif url.endswith(".gz"):
-    import gzip
-    data = gzip.decompress(data)
-
-  return data.decode('utf-8')
-
 async def get_url(url: str) -> str:
   res = await session.get(url)
-  data = res.body
-  loop = asyncio.get_running_loop()
-  return await loop.run_in_executor(
-    None, _decompress_data,
-    url, data)
+  return res.body.decode('utf-8')
+
+def parse_release_sha256(release: str) -> Dict[str, str]:
+  '''Return the SHA256 sums of the files listed in a Release file.'''
+  ret = {}
+  in_section = False
+  for line in release.split('\n'):
+    if line.startswith(' '):
+      if in_section:
+        parts = line.split()
+        if len(parts) == 3:
+          ret[parts[2]] = parts[0]
+    else:
+      in_section = line.rstrip() == 'SHA256:'
+  return ret
 
-async def parse_packages(key: Tuple[AsyncCache, str]) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
-  cache, url = key
-  apt_packages = await cache.get(url, get_url) # type: ignore
+def _open_packages(f: IO[bytes], kind: Optional[str]) -> IO[bytes]:
+  f.seek(0)
+  if kind == 'xz':
+    return cast(IO[bytes], lzma.open(f))
+  elif kind == 'gz':
+    return cast(IO[bytes], gzip.open(f))
+  else:
+    return f
 
-  pkg_map = defaultdict(list)
-  srcpkg_map = defaultdict(list)
-  pkg_to_src_map = defaultdict(list)
+def _parse_packages(f: IO[bytes], kind: Optional[str]) -> PackagesIndex:
+  # (version, sort key, source package) of the latest ones
+  pkg_max: Dict[str, Tuple[str, Any, str]] = {}
+  srcpkg_max: Dict[str, Tuple[str, Any]] = {}
 
   pkg = None
   srcpkg = None
-  for line in apt_packages.split('\n'):
-    if line.startswith("Package: "):
-      pkg = line[9:]
-    elif line.startswith("Source: "):
-      srcpkg = line[8:]
-    elif line.startswith("Version: "):
-      version = line[9:]
-      if pkg is not None:
-        pkg_map[pkg].append(version)
-        pkg_to_src_map["%s/%s" % (pkg, version)] = srcpkg if srcpkg is not None else pkg
-      if srcpkg is not None:
-        srcpkg_map[srcpkg].append(version)
-      pkg = srcpkg = None
-
-  pkg_map_max = {pkg: max(vs, key=functools.cmp_to_key(compare_version))
-                 for pkg, vs in pkg_map.items()}
-  srcpkg_map_max = {pkg: max(vs, key=functools.cmp_to_key(compare_version))
-                 for pkg, vs in srcpkg_map.items()}
-  pkg_to_src_map_max = {pkg: pkg_to_src_map["%s/%s" % (pkg, vs)]
-                 for pkg, vs in pkg_map_max.items()}
-
-  return pkg_map_max, srcpkg_map_max, pkg_to_src_map_max
+  with io.TextIOWrapper(_open_packages(f, kind), encoding='utf-8') as lines:
+    for line in lines:
+      if line.startswith("Package: "):
+        pkg = line[9:].rstrip('\n')
+      elif line.startswith("Source: "):
+        srcpkg = line[8:].rstrip('\n')
+      elif line.startswith("Version: "):
+        version = line[9:].rstrip('\n')
+        key = dpkg_version(version)
+        if pkg is not None:
+          old = pkg_max.get(pkg)
+          if old is None or key > old[1]:
+            pkg_max[pkg] = version, key, srcpkg if srcpkg is not None else pkg
+        if srcpkg is not None:
+          old_src = srcpkg_max.get(srcpkg)
+          if old_src is None or key > old_src[1]:
+            srcpkg_max[srcpkg] = version, key
+        pkg = srcpkg = None
+
+  return (
+    {pkg: v[0] for pkg, v in pkg_max.items()},
+    {pkg: v[0] for pkg, v in srcpkg_max.items()},
+    {pkg: v[2] for pkg, v in pkg_max.items()},
+  )
+
+def _load_index(path: Path) -> Optional[PackagesIndex]:
+  try:
+    with open(path) as f:
+      data = json.load(f)
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+      return None
+    return data['pkgs'], data['srcpkgs'], data['pkg_to_src']
+  except FileNotFoundError:
+    return None
+  except (OSError, ValueError, KeyError) as e:
+    logger.warning('failed to load cached Packages index',
+                   path=str(path), error=repr(e))
+    return None
+
+def _store_index(path: Path, index: PackagesIndex) -> None:
+  pkgs, srcpkgs, pkg_to_src = index
+  data = {
+    'version': INDEX_VERSION,
+    'pkgs': pkgs, 'srcpkgs': srcpkgs, 'pkg_to_src': pkg_to_src,
+  }
+  try:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+      json.dump(data, f)
+    os.replace(tmp, path)
+  except OSError as e:
+    logger.warning('failed to store Packages index',
+                   path=str(path), error=repr(e))
+
+async def parse_packages(info: Tuple[str, Optional[str]]) -> PackagesIndex:
+  url, sha256 = info
+  loop = asyncio.get_running_loop()
+
+  path = None
+  if INDEX_CACHE is not None and sha256 is not None:
+    path = INDEX_CACHE / f'{sha256}.json'
+    index = await loop.run_in_executor(None, _load_index, path)
+    if index is not None:
+      return index
+
+  # Download to a temporary file and parse it in a thread, so that other
+  # checks go on meanwhile
+  h = hashlib.sha256()
+  with tempfile.TemporaryFile() as f:
+    async with session.stream(url) as res:
+      async for chunk in res:
+        h.update(chunk)
+        f.write(chunk)
+
+    index = await loop.run_in_executor(
+      None, _parse_packages, f, compression_of(url))
+
+  # the Release file may be outdated
+  if path is not None and h.hexdigest() == sha256:
+    await loop.run_in_executor(None, _store_index, path, index)
+
+  return index
 
 async def get_version(
   name: str, conf: Entry, *,
@@ -145,6 +244,7 @@ async def get_version(
 
   apt_release = await cache.get(
     APT_RELEASE_URL % (mirror, suite), get_url) # type: ignore
+  sha256s = parse_release_sha256(apt_release)
   for suffix in APT_PACKAGES_SUFFIX_PREFER:
     packages_path = APT_PACKAGES_PATH % (repo, arch, suffix)
     if " " + packages_path in apt_release:
@@ -153,7 +253,9 @@ async def get_version(
     raise GetVersionError('Packages file not found in APT repository')
 
   pkg_map, srcpkg_map, pkg_to_src_map = await cache.get(
-    (cache, APT_PACKAGES_URL % (mirror, suite, packages_path)), parse_packages) # type: ignore
+    (APT_PACKAGES_URL % (mirror, suite, packages_path),
+     sha256s.get(packages_path)),
+    parse_packages) # type: ignore
 
   if pkg and pkg in pkg_map:
     version = pkg_map[pkg]
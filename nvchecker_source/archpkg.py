@@ -1,25 +1,102 @@
 # MIT licensed
 # Copyright (c) 2013-2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
+import asyncio
+import tarfile
+import tempfile
+from typing import Dict, List, IO, Any, Optional
+
 from nvchecker.api import session, RichResult, GetVersionError
 
 URL = 'https://archlinux.org/packages/search/json/'
 
+# set to use the repository databases from a mirror instead of the API
+MIRROR: Optional[str] = None
+REPOS = ['core', 'extra', 'multilib']
+ARCH = 'x86_64'
+
+def configure(config):
+  global MIRROR, REPOS, ARCH
+  MIRROR = config.get('mirror')
+  if MIRROR and '$repo' not in MIRROR:
+    MIRROR = MIRROR.rstrip('/') + '/$repo/os/$arch'
+  REPOS = config.get('repos', ['core', 'extra', 'multilib'])
+  ARCH = config.get('arch', 'x86_64')
+
 async def request(pkg):
   res = await session.get(URL, params={"name": pkg})
   return res.json()
 
+def _parse_desc(text: str) -> Dict[str, List[str]]:
+  ret = {}
+  for block in text.split('\n\n'):
+    lines = block.strip('\n').split('\n')
+    if lines[0].startswith('%'):
+      ret[lines[0].strip('%')] = lines[1:]
+  return ret
+
+def _parse_db(f: IO[bytes], repo: str) -> Dict[str, Dict[str, Any]]:
+  f.seek(0)
+  pkgs = {}
+  # Read the archive as a stream to avoid seeking back and forth
+  with tarfile.open(mode='r|*', fileobj=f) as archive:
+    for member in archive:
+      if not member.name.endswith('/desc'):
+        continue
+      fp = archive.extractfile(member)
+      assert fp is not None
+      desc = _parse_desc(fp.read().decode('utf-8'))
+      # fields are named as in the API results
+      pkgver, pkgrel = desc['VERSION'][0].rsplit('-', 1)
+      name = desc['NAME'][0]
+      pkgs[name] = {
+        'repo': repo,
+        'arch': desc['ARCH'][0],
+        'pkgname': name,
+        'pkgver': pkgver.split(':', 1)[-1],
+        'pkgrel': pkgrel,
+        'provides': desc.get('PROVIDES', []),
+      }
+  return pkgs
+
+async def get_db(info):
+  url, repo = info
+  # Download the file to a temporary file rather than into memory
+  with tempfile.TemporaryFile() as f:
+    async with session.stream(url) as res:
+      async for chunk in res:
+        f.write(chunk)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _parse_db, f, repo)
+
+async def find_in_dbs(pkg, cache):
+  assert MIRROR is not None
+  urls = [
+    MIRROR.replace('$repo', repo).replace('$arch', ARCH) + f'/{repo}.db'
+    for repo in REPOS
+  ]
+  # databases are downloaded once and shared by all entries
+  dbs = await asyncio.gather(*(
+    cache.get((url, repo), get_db) for url, repo in zip(urls, REPOS)
+  ))
+  return [db[pkg] for db in dbs if pkg in db]
+
 async def get_version(name, conf, *, cache, **kwargs):
   pkg = conf.get('archpkg') or name
   strip_release = conf.get('strip_release', False)
   provided = conf.get('provided')
 
-  data = await cache.get(pkg, request)
+  if MIRROR:
+    results = await find_in_dbs(pkg, cache)
+  else:
+    data = await cache.get(pkg, request)
+    results = [r for r in data['results'] if r['repo'] != 'testing']
 
-  if not data['results']:
+  if not results:
     raise GetVersionError('Arch package not found')
 
-  r = [r for r in data['results'] if r['repo'] != 'testing'][0]
+  r = results[0]
 
   if provided:
     provides = dict(x.split('=', 1) for x in r['provides'] if '=' in x)
@@ -3,14 +3,32 @@
 
 from datetime import datetime, timezone
 import asyncio
-from typing import Iterable, Dict, List, Tuple, Any, Optional
+import codecs
+import json
+import re
+from typing import (
+  Iterable, Dict, List, Tuple, Any, Optional, Set,
+  AsyncIterable, AsyncIterator,
+)
+
+import structlog
 
 from nvchecker.api import (
   session, GetVersionError, VersionResult, RichResult,
-  Entry, BaseWorker, RawResult,
+  Entry, BaseWorker, RawResult, TemporaryError, HTTPError,
+  decompress_stream,
 )
 
+logger = structlog.get_logger(logger_name=__name__)
+
 AUR_URL = 'https://aur.archlinux.org/rpc/'
+AUR_DUMP_URL = 'https://aur.archlinux.org/packages-meta-v1.json.gz'
+
+USE_DUMP = False
+
+def configure(config):
+  global USE_DUMP
+  USE_DUMP = config.get('use_dump', False)
 
 class AurResults:
   cache: Dict[str, Optional[Dict[str, Any]]]
@@ -22,23 +40,97 @@ class AurResults:
     self,
     aurnames: Iterable[str],
   ) -> Dict[str, Optional[Dict[str, Any]]]:
+    cache = self.cache
     params = [('v', '5'), ('type', 'info')]
     params.extend(('arg[]', name) for name in aurnames
-                  if name not in self.cache)
-    res = await session.get(AUR_URL, params=params)
-    data = res.json()
-    new_results = {r['Name']: r for r in data['results']}
-
-    cache = self.cache
-    cache.update(new_results)
-    cache.update(
-      (name, None)
-      for name in set(aurnames) - new_results.keys()
-    )
+                  if name not in cache)
+    if len(params) > 2:
+      res = await session.get(AUR_URL, params=params)
+      data = res.json()
+      new_results = {r['Name']: r for r in data['results']}
+
+      cache.update(new_results)
+      cache.update(
+        (name, None)
+        for name in set(aurnames) - new_results.keys()
+      )
 
     return {name: cache[name] for name in aurnames
             if name in cache}
 
+  async def load_dump(self, aurnames: Set[str]) -> None:
+    '''Get ``aurnames`` from the metadata dump of all packages.
+
+    Packages not in the dump are left for :meth:`get_multiple`.
+    '''
+    async with session.stream(AUR_DUMP_URL) as res:
+      async for r in _iter_json_objects(_maybe_gunzip(res)):
+        name = r.get('Name')
+        if name in aurnames:
+          self.cache[name] = {
+            'Name': name,
+            'Version': r['Version'],
+            'LastModified': r['LastModified'],
+          }
+
+async def _maybe_gunzip(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+  # the dump may be sent with "Content-Encoding: gzip" and decompressed by
+  # the HTTP client already
+  it = chunks.__aiter__()
+  first = b''
+  while len(first) < 2:
+    try:
+      first += await it.__anext__()
+    except StopAsyncIteration:
+      break
+
+  async def all_chunks() -> AsyncIterator[bytes]:
+    yield first
+    async for chunk in it:
+      yield chunk
+
+  kind = 'gz' if first.startswith(b'\x1f\x8b') else None
+  async for chunk in decompress_stream(all_chunks(), kind):
+    yield chunk
+
+_json_decoder = json.JSONDecoder()
+_json_separator = re.compile(r'[\s,]*')
+
+async def _iter_json_objects(
+  chunks: AsyncIterable[bytes],
+) -> AsyncIterator[Dict[str, Any]]:
+  '''Parse a JSON array of objects incrementally and yield the objects.'''
+  decoder = codecs.getincrementaldecoder('utf-8')()
+  buf = ''
+  pos = 0
+  started = False
+  async for chunk in chunks:
+    buf = buf[pos:] + decoder.decode(chunk)
+    pos = 0
+    if not started:
+      buf = buf.lstrip()
+      if not buf:
+        continue
+      if buf[0] != '[':
+        raise ValueError('not a JSON array')
+      pos = 1
+      started = True
+
+    while True:
+      pos = _json_separator.match(buf, pos).end() # type: ignore[union-attr]
+      if pos == len(buf) or buf[pos] == ']':
+        break
+      try:
+        obj, pos2 = _json_decoder.raw_decode(buf, pos)
+      except json.JSONDecodeError:
+        # incomplete; wait for more data
+        break
+      pos = pos2
+      yield obj
+
+  if (buf[pos:] + decoder.decode(b'', final=True)).strip() != ']':
+    raise ValueError('incomplete JSON array')
+
 class Worker(BaseWorker):
   # https://wiki.archlinux.org/index.php/Aurweb_RPC_interface#Limitations
   batch_size = 100
@@ -50,6 +142,9 @@ class Worker(BaseWorker):
       n_batch += 1
 
     aur_results = AurResults()
+    if USE_DUMP:
+      async with self.task_sem:
+        tasks = await self._load_dump(aur_results)
 
     ret = []
     for i in range(n_batch):
@@ -60,6 +155,25 @@ class Worker(BaseWorker):
 
     await asyncio.gather(*ret)
 
+  async def _load_dump(
+    self, aur_results: AurResults,
+  ) -> List[Tuple[str, Entry]]:
+    '''Load the dump and return the tasks, with those not found last.'''
+    tasks = self.tasks
+    try:
+      await aur_results.load_dump({
+        conf.get('aur', name) for name, conf in tasks
+      })
+    except (TemporaryError, HTTPError, ValueError) as e:
+      logger.warning('failed to load the AUR metadata dump, using RPC',
+                     error=repr(e))
+      return tasks
+
+    # packages not in the dump (e.g. just submitted) are grouped into as few
+    # RPC requests as possible
+    cache = aur_results.cache
+    return sorted(tasks, key=lambda t: t[1].get('aur', t[0]) not in cache)
+
   async def _run_batch(
     self,
     batch: List[Tuple[str, Entry]],
@@ -1,7 +1,10 @@
 # MIT licensed
 # Copyright (c) 2013-2020,2025 lilydjwg <lilydjwg@gmail.com>, et al.
 
+import os
+import signal
 import asyncio
+import contextlib
 from functools import partial
 
 import structlog
@@ -21,23 +24,32 @@ async def run_cmd(name: str, cmd: str, timeout: int = 60) -> str:
     cmd,
     stdout=asyncio.subprocess.PIPE,
     stderr=asyncio.subprocess.PIPE,
+    start_new_session=True,
   )
 
-  if hasattr(asyncio, 'timeout'):
-    # Python 3.11+
-    try:
-      async with asyncio.timeout(timeout):
-        output, error = await p.communicate()
-        output_s = output.strip().decode('latin1')
-        error_s = error.strip().decode(errors='replace')
-    except TimeoutError:
-      p.terminate()
-      await p.wait()
-      raise GetVersionError('command timed out', cmd=cmd)
-  else:
-    output, error = await p.communicate()
-    output_s = output.strip().decode('latin1')
-    error_s = error.strip().decode(errors='replace')
+  try:
+    if hasattr(asyncio, 'timeout'):
+      # Python 3.11+
+      try:
+        async with asyncio.timeout(timeout):
+          output, error = await p.communicate()
+          output_s = output.strip().decode('latin1')
+          error_s = error.strip().decode(errors='replace')
+      except TimeoutError:
+        p.terminate()
+        await p.wait()
+        raise GetVersionError('command timed out', cmd=cmd)
+    else:
+      output, error = await p.communicate()
+      output_s = output.strip().decode('latin1')
+      error_s = error.strip().decode(errors='replace')
+  except asyncio.CancelledError:
+    # e.g. the entry's timeout or the deadline of the run
+    # kill its children too, which may keep the pipes open
+    with contextlib.suppress(ProcessLookupError):
+      os.killpg(p.pid, signal.SIGKILL)
+    await p.wait()
+    raise
 
   if p.returncode != 0:
     raise GetVersionError(
@@ -2,8 +2,12 @@
 # Copyright (c) 2013-2020, 2024 lilydjwg <lilydjwg@gmail.com>, et al.
 
 import time
+import json
 from urllib.parse import urlencode
-from typing import List, Tuple, Union, Optional
+from typing import (
+  List, Tuple, Union, Optional, Dict, Any, Sequence, Mapping,
+)
+from collections import defaultdict
 import asyncio
 
 import structlog
@@ -11,10 +15,13 @@ import structlog
 from nvchecker.api import (
   VersionResult, Entry, AsyncCache, KeyManager,
   HTTPError, session, RichResult, GetVersionError,
+  FunctionWorker, RawResult, Response, shortest_timeout,
 )
 
-ALLOW_REQUEST = None
-RATE_LIMITED_ERROR = False
+logger = structlog.get_logger(logger_name=__name__)
+
+# wait for the rate limit to reset instead of failing the remaining entries
+WAIT_FOR_RATELIMIT_RESET = False
 
 GITHUB_URL = 'https://api.%s/repos/%s/commits'
 GITHUB_LATEST_RELEASE = 'https://api.%s/repos/%s/releases/latest'
@@ -22,36 +29,208 @@ GITHUB_LATEST_RELEASE = 'https://api.%s/repos/%s/releases/latest'
 GITHUB_MAX_TAG = 'https://api.%s/repos/%s/git/refs/tags'
 GITHUB_MAX_RELEASE = 'https://api.%s/repos/%s/releases'
 GITHUB_GRAPHQL_URL = 'https://api.%s/graphql'
+# max number of repositories to query in one GraphQL request
+GRAPHQL_BATCH_SIZE = 50
+
+class RateLimit:
+  '''The rate limit budget of one API resource for one token.
+
+  The budget is updated from the ``X-RateLimit-*`` headers of every response.
+  When more requests are expected than the remaining budget allows, requests
+  are spread out so that the budget lasts until it resets.
+  '''
+  def __init__(self) -> None:
+    self.remaining: Optional[int] = None
+    self.reset = 0.0
+    # number of requests expected to be made (shared among tokens)
+    self.pending = 0.0
+    # number of requests sent
+    self.sent = 0
+    # requests sent but not answered yet; their part of the remaining budget
+    # is reserved until the response tells how much is left
+    self.in_flight = 0
+    self._next_slot = 0.0
+    self._waiters: List[asyncio.Future] = []
+
+  def update(self, headers: Mapping[str, str]) -> None:
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None:
+      return
+    n, t = int(remaining), float(reset)
+    if self.remaining is not None:
+      if t < self.reset:
+        # from before the last reset
+        return
+      if t == self.reset:
+        # responses may arrive out of order (or be shared or cached), but the
+        # budget only goes down until it's reset
+        n = min(n, self.remaining)
+    self.remaining = n
+    self.reset = t
+
+  def pause(self, seconds: float) -> None:
+    '''Don't send any request in the next ``seconds`` seconds.'''
+    self._next_slot = max(self._next_slot, time.time() + seconds)
+
+  async def acquire(self) -> None:
+    '''Wait until a request can be sent, and reserve the budget for it.
+
+    Call :meth:`release` when the request is done.
+    '''
+    while True:
+      now = time.time()
+      if self.remaining is not None and now >= self.reset:
+        # the budget has been reset; we'll know it with the next response
+        self.remaining = None
+
+      slot = max(now, self._next_slot)
+      if self.remaining is None or slot >= self.reset:
+        # unknown budget, or the request will be sent after the reset
+        pass
+      elif self.remaining == 0:
+        if not WAIT_FOR_RATELIMIT_RESET:
+          raise GetVersionError(
+            'rate limited', reset = time.ctime(self.reset))
+        logger.warning('rate limited, waiting for reset',
+                       reset = time.ctime(self.reset))
+        await asyncio.sleep(self.reset - now + 1)
+        continue
+      elif self.remaining <= self.in_flight:
+        # the rest is reserved; wait for a response to know what's left
+        fu = asyncio.get_running_loop().create_future()
+        self._waiters.append(fu)
+        await fu
+        continue
+      elif self.pending > self.remaining - self.in_flight:
+        self._next_slot = slot + (
+          (self.reset - now) / (self.remaining - self.in_flight))
+      self.sent += 1
+      self.in_flight += 1
+
+      if slot > now:
+        try:
+          await asyncio.sleep(slot - now)
+        except BaseException:
+          self.release()
+          raise
+      return
+
+  def release(self, headers: Optional[Mapping[str, str]] = None) -> None:
+    '''Release the budget reserved by :meth:`acquire`, updating it from the
+    response ``headers`` if any.'''
+    self.in_flight -= 1
+    if headers is not None:
+      self.update(headers)
+    waiters, self._waiters = self._waiters, []
+    for fu in waiters:
+      if not fu.done():
+        fu.set_result(None)
+
+# tokens to use for a request; empty for anonymous access
+Tokens = Tuple[str, ...]
+
+# (host, token, resource) -> RateLimit
+RATE_LIMITS: Dict[Tuple[str, Optional[str], str], RateLimit] = {}
+
+def get_ratelimit(host: str, token: Optional[str], resource: str) -> RateLimit:
+  key = host.lower(), token, resource
+  limit = RATE_LIMITS.get(key)
+  if limit is None:
+    limit = RATE_LIMITS[key] = RateLimit()
+  return limit
+
+def _token_order(limit: RateLimit) -> Tuple[int, float]:
+  if limit.remaining is None:
+    # unknown (probably full) budget; spread the first requests
+    return 0, limit.sent
+  elif limit.remaining > 0:
+    return 1, -limit.remaining
+  else:
+    return 2, limit.reset
 
-async def get_version(name, conf, **kwargs):
-  global RATE_LIMITED_ERROR, ALLOW_REQUEST
+def pick_token(
+  host: str, tokens: Tokens, resource: str,
+) -> Optional[str]:
+  '''Pick the token with the most remaining budget from ``tokens``.'''
+  if not tokens:
+    return None
+  return min(
+    tokens,
+    key = lambda t: _token_order(get_ratelimit(host, t, resource)),
+  )
 
-  if RATE_LIMITED_ERROR:
-    raise RuntimeError('rate limited')
+def expect_requests(
+  host: str, tokens: Tokens, resource: str, n: int,
+) -> None:
+  '''Tell the rate limiters that ``n`` requests are to be made, or with a
+  negative ``n``, that they are done (whether sent or not).'''
+  limits = [get_ratelimit(host, token, resource) for token in tokens or (None,)]
+  for limit in limits:
+    limit.pending = max(0.0, limit.pending + n / len(limits))
+
+async def _send_request(
+  limit: RateLimit, token: Optional[str], resource: str,
+  url: str, headers: Dict[str, str], kwargs: Dict[str, Any],
+) -> Response:
+  await limit.acquire()
+  if token:
+    scheme = 'bearer' if resource == 'graphql' else 'token'
+    headers = {**headers, 'Authorization': f'{scheme} {token}'}
+  res_headers = None
+  try:
+    # rate limited requests are retried here
+    res = await session.request(
+      url, headers=headers, retry_rate_limited=False, **kwargs)
+    res_headers = res.headers
+    return res
+  except HTTPError as e:
+    if e.response:
+      res_headers = e.response.headers
+    raise
+  finally:
+    limit.release(res_headers)
+
+async def github_request(
+  host: str, tokens: Tokens, resource: str,
+  url: str, *, headers: Dict[str, str], **kwargs,
+) -> Response:
+  '''Send a request to the GitHub API, respecting its rate limits.
+
+  ``resource`` is the rate limit category, "core" or "graphql". One of
+  ``tokens`` (if any) is picked for every request by remaining budget. A
+  rate limited request is retried once, after the wait the response asks for
+  (or for the reset with ``wait_for_ratelimit_reset``).
+  '''
+  token = pick_token(host, tokens, resource)
+  limit = get_ratelimit(host, token, resource)
+  try:
+    return await _send_request(limit, token, resource, url, headers, kwargs)
+  except HTTPError as e:
+    if e.code not in [403, 429] or not e.response:
+      raise
+    if n := check_ratelimit(e, host):
+      limit.pause(n+1)
+    elif not WAIT_FOR_RATELIMIT_RESET:
+      raise
 
-  if ALLOW_REQUEST is None:
-    ALLOW_REQUEST = asyncio.Event()
-    ALLOW_REQUEST.set()
+  # maybe with another token
+  token = pick_token(host, tokens, resource)
+  limit = get_ratelimit(host, token, resource)
+  return await _send_request(limit, token, resource, url, headers, kwargs)
 
-  for _ in range(2): # retry once
-    try:
-      await ALLOW_REQUEST.wait()
-      return await get_version_real(name, conf, **kwargs)
-    except HTTPError as e:
-      if e.code in [403, 429]:
-        if n := check_ratelimit(e, name):
-          ALLOW_REQUEST.clear()
-          await asyncio.sleep(n+1)
-          ALLOW_REQUEST.set()
-          continue
-        RATE_LIMITED_ERROR = True
-      raise
+async def _get_json(
+  key: Tuple[str, Tokens, str, Tuple[Tuple[str, str], ...]],
+) -> Any:
+  host, tokens, url, headers = key
+  res = await github_request(
+    host, tokens, 'core', url, method='GET', headers=dict(headers))
+  return res.json()
 
 QUERY_LATEST_TAG = '''
-{{
-  repository(name: "{name}", owner: "{owner}") {{
+  {alias}: repository(name: {name}, owner: {owner}) {{
     refs(refPrefix: "refs/tags/", first: 1,
-         query: "{query}",
+         query: {query},
          orderBy: {{field: TAG_COMMIT_DATE, direction: DESC}}) {{
       edges {{
         node {{
@@ -72,13 +251,11 @@ QUERY_LATEST_TAG = '''
       }}
     }}
   }}
-}}
 '''
 # Do not use "orderBy: {field: CREATED_AT, direction: DESC}" here; it orders
 # releases by tag creation time, not published time
 QUERY_LATEST_RELEASE_WITH_PRERELEASES = '''
-{{
-  repository(name: "{name}", owner: "{owner}") {{
+  {alias}: repository(name: {name}, owner: {owner}) {{
     releases(first: 1) {{
       edges {{
         node {{
@@ -96,32 +273,82 @@ QUERY_LATEST_RELEASE_WITH_PRERELEASES = '''
       }}
     }}
   }}
-}}
 '''
 
-async def get_latest_tag(key: Tuple[str, str, str, str]) -> RichResult:
-  host, repo, query, token = key
-  owner, reponame = repo.split('/')
+# (kind, repo, query or use_release_name)
+GraphQLItem = Tuple[str, str, Union[str, bool]]
+
+def configure(config):
+  global GRAPHQL_BATCH_SIZE, WAIT_FOR_RATELIMIT_RESET
+  batch_size = config.get('graphql_batch_size')
+  if batch_size:
+    GRAPHQL_BATCH_SIZE = batch_size
+  WAIT_FOR_RATELIMIT_RESET = config.get('wait_for_ratelimit_reset', False)
+
+def _graphql_query(items: Sequence[GraphQLItem]) -> str:
+  parts = []
+  for i, (kind, repo, arg) in enumerate(items):
+    owner, reponame = repo.split('/')
+    if kind == 'tag':
+      part = QUERY_LATEST_TAG.format(
+        alias = f'r{i}',
+        owner = json.dumps(owner),
+        name = json.dumps(reponame),
+        query = json.dumps(arg),
+      )
+    else:
+      part = QUERY_LATEST_RELEASE_WITH_PRERELEASES.format(
+        alias = f'r{i}',
+        owner = json.dumps(owner),
+        name = json.dumps(reponame),
+      )
+    parts.append(part)
+  return '{' + ''.join(parts) + '}\n'
+
+async def query_graphql(
+  host: str, tokens: Tokens, items: Sequence[GraphQLItem],
+) -> List[Union[RichResult, Exception]]:
+  '''Query many repositories in one GraphQL request.
+
+  Results are returned in the order of ``items``.
+  '''
   headers = {
-    'Authorization': f'bearer {token}',
     'Content-Type': 'application/json',
   }
-  q = QUERY_LATEST_TAG.format(
-    owner = owner,
-    name = reponame,
-    query = query,
-  )
-
-  res = await session.post(
+  res = await github_request(
+    host, tokens, 'graphql',
     GITHUB_GRAPHQL_URL % host,
+    method = 'POST',
     headers = headers,
-    json = {'query': q},
+    json = {'query': _graphql_query(items)},
   )
   j = res.json()
+  data = j.get('data') or {}
+
+  errors: Dict[str, str] = {}
+  for e in j.get('errors', ()):
+    if path := e.get('path'):
+      errors[path[0]] = e.get('message')
+
+  ret: List[Union[RichResult, Exception]] = []
+  for i, (kind, repo, arg) in enumerate(items):
+    alias = f'r{i}'
+    repository = data.get(alias)
+    if repository is None:
+      ret.append(GetVersionError(
+        'failed to query repository', repo=repo, error=errors.get(alias)))
+    elif kind == 'tag':
+      ret.append(_parse_latest_tag(repo, repository))
+    else:
+      ret.append(_parse_latest_release(repo, repository, bool(arg)))
+  return ret
 
-  refs = j['data']['repository']['refs']['edges']
+def _parse_latest_tag(
+  repo: str, repository: Dict[str, Any],
+) -> Union[RichResult, Exception]:
+  refs = repository['refs']['edges']
   if not refs:
-    raise GetVersionError('no tag found')
+    return GetVersionError('no tag found')
 
   node = refs[0]['node']
   target = node['target']
@@ -145,28 +372,12 @@ async def get_latest_tag(key: Tuple[str, str, str, str]) -> RichResult:
     revision_creation_time = revision_creation_time,
   )
 
-async def get_latest_release_with_prereleases(key: Tuple[str, str, str, str]) -> RichResult:
-  host, repo, token, use_release_name = key
-  owner, reponame = repo.split('/')
-  headers = {
-    'Authorization': f'bearer {token}',
-    'Content-Type': 'application/json',
-  }
-  q = QUERY_LATEST_RELEASE_WITH_PRERELEASES.format(
-    owner = owner,
-    name = reponame,
-  )
-
-  res = await session.post(
-    GITHUB_GRAPHQL_URL % host,
-    headers = headers,
-    json = {'query': q},
-  )
-  j = res.json()
-
-  refs = j['data']['repository']['releases']['edges']
+def _parse_latest_release(
+  repo: str, repository: Dict[str, Any], use_release_name: bool,
+) -> Union[RichResult, Exception]:
+  refs = repository['releases']['edges']
   if not refs:
-    raise GetVersionError('no release found')
+    return GetVersionError('no release found')
 
   node = refs[0]['node']
   tag_name = node['tag']['name']
@@ -185,37 +396,131 @@ async def get_latest_release_with_prereleases(key: Tuple[str, str, str, str]) ->
     revision_creation_time = node['tagCommit'].get('committedDate'),
   )
 
-async def get_version_real(
+async def _query_one(host: str, tokens: Tokens, item: GraphQLItem) -> RichResult:
+  r = (await query_graphql(host, tokens, [item]))[0]
+  if isinstance(r, Exception):
+    raise r
+  return r
+
+async def get_latest_tag(key: Tuple[str, str, str, Tokens]) -> RichResult:
+  host, repo, query, tokens = key
+  return await _query_one(host, tokens, ('tag', repo, query))
+
+async def get_latest_release_with_prereleases(key: Tuple[str, str, Tokens, bool]) -> RichResult:
+  host, repo, tokens, use_release_name = key
+  return await _query_one(host, tokens, ('release', repo, use_release_name))
+
+def _get_tokens(
+  conf: Entry, host: str, keymanager: KeyManager,
+) -> Tokens:
+  # Load token from config
+  token = conf.get('token')
+  if token is not None:
+    return (token,) if token else ()
+  # Load tokens from keyman
+  return tuple(keymanager.get_keys(host.lower(), 'github'))
+
+def _graphql_item(conf: Entry) -> Optional[GraphQLItem]:
+  '''Return the GraphQL query item for entries that use the GraphQL API.'''
+  if conf.get('use_latest_tag', False):
+    return 'tag', conf['github'], conf.get('query', '')
+  if conf.get('use_latest_release', False) and conf.get('include_prereleases', False):
+    return 'release', conf['github'], conf.get('use_release_name', False)
+  return None
+
+class Worker(FunctionWorker):
+  '''Entries that use the GraphQL API are batched into fewer requests
+  (``GRAPHQL_BATCH_SIZE`` repositories per request); others are checked
+  one by one as usual.'''
+
+  def __init__(self, *args, **kwargs) -> None:
+    super().__init__(*args, **kwargs)
+    self.initialize(get_version)
+
+  async def run(self) -> None:
+    # (host, tokens) -> item -> tasks
+    batches: Dict[
+      Tuple[str, Tokens], Dict[GraphQLItem, List[Tuple[str, Entry]]],
+    ] = defaultdict(dict)
+    futures = []
+
+    for name, entry in self.tasks:
+      item = _graphql_item(entry)
+      host = entry.get('host', 'github.com')
+      tokens = _get_tokens(entry, host, self.keymanager)
+      if item is None or not tokens:
+        expect_requests(host, tokens, 'core', 1)
+        futures.append(self._run_one(host, tokens, name, entry))
+        continue
+      batches[(host, tokens)].setdefault(item, []).append((name, entry))
+
+    for (host, tokens), item_tasks in batches.items():
+      items = list(item_tasks.items())
+      expect_requests(
+        host, tokens, 'graphql', -(-len(items) // GRAPHQL_BATCH_SIZE))
+      for i in range(0, len(items), GRAPHQL_BATCH_SIZE):
+        futures.append(self._run_batch(
+          host, tokens, items[i:i+GRAPHQL_BATCH_SIZE]))
+
+    await asyncio.gather(*futures)
+
+  async def _run_one(
+    self, host: str, tokens: Tokens, name: str, entry: Entry,
+  ) -> None:
+    try:
+      await self.run_one(name, entry)
+    finally:
+      # the response may have been cached or shared, or no request needed
+      expect_requests(host, tokens, 'core', -1)
+
+  async def _run_batch(
+    self, host: str, tokens: Tokens,
+    batch: List[Tuple[GraphQLItem, List[Tuple[str, Entry]]]],
+  ) -> None:
+    items = [item for item, _ in batch]
+    timeout = shortest_timeout(task for _, tasks in batch for task in tasks)
+    results: List[Union[RichResult, Exception]]
+    try:
+      async with self.task_sem:
+        results = await asyncio.wait_for(
+          query_graphql(host, tokens, items), timeout)
+    except asyncio.TimeoutError:
+      results = [GetVersionError('timed out', timeout=timeout)] * len(items)
+    except Exception as e:
+      results = [e] * len(items)
+    finally:
+      expect_requests(host, tokens, 'graphql', -1)
+
+    for (_, tasks), r in zip(batch, results):
+      for name, entry in tasks:
+        await self.result_q.put(RawResult(name, r, entry))
+
+async def get_version(
   name: str, conf: Entry, *,
   cache: AsyncCache, keymanager: KeyManager,
   **kwargs,
 ) -> VersionResult:
   repo = conf['github']
   host = conf.get('host', "github.com")
-
-  # Load token from config
-  token = conf.get('token')
-  # Load token from keyman
-  if token is None:
-    token = keymanager.get_key(host.lower(), 'github')
+  tokens = _get_tokens(conf, host, keymanager)
 
   use_latest_tag = conf.get('use_latest_tag', False)
   if use_latest_tag:
-    if not token:
+    if not tokens:
       raise GetVersionError('token not given but it is required')
 
     query = conf.get('query', '')
-    return await cache.get((host, repo, query, token), get_latest_tag) # type: ignore
+    return await cache.get((host, repo, query, tokens), get_latest_tag) # type: ignore
 
   use_latest_release = conf.get('use_latest_release', False)
   include_prereleases = conf.get('include_prereleases', False)
   use_release_name = conf.get('use_release_name', False)
   if use_latest_release and include_prereleases:
-    if not token:
+    if not tokens:
       raise GetVersionError('token not given but it is required')
 
     return await cache.get(
-      (host, repo, token, use_release_name),
+      (host, repo, tokens, use_release_name),
       get_latest_release_with_prereleases) # type: ignore
 
   br = conf.get('branch')
@@ -239,10 +544,10 @@ async def get_version_real(
   headers = {
     'Accept': 'application/vnd.github.quicksilver-preview+json',
   }
-  if token:
-    headers['Authorization'] = f'token {token}'
 
-  data = await cache.get_json(url, headers = headers)
+  data = await cache.get(
+    (host, tokens, url, tuple(sorted(headers.items()))),
+    _get_json) # type: ignore
 
   if use_max_tag:
     tags: List[Union[str, RichResult]] = [
@@ -295,12 +600,12 @@ async def get_version_real(
       url = data[0]['html_url'],
     )
 
-def check_ratelimit(exc: HTTPError, name: str) -> Optional[int]:
+def check_ratelimit(exc: HTTPError, host: str) -> Optional[int]:
   res = exc.response
   if not res:
     raise exc
 
-  logger = structlog.get_logger(logger_name=__name__, name=name)
+  logger = structlog.get_logger(logger_name=__name__, host=host)
   if v := res.headers.get('retry-after'):
     n = int(v)
     logger.warning('retry-after', n=n)
@@ -11,13 +11,16 @@ async def get_version(name, conf, *, cache, **kwargs):
     conf['url'],
     conf.get('post_data'),
     conf.get('post_data_type', 'application/x-www-form-urlencoded'),
+    conf.get('max_bytes'),
   )
   body = await cache.get(key, get_body)
 
   encoding = conf.get('encoding')
   is_xml = conf.get('is_xml')
   if is_xml:
-    parser = etree.XMLParser(encoding=encoding)
+    # a document cut off by max_bytes isn't well-formed
+    recover = conf.get('max_bytes') is not None
+    parser = etree.XMLParser(encoding=encoding, recover=recover)
     doc = etree.fromstring(body, base_url=conf['url'], parser=parser)
   else:
     parser = html.HTMLParser(encoding=encoding)
@@ -48,7 +51,16 @@ async def get_version(name, conf, *, cache, **kwargs):
   return version
 
 async def get_body(info):
-  url, post_data, post_data_type = info
+  url, post_data, post_data_type, max_bytes = info
+
+  if post_data is None and max_bytes is not None:
+    body = bytearray()
+    async with session.stream(url) as res:
+      async for chunk in res:
+        body += chunk
+        if len(body) >= max_bytes:
+          break
+    return bytes(body[:max_bytes])
 
   if post_data is None:
     res = await session.get(url)
@@ -56,4 +68,4 @@ async def get_body(info):
     res = await session.post(url, body = post_data, headers = {
       'Content-Type': post_data_type,
     })
-  return res.body
+  return res.body[:max_bytes]
@@ -40,6 +40,6 @@ async def get_json(info):
     })
 
   try:
-    return json.loads(res.body)
+    return res.json()
   except json.decoder.JSONDecodeError as e:
     raise GetVersionError('bad json string', exc_info=e)
@@ -2,9 +2,9 @@
 # Copyright (c) 2024 Daniel Peukert <daniel@peukert.cc>, et al.
 
 import asyncio
-from io import BytesIO
 import tarfile
-from typing import List
+import tempfile
+from typing import List, IO
 
 from nvchecker.api import (
   session, VersionResult,
@@ -19,19 +19,22 @@ OPAM_VERSION_PATH_SUFFIX = "/opam"
 OPAM_DEFAULT_REPO = 'https://opam.ocaml.org'
 OPAM_DEFAULT_REPO_VERSION_URL = "%s/packages/%s/%s.%s"
 
-def _decompress_and_list_files(data: bytes) -> List[str]:
-  # Convert the bytes to a file object and get a list of files
-  with tarfile.open(mode='r', fileobj=BytesIO(data)) as archive:
-    return archive.getnames()
+def _list_files(f: IO[bytes]) -> List[str]:
+  # Read the archive as a stream to avoid seeking back and forth
+  f.seek(0)
+  with tarfile.open(mode='r|*', fileobj=f) as archive:
+    return [member.name for member in archive]
 
 async def get_files(url: str) -> List[str]:
-  # Download the file and get its contents
-  res = await session.get(url)
-  data = res.body
+  # Download the file to a temporary file rather than into memory
+  with tempfile.TemporaryFile() as f:
+    async with session.stream(url) as res:
+      async for chunk in res:
+        f.write(chunk)
 
-  # Get the file list of the archive
-  loop = asyncio.get_running_loop()
-  return await loop.run_in_executor(None, _decompress_and_list_files, data)
+    # Get the file list of the archive
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _list_files, f)
 
 async def get_package_versions(files: List[str], pkg: str) -> List[str]:
   # Prepare the filename prefix based on the package name
@@ -1,6 +1,7 @@
 # MIT licensed
 # Copyright (c) 2013-2020 lilydjwg <lilydjwg@gmail.com>, et al.
 
+import codecs
 import re
 
 from nvchecker.api import session, GetVersionError
@@ -13,11 +14,18 @@ async def get_version(name, conf, *, cache, **kwargs):
   if regex.groups > 1:
     raise GetVersionError('multi-group regex')
 
+  stop_on_match = conf.get('stop_on_match', False)
+  if stop_on_match is True:
+    stop_on_match = 1
+
   key = (
     conf['url'],
     conf.get('encoding', 'latin1'),
     conf.get('post_data'),
     conf.get('post_data_type', 'application/x-www-form-urlencoded'),
+    conf.get('max_bytes'),
+    # how much to read depends on the regex in this case
+    (conf['regex'], stop_on_match) if stop_on_match else None,
   )
   body = await cache.get(key, get_url)
 
@@ -27,13 +35,65 @@ async def get_version(name, conf, *, cache, **kwargs):
   return versions
 
 async def get_url(info):
-  url, encoding, post_data, post_data_type = info
+  url, encoding, post_data, post_data_type, max_bytes, stop = info
+
+  if max_bytes is None and stop is None:
+    if post_data is None:
+      res = await session.get(url)
+    else:
+      res = await session.post(url, body = post_data, headers = {
+        'Content-Type': post_data_type,
+      })
+    body = res.body.decode(encoding)
+    return body
 
   if post_data is None:
-    res = await session.get(url)
+    async with session.stream(url) as res:
+      return await read_partial(res, encoding, max_bytes, stop)
   else:
     res = await session.post(url, body = post_data, headers = {
       'Content-Type': post_data_type,
     })
-  body = res.body.decode(encoding)
-  return body
+    return await read_partial(_single(res.body), encoding, max_bytes, stop)
+
+async def _single(body):
+  yield body
+
+async def read_partial(chunks, encoding, max_bytes, stop):
+  '''Read and decode the body until ``max_bytes`` are read, or until
+  ``stop`` = (regex, n) matches n times.'''
+  decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+  text = ''
+  size = 0
+  if stop is not None:
+    regex = re.compile(stop[0])
+    needed = stop[1]
+    found = 0
+    scan_pos = 0
+    scanned_len = 0
+
+  async for chunk in chunks:
+    if max_bytes is not None and size + len(chunk) >= max_bytes:
+      chunk = chunk[:max_bytes - size]
+      text += decoder.decode(chunk, final=True)
+      break
+    size += len(chunk)
+    text += decoder.decode(chunk)
+
+    # Rescan only after the text has grown by half, so that the total
+    # scanning work stays linear in the size of the page.
+    if stop is None or len(text) - scanned_len < scanned_len // 2:
+      continue
+    scanned_len = len(text)
+    for m in regex.finditer(text, scan_pos):
+      # a match reaching the end may continue in the next chunk
+      if m.end() >= len(text):
+        break
+      found += 1
+      scan_pos = max(m.end(), m.start() + 1)
+      if found >= needed:
+        return text[:m.end()]
+  else:
+    text += decoder.decode(b'', final=True)
+
+  return text
@@ -1,29 +1,16 @@
 # MIT licensed
 # Copyright (c) 2024 Jakub Ružička <jru@debian.org>, et al.
 
-import asyncio
-import gzip
 import pathlib
 import urllib
-from typing import Set, TYPE_CHECKING
-
-if TYPE_CHECKING:
-  from typing_extensions import Buffer
-  def zstd_decompressor(data: Buffer) -> bytes:
-    return b''
-else:
-  try:
-    from compression import zstd
-    zstd_decompressor = zstd.decompress
-  except ImportError:
-    import zstandard
-    def zstd_decompressor(data):
-      dctx = zstandard.ZstdDecompressor()
-      return dctx.decompress(data, max_output_size=len(data) * 30)
+from typing import Set, Dict, List, Tuple
 
 import lxml.etree
 
-from nvchecker.api import session, AsyncCache, Entry, KeyManager, VersionResult
+from nvchecker.api import (
+  session, AsyncCache, Entry, KeyManager, VersionResult,
+  decompress_stream, compression_of,
+)
 
 
 # XML namespaces used in repodata (dead links haha)
@@ -33,6 +20,9 @@ NS = {
     'rpm':    'http://linux.duke.edu/metadata/rpm'
 }
 
+# package name -> [(arch, version)]
+PrimaryIndex = Dict[str, List[Tuple[str, str]]]
+
 
 async def get_version(
   name: str, conf: Entry, *,
@@ -60,17 +50,12 @@ async def get_version(
   primary_element = repomd_xml.find('repo:data[@type="primary"]/repo:location', namespaces=NS)
   primary_path = repo_path / primary_element.get('href') # type: ignore
   primary_url = repo_url._replace(path=str(primary_path)).geturl()
-  # download and decompress *primary.xml.gz (use cache)
-  primary_body = await cache.get(primary_url, get_file_gz) # type: ignore
-  # parse *primary.xml metadata
-  metadata = lxml.etree.fromstring(primary_body)
+  # download, decompress and index *primary.xml.gz (use cache)
+  index: PrimaryIndex = await cache.get(primary_url, get_primary) # type: ignore
 
   # use set to eliminate duplication
   versions_set: Set[str] = set()
-  # iterate package metadata
-  for el in metadata.findall(f'common:package[common:name="{pkg}"]', namespaces=NS):
-    pkg_arch = el.findtext('common:arch', namespaces=NS)
-
+  for pkg_arch, version in index.get(pkg, ()):
     # filter bych arch
     if arch == 'binary':
       if pkg_arch == 'src':
@@ -79,9 +64,7 @@ async def get_version(
       if pkg_arch != arch:
         continue
 
-    version_info = el.find('common:version', namespaces=NS)
-    version = version_info.get('ver') # type: ignore
-    versions_set.add(version) # type: ignore
+    versions_set.add(version)
 
   versions = list(versions_set)
   return versions # type: ignore
@@ -92,13 +75,36 @@ async def get_file(url: str) -> bytes:
   return res.body
 
 
-async def get_file_gz(url: str) -> bytes:
-  res = await session.get(url)
-  loop = asyncio.get_running_loop()
-  if url.endswith('.gz'):
-    decompressor = gzip.decompress
-  elif url.endswith('.zst'):
-    decompressor = zstd_decompressor
-  else:
+def _index_packages(
+  parser: lxml.etree.XMLPullParser, index: PrimaryIndex,
+) -> None:
+  for _, el in parser.read_events():
+    name = el.findtext('common:name', namespaces=NS)
+    pkg_arch = el.findtext('common:arch', namespaces=NS)
+    version_info = el.find('common:version', namespaces=NS)
+    if name and pkg_arch and version_info is not None:
+      index.setdefault(name, []).append((pkg_arch, version_info.get('ver', '')))
+
+    # free the parsed packages so that the whole document is never in memory
+    el.clear()
+    parent = el.getparent()
+    if parent is not None:
+      while el.getprevious() is not None:
+        del parent[0]
+
+async def get_primary(url: str) -> PrimaryIndex:
+  compression = compression_of(url)
+  if compression not in ('gz', 'zst'):
     raise Exception('unrecognized compression format', url)
-  return await loop.run_in_executor(None, decompressor, res.body)
+
+  # parse while downloading, keeping only what's needed to find versions
+  index: PrimaryIndex = {}
+  parser = lxml.etree.XMLPullParser(
+    events=('end',), tag=f'{{{NS["common"]}}}package')
+  async with session.stream(url) as res:
+    async for chunk in decompress_stream(res, compression):
+      parser.feed(chunk)
+      _index_packages(parser, index)
+  parser.close()
+  _index_packages(parser, index)
+  return index
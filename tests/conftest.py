@@ -2,10 +2,13 @@
 # Copyright (c) 2020, 2024 lilydjwg <lilydjwg@gmail.com>, et al.
 
 import asyncio
+import contextlib
 import structlog
 import os
 from pathlib import Path
-from typing import TYPE_CHECKING, Dict
+from typing import (
+  TYPE_CHECKING, Dict, List, Tuple, Union, Callable, Awaitable,
+)
 
 if TYPE_CHECKING:
   import tomli as tomllib
@@ -20,12 +23,17 @@ import pytest_asyncio
 
 from nvchecker import core
 from nvchecker import __main__ as main
+from nvchecker.httpclient import session
+from nvchecker.httpclient.base import (
+  BaseSession, Response, StreamResponse, HTTPError,
+)
 from nvchecker.util import Entries, ResultData, RawResult
 
 use_keyfile = False
 
 async def run_results(
-  entries: Entries, max_concurrency: int = 20,
+  entries: Entries, max_concurrency: int = 20, *,
+  keep_session: bool = False,
 ) -> ResultData:
   task_sem = asyncio.Semaphore(max_concurrency)
   result_q: asyncio.Queue[RawResult] = asyncio.Queue()
@@ -36,7 +44,11 @@ async def run_results(
   else:
     keymanager = core.KeyManager(None)
 
-  dispatcher = core.setup_httpclient()
+  if keep_session:
+    # use the session set up by the test, e.g. StubSession
+    dispatcher = core.Dispatcher()
+  else:
+    dispatcher = core.setup_httpclient()
   entry_waiter = core.EntryWaiter()
   futures = dispatcher.dispatch(
     entries, task_sem, result_q,
@@ -92,6 +104,66 @@ async def run_str_multi():
 
   return __call__
 
+# a body, or an async function returning one
+StubBody = Union[bytes, Callable[[], Awaitable[bytes]]]
+
+class StubSession(BaseSession):
+  '''Serve fixed response bodies by URL, and record the requested URLs.
+
+  URLs in ``etags`` are served with that ETag, and requests sending it in
+  ``If-None-Match`` get 304 responses.
+  '''
+  def __init__(self) -> None:
+    self.responses: Dict[str, StubBody] = {}
+    self.etags: Dict[str, str] = {}
+    self.urls: List[str] = []
+    # URLs answered with 304
+    self.not_modified: List[str] = []
+    # size of the chunks of streamed responses
+    self.chunk_size = 100
+
+  async def _response(
+    self, url: str, headers: Dict[str, str],
+  ) -> Tuple[int, Dict[str, str], bytes]:
+    self.urls.append(url)
+    body = self.responses.get(url)
+    if body is None:
+      raise HTTPError(404, 'Not Found', None)
+    res_headers = {}
+    etag = self.etags.get(url)
+    if etag is not None:
+      res_headers['ETag'] = etag
+      if headers.get('If-None-Match') == etag:
+        self.not_modified.append(url)
+        return 304, res_headers, b''
+    if callable(body):
+      body = await body()
+    return 200, res_headers, body
+
+  async def request_impl(self, url, *, headers={}, **kwargs) -> Response:
+    status, res_headers, body = await self._response(url, headers)
+    return Response(res_headers, body, status)
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(self, url, *, headers={}, **kwargs):
+    status, res_headers, body = await self._response(url, headers)
+    async def chunks():
+      for i in range(0, len(body), self.chunk_size):
+        yield body[i:i+self.chunk_size]
+    yield StreamResponse(res_headers, status, chunks())
+
+  async def check(self, entries: Entries) -> ResultData:
+    return await run_results(entries, keep_session=True)
+
+@pytest.fixture
+def stub_session():
+  '''Serve HTTP requests with a StubSession.'''
+  old = session._obj
+  s = StubSession()
+  session.set_obj(s)
+  yield s
+  session.set_obj(old)
+
 @pytest.fixture(scope="session", autouse=True)
 def raise_on_logger_msg():
   def proc(logger, method_name, event_dict):
@@ -0,0 +1,114 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import hashlib
+import json
+import lzma
+
+import pytest
+
+from nvchecker_source import apt
+
+MIRROR = 'https://deb.example.org/debian'
+
+PACKAGES = lzma.compress(b'''\
+Package: foo
+Version: 1.2-1
+Architecture: amd64
+
+Package: foo
+Version: 1:0.9-1
+Architecture: amd64
+
+Package: foo
+Version: 1.10-1
+Architecture: amd64
+
+Package: libbar1
+Source: bar
+Version: 2.0~rc1-1
+Architecture: amd64
+
+Package: libbar1
+Source: bar
+Version: 2.0-1
+Architecture: amd64
+''')
+
+RELEASE = f'''\
+Origin: Example
+Suite: sid
+MD5Sum:
+ 00000000000000000000000000000000 {len(PACKAGES)} main/binary-amd64/Packages.xz
+SHA256:
+ {hashlib.sha256(PACKAGES).hexdigest()} {len(PACKAGES)} main/binary-amd64/Packages.xz
+'''.encode()
+
+PACKAGES_URL = f'{MIRROR}/dists/sid/main/binary-amd64/Packages.xz'
+
+@pytest.fixture
+def index_cache(tmp_path):
+  apt.configure({'index_cache': str(tmp_path)})
+  yield tmp_path
+  apt.configure({})
+
+async def check(stub_session, entries):
+  results = await stub_session.check(entries)
+  return {k: r.version for k, r in results.items()}
+
+@pytest.mark.asyncio
+async def test_apt_index_cache(stub_session, index_cache):
+  stub_session.responses[f'{MIRROR}/dists/sid/Release'] = RELEASE
+  stub_session.responses[PACKAGES_URL] = PACKAGES
+  stub_session.chunk_size = 50
+  entries = {
+    'foo': {'source': 'apt', 'mirror': MIRROR, 'suite': 'sid'},
+    'libbar1': {'source': 'apt', 'mirror': MIRROR, 'suite': 'sid'},
+    'bar': {'source': 'apt', 'mirror': MIRROR, 'suite': 'sid',
+            'srcpkg': 'bar'},
+  }
+  expected = {'foo': '1:0.9-1', 'libbar1': '2.0-1', 'bar': '2.0-1'}
+
+  assert await check(stub_session, entries) == expected
+  assert stub_session.urls.count(PACKAGES_URL) == 1
+  assert len(list(index_cache.iterdir())) == 1
+
+  # the second run uses the stored index
+  assert await check(stub_session, entries) == expected
+  assert stub_session.urls.count(PACKAGES_URL) == 1
+
+@pytest.mark.asyncio
+async def test_apt_index_cache_version(stub_session, index_cache):
+  stub_session.responses[f'{MIRROR}/dists/sid/Release'] = RELEASE
+  stub_session.responses[PACKAGES_URL] = PACKAGES
+  path = index_cache / f'{hashlib.sha256(PACKAGES).hexdigest()}.json'
+  # stored in an older format
+  path.write_text(json.dumps({
+    'pkgs': {'foo': '0.1-1'}, 'srcpkgs': {}, 'pkg_to_src': {'foo': 'foo'},
+  }))
+  entries = {'foo': {'source': 'apt', 'mirror': MIRROR, 'suite': 'sid'}}
+
+  assert await check(stub_session, entries) == {'foo': '1:0.9-1'}
+  assert stub_session.urls.count(PACKAGES_URL) == 1
+  assert json.loads(path.read_text())['version'] == apt.INDEX_VERSION
+
+@pytest.mark.asyncio
+async def test_apt_http_cache(stub_session, tmp_path):
+  stub_session.responses[f'{MIRROR}/dists/sid/Release'] = RELEASE
+  stub_session.responses[PACKAGES_URL] = PACKAGES
+  stub_session.etags[PACKAGES_URL] = '"v1"'
+  stub_session.set_http_cache(tmp_path)
+  entries = {'foo': {'source': 'apt', 'mirror': MIRROR, 'suite': 'sid'}}
+
+  assert await check(stub_session, entries) == {'foo': '1:0.9-1'}
+  assert stub_session.not_modified == []
+
+  # the streamed Packages file is revalidated and read from the cache
+  assert await check(stub_session, entries) == {'foo': '1:0.9-1'}
+  assert stub_session.not_modified == [PACKAGES_URL]
+
+def test_parse_release_sha256():
+  sums = apt.parse_release_sha256(RELEASE.decode())
+  assert sums == {
+    'main/binary-amd64/Packages.xz': hashlib.sha256(PACKAGES).hexdigest(),
+  }
@@ -0,0 +1,65 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import io
+import tarfile
+
+import pytest
+
+from nvchecker_source import archpkg
+
+pytestmark = pytest.mark.asyncio
+
+def make_db(pkgs):
+  buf = io.BytesIO()
+  with tarfile.open(mode='w:gz', fileobj=buf) as tar:
+    for name, version, provides in pkgs:
+      desc = f'%FILENAME%\n{name}-{version}-x86_64.pkg.tar.zst\n\n' \
+             f'%NAME%\n{name}\n\n%VERSION%\n{version}\n\n%ARCH%\nx86_64\n\n'
+      if provides:
+        desc += '%PROVIDES%\n' + '\n'.join(provides) + '\n\n'
+      data = desc.encode()
+      info = tarfile.TarInfo(f'{name}-{version}/desc')
+      info.size = len(data)
+      tar.addfile(info, io.BytesIO(data))
+  return buf.getvalue()
+
+DBS = {
+  'https://mirror.example.org/core/os/x86_64/core.db': make_db([
+    ('base', '3-2', []),
+    ('dbus', '1.16.2-1', ['libdbus', 'libdbus-1.so=3-64']),
+  ]),
+  'https://mirror.example.org/extra/os/x86_64/extra.db': make_db([
+    ('base', '4-1', []),
+    ('vim', '9.1.1-1', []),
+    ('ffmpeg', '2:7.1-3', []),
+  ]),
+}
+
+@pytest.fixture
+def use_mirror():
+  archpkg.configure({
+    'mirror': 'https://mirror.example.org/',
+    'repos': ['core', 'extra'],
+  })
+  yield
+  archpkg.configure({})
+
+async def test_archpkg_db(stub_session, use_mirror):
+  stub_session.responses.update(DBS)
+  results = await stub_session.check({
+    'base': {'source': 'archpkg'},
+    'vim': {'source': 'archpkg', 'strip_release': True},
+    'ffmpeg': {'source': 'archpkg'},
+    'libdbus': {'source': 'archpkg', 'archpkg': 'dbus',
+                'provided': 'libdbus-1.so'},
+  })
+  assert {k: r.version for k, r in results.items()} == {
+    'base': '3-2',
+    'vim': '9.1.1',
+    'ffmpeg': '7.1-3',
+    'libdbus': '3-64',
+  }
+  assert results['vim'].url == 'https://archlinux.org/packages/extra/x86_64/vim/'
+  # each database is downloaded once
+  assert sorted(stub_session.urls) == sorted(DBS)
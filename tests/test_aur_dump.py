@@ -0,0 +1,61 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import gzip
+import json
+
+import pytest
+
+from nvchecker_source import aur
+
+pytestmark = pytest.mark.asyncio
+
+DUMP = [
+  {'Name': 'foo', 'Version': '1.0-1', 'LastModified': 1700000000,
+   'Description': 'with "quotes", [brackets] and ünïcode'},
+  {'Name': 'bar', 'Version': '2:3.1-2', 'LastModified': 1700000001},
+  {'Name': 'baz', 'Version': '0.1-1', 'LastModified': 1700000002},
+]
+
+async def chunked(data, size):
+  for i in range(0, len(data), size):
+    yield data[i:i+size]
+
+async def collect(chunks):
+  return [x async for x in aur._iter_json_objects(aur._maybe_gunzip(chunks))]
+
+@pytest.mark.parametrize('size', [1, 7, 100000])
+@pytest.mark.parametrize('compress', [False, True])
+async def test_iter_json_objects(size, compress):
+  data = json.dumps(DUMP, ensure_ascii=False, indent=1).encode()
+  if compress:
+    data = gzip.compress(data)
+  assert await collect(chunked(data, size)) == DUMP
+
+async def test_iter_json_objects_empty():
+  assert await collect(chunked(b' [ ] ', 1)) == []
+
+async def test_iter_json_objects_truncated():
+  data = json.dumps(DUMP).encode()
+  with pytest.raises(ValueError):
+    await collect(chunked(data[:-10], 10))
+
+@pytest.fixture
+def use_dump():
+  aur.configure({'use_dump': True})
+  yield
+  aur.configure({})
+
+async def test_aur_dump(stub_session, use_dump):
+  stub_session.responses[aur.AUR_DUMP_URL] = gzip.compress(
+    json.dumps(DUMP).encode())
+  results = await stub_session.check({
+    'foo': {'source': 'aur'},
+    'baz-git': {'source': 'aur', 'aur': 'baz', 'strip_release': True},
+  })
+  assert {k: r.version for k, r in results.items()} == {
+    'foo': '1.0-1',
+    'baz-git': '0.1',
+  }
+  # no RPC requests
+  assert stub_session.urls == [aur.AUR_DUMP_URL]
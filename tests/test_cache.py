@@ -3,6 +3,9 @@
 
 import pytest
 
+from nvchecker.httpclient import base
+from nvchecker.httpclient.base import BaseSession, Response
+
 httpbin_available = True
 try:
   import pytest_httpbin
@@ -49,3 +52,43 @@ tries = 2
 
   r = await run_str_multi(conf)
   assert len(set(r.values())) == 3
+
+@pytest.mark.skipif(not httpbin_available, reason="needs pytest_httpbin")
+async def test_cache_shared_requests(run_str_multi, httpbin):
+  # different cache keys in the source, but the same request
+  conf = rf'''
+[latin1]
+source = "regex"
+url = "{httpbin.url}/uuid"
+regex = '"uuid":\s*"([0-9a-f-]+)"'
+
+[utf-8]
+source = "regex"
+url = "{httpbin.url}/uuid"
+regex = '"uuid":\s*"([0-9a-f-]+)"'
+encoding = "utf-8"
+'''
+
+  r = await run_str_multi(conf)
+  assert r['latin1'] == r['utf-8']
+
+class CountingSession(BaseSession):
+  def __init__(self):
+    self.urls = []
+
+  async def request_impl(self, url, **kwargs):
+    self.urls.append(url)
+    return Response({}, b'x' * 10)
+
+async def test_shared_responses_size(monkeypatch):
+  monkeypatch.setattr(base, 'MAX_SHARED_SIZE', 25)
+  s = CountingSession()
+  s.begin_run()
+  for url in ['a', 'b', 'a', 'c', 'a', 'b']:
+    await s.get(f'https://example.org/{url}')
+  # "b" is dropped for "c", and "a" is kept as it's used recently
+  assert s.urls == [
+    'https://example.org/a', 'https://example.org/b',
+    'https://example.org/c', 'https://example.org/b',
+  ]
+  assert s._responses_size == 20
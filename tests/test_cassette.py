@@ -0,0 +1,50 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import pytest
+
+from nvchecker.httpclient.base import BaseSession, Response, HTTPError
+from nvchecker.httpclient.cassette import RecordingSession, ReplaySession
+from nvchecker.util import GetVersionError
+
+pytestmark = pytest.mark.asyncio
+
+class FakeSession(BaseSession):
+  async def request_impl(self, url, *, params=(), **kwargs):
+    if url.endswith('/missing'):
+      raise HTTPError(404, 'Not Found', Response({'X-Reason': 'gone'}, b''))
+    body = repr(list(params)).encode() + b'\xff'
+    return Response({'Content-Type': 'text/plain'}, body)
+
+async def test_record_replay(tmp_path):
+  rec = RecordingSession(FakeSession(), tmp_path)
+  res = await rec.get('https://example.org/a', params={'q': '1'})
+  with pytest.raises(HTTPError):
+    await rec.get('https://example.org/missing')
+  rec.end_run()
+
+  replay = ReplaySession(tmp_path)
+  replay.begin_run()
+  res2 = await replay.get('https://example.org/a', params={'q': '1'})
+  assert res2.body == res.body
+  assert res2.status == 200
+  assert res2.headers['content-type'] == 'text/plain'
+
+  with pytest.raises(HTTPError) as e:
+    await replay.get('https://example.org/missing')
+  assert e.value.code == 404
+  assert e.value.response.headers['X-Reason'] == 'gone'
+
+  with pytest.raises(GetVersionError):
+    await replay.get('https://example.org/a', params={'q': '2'})
+
+async def test_replay_stream(tmp_path):
+  rec = RecordingSession(FakeSession(), tmp_path)
+  await rec.get('https://example.org/a')
+  rec.end_run()
+
+  replay = ReplaySession(tmp_path)
+  # a full response can't be used for a stream, and vice versa
+  with pytest.raises(GetVersionError):
+    async with replay.stream('https://example.org/a'):
+      pass
@@ -0,0 +1,29 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+from datetime import datetime, timedelta, timezone
+
+from nvchecker.core import split_due_entries, format_time
+from nvchecker.util import RichResult
+
+def test_split_due_entries():
+  now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+  an_hour_ago = format_time(now - timedelta(hours=1))
+  entries = {
+    'recent': {'source': 'none'},
+    'recent-short-interval': {'source': 'none', 'check_interval': 600},
+    'never-checked': {'source': 'none'},
+    'old-format': {'source': 'none'},
+  }
+  last_results = {
+    'recent': RichResult(version='1', last_checked=an_hour_ago),
+    'recent-short-interval': RichResult(version='1', last_checked=an_hour_ago),
+    'old-format': RichResult(version='1'),
+  }
+
+  due, skipped = split_due_entries(entries, last_results, 86400, now)
+  assert set(due) == {'recent-short-interval', 'never-checked', 'old-format'}
+  assert skipped == {'recent': last_results['recent']}
+
+  due, skipped = split_due_entries(entries, last_results, None, now)
+  assert set(due) == set(entries)
@@ -0,0 +1,50 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import asyncio
+
+import pytest
+
+from nvchecker.httpclient.base import BaseSession, HTTPError
+from nvchecker.httpclient.circuitbreaker import BreakerPolicy, CircuitBreaker
+
+def test_circuit_breaker():
+  b = CircuitBreaker(BreakerPolicy(threshold=3, cooldown=3600))
+  assert not b.failed()
+  assert not b.failed()
+  # success resets the count
+  b.succeeded()
+  assert not b.failed()
+  assert not b.failed()
+  assert b.allow()
+  assert b.failed()
+  assert b.is_open
+  assert not b.allow()
+
+def test_circuit_breaker_probe():
+  b = CircuitBreaker(BreakerPolicy(threshold=1, cooldown=0))
+  assert b.failed()
+  # only one probe at a time
+  assert b.allow()
+  assert not b.allow()
+  # the probe failed
+  assert not b.failed()
+  assert b.is_open
+  assert b.allow()
+  b.succeeded()
+  assert not b.is_open
+  assert b.allow() and b.allow()
+
+class StatusSession(BaseSession):
+  async def request_impl(self, url, **kwargs):
+    raise HTTPError(404, 'Not Found', None)
+
+@pytest.mark.asyncio
+async def test_http_errors_dont_open_circuit():
+  s = StatusSession()
+  s.set_breaker_policy(BreakerPolicy(threshold=1))
+  for _ in range(3):
+    with pytest.raises(HTTPError):
+      await s.get('https://example.org/')
+    await asyncio.sleep(0)
+  assert not s._breakers['example.org'].is_open
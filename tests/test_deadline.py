@@ -0,0 +1,93 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import asyncio
+import time
+
+import pytest
+from structlog.testing import capture_logs
+
+from nvchecker import core
+from nvchecker import __main__ as main
+from nvchecker.util import RawResult, KeyManager, EntryWaiter
+from nvchecker_source import aur, github
+
+pytestmark = pytest.mark.asyncio
+
+async def test_entry_timeout(get_version):
+  t = time.monotonic()
+  with pytest.raises(RuntimeError):
+    await get_version("example", {
+      "source": "cmd",
+      "cmd": "sleep 10",
+      "timeout": 0.5,
+    })
+  assert time.monotonic() - t < 5
+
+async def test_deadline():
+  entries = {
+    'fast': {'source': 'cmd', 'cmd': 'echo 1'},
+    'slow': {'source': 'cmd', 'cmd': 'sleep 10'},
+  }
+  task_sem = asyncio.Semaphore(20)
+  result_q: asyncio.Queue[RawResult] = asyncio.Queue()
+  entry_waiter = EntryWaiter()
+  futures = core.Dispatcher().dispatch(
+    entries, task_sem, result_q,
+    KeyManager(None), entry_waiter, 1, {},
+  )
+  result_coro = core.process_result(
+    {}, result_q, entry_waiter, entries=entries)
+  runner_coro = core.run_tasks(futures, deadline=1)
+
+  t = time.monotonic()
+  with capture_logs() as logs:
+    results, has_failures = await main.run(result_coro, runner_coro)
+  assert time.monotonic() - t < 5
+
+  assert set(results) == {'fast'}
+  assert has_failures
+  events = [(x['event'], x.get('name')) for x in logs]
+  assert ('deadline reached, cancelling unfinished checks', None) in events
+  assert ('no-result', 'slow') in events
+
+async def test_github_batch_timeout(stub_session):
+  async def stall() -> bytes:
+    await asyncio.sleep(3600)
+    return b''
+  stub_session.responses[github.GITHUB_GRAPHQL_URL % 'github.com'] = stall
+
+  conf = {'source': 'github', 'token': 'token',
+          'use_latest_tag': True, 'timeout': 0.5}
+  with capture_logs() as logs:
+    results = await asyncio.wait_for(stub_session.check({
+      'a': {**conf, 'github': 'foo/a'},
+      'b': {**conf, 'github': 'foo/b', 'timeout': 10},
+    }), 5)
+
+  assert results == {}
+  events = [(x['event'], x['name'], x.get('timeout')) for x in logs]
+  assert ('timed out', 'a', 0.5) in events
+  # the batch is given the shortest timeout
+  assert ('timed out', 'b', 0.5) in events
+
+async def test_worker_timeout(stub_session):
+  async def stall() -> bytes:
+    await asyncio.sleep(3600)
+    return b''
+  stub_session.responses[aur.AUR_DUMP_URL] = stall
+
+  aur.configure({'use_dump': True})
+  try:
+    with capture_logs() as logs:
+      results = await asyncio.wait_for(stub_session.check({
+        'a': {'source': 'aur', 'timeout': 0.5},
+        'b': {'source': 'aur'},
+      }), 5)
+  finally:
+    aur.configure({})
+
+  assert results == {}
+  events = [(x['event'], x.get('timeout')) for x in logs]
+  # the shortest timeout applies to all entries of the worker
+  assert ('timed out, cancelled', 0.5) in events
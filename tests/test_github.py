@@ -181,3 +181,21 @@ async def test_github_max_release_creation_time(get_result):
     assert result.version == "second_release"
     assert result.creation_time == "2014-01-21T19:29:56Z"
     assert result.revision_creation_time is None
+
+async def test_github_graphql_batched(run_str_multi):
+    r = await run_str_multi('''
+[latest-tag]
+source = "github"
+github = "harry-sanabria/ReleaseTestRepo"
+use_latest_tag = true
+
+[latest-release-with-prereleases]
+source = "github"
+github = "dpeukert/ReleaseTestRepo"
+use_latest_release = true
+include_prereleases = true
+''')
+    assert r == {
+        "latest-tag": "release3",
+        "latest-release-with-prereleases": "v0.0.1-pre",
+    }
@@ -0,0 +1,74 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from nvchecker.api import GetVersionError
+from nvchecker_source import github
+
+HOST = 'github.example.org'
+
+def test_expect_requests():
+  tokens = ('a', 'b')
+  github.expect_requests(HOST, tokens, 'graphql', 3)
+  assert github.get_ratelimit(HOST, 'a', 'graphql').pending == 1.5
+  github.expect_requests(HOST, tokens, 'graphql', -3)
+  assert github.get_ratelimit(HOST, 'a', 'graphql').pending == 0
+  assert github.get_ratelimit(HOST, 'b', 'graphql').pending == 0
+
+@pytest.mark.asyncio
+async def test_pending_without_requests(stub_session):
+  url = github.GITHUB_LATEST_RELEASE % (HOST, 'foo/bar')
+  stub_session.responses[url] = json.dumps({
+    'tag_name': 'v1.0', 'html_url': 'https://example.org/',
+  }).encode()
+  limit = github.get_ratelimit(HOST, 'token', 'core')
+  limit.remaining = 100
+  limit.reset = time.time() + 3600
+
+  conf = {'source': 'github', 'github': 'foo/bar', 'host': HOST,
+          'token': 'token', 'use_latest_release': True}
+  results = await stub_session.check({'a': conf, 'b': conf})
+  assert {k: r.version for k, r in results.items()} == {'a': 'v1.0', 'b': 'v1.0'}
+
+  # the second entry got the response from the cache
+  assert stub_session.urls == [url]
+  assert limit.pending == 0
+  # no rate limit headers in the response
+  assert limit.remaining == 100
+
+def headers(remaining, reset):
+  return {'X-RateLimit-Remaining': str(remaining),
+          'X-RateLimit-Reset': str(reset)}
+
+def test_update_out_of_order():
+  limit = github.RateLimit()
+  reset = time.time() + 3600
+  limit.update(headers(5, reset))
+  # an older response arriving late
+  limit.update(headers(7, reset))
+  assert limit.remaining == 5
+  limit.update(headers(4999, reset + 3600))
+  assert limit.remaining == 4999
+
+@pytest.mark.asyncio
+async def test_reserve_budget():
+  limit = github.RateLimit()
+  reset = time.time() + 3600
+  limit.update(headers(1, reset))
+
+  await limit.acquire()
+  assert limit.in_flight == 1
+  # the last request of the budget is in flight
+  second = asyncio.ensure_future(limit.acquire())
+  await asyncio.sleep(0.01)
+  assert not second.done()
+
+  limit.release(headers(0, reset))
+  with pytest.raises(GetVersionError, match='rate limited'):
+    await second
+  assert limit.in_flight == 0
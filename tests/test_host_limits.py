@@ -0,0 +1,39 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import asyncio
+from urllib.parse import urlsplit
+
+import pytest
+
+from nvchecker.httpclient.base import BaseSession, Response
+
+pytestmark = pytest.mark.asyncio
+
+class CountingSession(BaseSession):
+  def __init__(self):
+    self.running = {}
+    self.max_running = {}
+
+  async def request_impl(self, url, **kwargs):
+    host = urlsplit(url).hostname
+    running = self.running.get(host, 0) + 1
+    self.running[host] = running
+    self.max_running[host] = max(self.max_running.get(host, 0), running)
+    await asyncio.sleep(0.01)
+    self.running[host] -= 1
+    return Response({}, b'')
+
+async def test_host_limits():
+  s = CountingSession()
+  s.set_host_limits({'Limited.example.org': 2})
+
+  await asyncio.gather(*(
+    # different paths so that the requests aren't shared
+    s.get(f'https://{host}/{i}')
+    for host in ['limited.example.org', 'unlimited.example.org']
+    for i in range(5)
+  ))
+
+  assert s.max_running['limited.example.org'] == 2
+  assert s.max_running['unlimited.example.org'] == 5
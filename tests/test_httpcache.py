@@ -0,0 +1,106 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import contextlib
+
+import pytest
+
+from nvchecker.httpclient import httpcache
+from nvchecker.httpclient.base import BaseSession, Response, StreamResponse
+
+pytestmark = pytest.mark.asyncio
+
+class ETagSession(BaseSession):
+  def __init__(self):
+    self.requests = []
+
+  async def request_impl(self, url, *, headers, **kwargs):
+    self.requests.append(headers)
+    if headers.get('If-None-Match') == '"v1"':
+      return Response({'ETag': '"v1"', 'X-Count': '2'}, b'', 304)
+    return Response({'ETag': '"v1"', 'X-Count': '1'}, b'body', 200)
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(self, url, *, headers, **kwargs):
+    res = await self.request_impl(url, headers=headers)
+    async def chunks():
+      for i in range(len(res.body)):
+        yield res.body[i:i+1]
+    yield StreamResponse(res.headers, res.status, chunks())
+
+async def read_stream(s, url, n=None):
+  async with s.stream(url) as res:
+    body = b''
+    async for chunk in res:
+      body += chunk
+      if len(body) == n:
+        break
+    return res, body
+
+async def test_http_cache(tmp_path):
+  s = ETagSession()
+  s.set_http_cache(tmp_path)
+
+  res = await s.get('https://example.org/')
+  assert res.body == b'body'
+  assert 'If-None-Match' not in s.requests[0]
+
+  # a new run
+  s.clear_response_cache()
+  res = await s.get('https://example.org/')
+  assert s.requests[1]['If-None-Match'] == '"v1"'
+  assert res.status == 200
+  assert res.body == b'body'
+  assert res.headers['x-count'] == '2'
+
+  # other URLs aren't affected
+  await s.get('https://example.org/other')
+  assert 'If-None-Match' not in s.requests[2]
+
+async def test_http_cache_authorization(tmp_path):
+  s = ETagSession()
+  s.set_http_cache(tmp_path)
+
+  await s.get('https://example.org/', headers={'Authorization': 'token a'})
+  s.clear_response_cache()
+  # not revalidated with another token or none
+  await s.get('https://example.org/', headers={'Authorization': 'token b'})
+  await s.get('https://example.org/')
+  assert 'If-None-Match' not in s.requests[1]
+  assert 'If-None-Match' not in s.requests[2]
+
+  await s.get('https://example.org/', headers={'Authorization': 'token a'})
+  assert s.requests[3]['If-None-Match'] == '"v1"'
+  # tokens aren't stored in plain text
+  for p in tmp_path.glob('*/*'):
+    assert b'token a' not in p.read_bytes()
+
+async def test_http_cache_stream(tmp_path):
+  s = ETagSession()
+  s.set_http_cache(tmp_path)
+
+  res, body = await read_stream(s, 'https://example.org/')
+  assert body == b'body'
+
+  # a new run
+  s.clear_response_cache()
+  res, body = await read_stream(s, 'https://example.org/')
+  assert s.requests[1]['If-None-Match'] == '"v1"'
+  assert res.status == 200
+  assert res.headers['x-count'] == '2'
+  assert body == b'body'
+
+async def test_http_cache_stream_not_stored(tmp_path, monkeypatch):
+  s = ETagSession()
+  s.set_http_cache(tmp_path)
+
+  # partially read
+  await read_stream(s, 'https://example.org/', 2)
+  # too big
+  monkeypatch.setattr(httpcache, 'MAX_STREAM_SIZE', 3)
+  await read_stream(s, 'https://example.org/')
+  monkeypatch.undo()
+
+  await read_stream(s, 'https://example.org/')
+  assert 'If-None-Match' not in s.requests[2]
+  assert [p.name for p in tmp_path.glob('*/*') if p.suffix == '.tmp'] == []
@@ -0,0 +1,34 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+from nvchecker.core import Journal, journal_file, read_journal
+from nvchecker.util import RichResult
+
+def test_journal(tmp_path):
+  file = journal_file(tmp_path / 'newver.json')
+  assert file.name == 'newver.json.journal'
+  assert read_journal(file) == {}
+
+  journal = Journal(file)
+  journal.append('a', RichResult(version='1', url='https://example.org/'))
+  journal.append('b', RichResult(version='2'))
+  journal.append('a', RichResult(version='3'))
+  # cut off by a crash
+  with open(file, 'a') as f:
+    f.write('{"name":"c","res')
+
+  results = read_journal(file)
+  assert results == {
+    'a': RichResult(version='3'),
+    'b': RichResult(version='2'),
+  }
+
+  journal = Journal(file, append=True)
+  journal.append('d', RichResult(version='4'))
+  assert set(read_journal(file)) == {'a', 'b', 'd'}
+  journal.remove()
+  assert not file.exists()
+
+  # a new run starts from scratch
+  journal = Journal(file)
+  assert read_journal(file) == {}
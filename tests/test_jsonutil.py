@@ -0,0 +1,29 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import json
+
+import pytest
+
+from nvchecker import jsonutil
+from nvchecker.core import json_encode
+from nvchecker.util import RichResult
+
+def test_dumps_like_stdlib():
+  d = {
+    'version': 2,
+    'data': {
+      'a': RichResult(version='1.0', url='https://example.org/ü'),
+      'b': RichResult(version='2', gitref='refs/tags/v2', revision='abc'),
+    },
+  }
+  assert jsonutil.dumps(d, indent=True, default=json_encode) == json.dumps(
+    d, indent=2, ensure_ascii=False, default=json_encode)
+  assert jsonutil.dumps({'a': [1, 2.5, None, 'ü']}) == '{"a":[1,2.5,null,"ü"]}'
+
+def test_loads():
+  assert jsonutil.loads(b'{"a": [1, "\xc3\xbc"]}') == {'a': [1, 'ü']}
+  # not supported by the fast decoders
+  assert jsonutil.loads('[Infinity]') == [float('inf')]
+  with pytest.raises(json.JSONDecodeError):
+    jsonutil.loads(b'{bad')
@@ -0,0 +1,20 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+from nvchecker.util import KeyManager
+
+def test_multiple_keys(tmp_path):
+  keyfile = tmp_path / 'keyfile.toml'
+  keyfile.write_text('''\
+[keys]
+"github.com" = ["token1", "token2"]
+gitlab = "token3"
+''')
+  km = KeyManager(keyfile)
+
+  assert km.get_keys('github.com') == ['token1', 'token2']
+  assert km.get_key('github.com') == 'token1'
+  assert km.get_keys('gitlab.com', 'gitlab') == ['token3']
+  assert km.get_key('gitlab') == 'token3'
+  assert km.get_keys('nonexistent.example.org') == []
+  assert km.get_key('nonexistent.example.org') is None
@@ -0,0 +1,102 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import contextlib
+
+import pytest
+
+from nvchecker.ctxvars import metrics as ctx_metrics
+from nvchecker.ctxvars import source as ctx_source
+from nvchecker.httpclient.base import (
+  BaseSession, Response, StreamResponse, TemporaryError,
+)
+from nvchecker.metrics import Metrics, EntryMetrics, EntryTimer, record_retry
+
+pytestmark = pytest.mark.asyncio
+
+class FakeSession(BaseSession):
+  def __init__(self):
+    self.failures = 1
+
+  async def request_impl(self, url, **kwargs):
+    if self.failures:
+      self.failures -= 1
+      raise TemporaryError(503, 'Service Unavailable', None)
+    return Response({}, b'1.2.3')
+
+  @contextlib.asynccontextmanager
+  async def stream_impl(self, url, **kwargs):
+    async def chunks():
+      yield b'abc'
+      yield b'de'
+    yield StreamResponse({}, 200, chunks())
+
+@pytest.fixture
+def metrics():
+  m = Metrics()
+  token = ctx_metrics.set(m)
+  source_token = ctx_source.set('regex')
+  yield m
+  ctx_source.reset(source_token)
+  ctx_metrics.reset(token)
+
+async def test_request_metrics(metrics):
+  s = FakeSession()
+  timer = EntryTimer('foo')
+  timer.acquired()
+  with pytest.raises(TemporaryError):
+    await s.get('https://example.org/foo')
+  await s.get('https://example.org/foo')
+  # retrying logs a warning, which fails tests
+  record_retry('https://example.org/foo')
+  timer.finish()
+
+  host = metrics.hosts['example.org']
+  assert host.http_requests == 2
+  assert host.http_errors == 1
+  assert host.http_retries == 1
+  assert host.http_bytes == 5
+
+  entry = metrics.entries['foo']
+  assert entry.source == 'regex'
+  assert entry.http_requests == 2
+  assert entry.seconds >= entry.wait_seconds >= 0
+
+  source = metrics.sources['regex']
+  assert source.http_requests == 2
+  assert source.seconds == entry.seconds
+
+async def test_stream_metrics(metrics):
+  s = FakeSession()
+  async with s.stream('https://example.org/foo') as res:
+    async for _ in res:
+      pass
+
+  host = metrics.hosts['example.org']
+  assert host.http_requests == 1
+  assert host.http_bytes == 5
+
+async def test_no_metrics():
+  s = FakeSession()
+  s.failures = 0
+  timer = EntryTimer('foo')
+  await s.get('https://example.org/foo')
+  timer.finish()
+  assert ctx_metrics.get() is None
+
+async def test_prometheus():
+  m = Metrics()
+  m.entry_result('regex', True)
+  m.host('example.org').http_requests = 3
+  m2 = Metrics()
+  m2.entry_result('regex', False)
+  m2.host('example.org').http_requests = 1
+  m.merge(m2)
+
+  m.entries['a"b'] = EntryMetrics(source='regex', seconds=1.5)
+  text = m.to_prometheus()
+  assert 'nvchecker_source_entries{source="regex"} 2\n' in text
+  assert 'nvchecker_source_failures{source="regex"} 1\n' in text
+  assert 'nvchecker_host_http_requests{host="example.org"} 4\n' in text
+  assert 'nvchecker_entry_seconds{name="a\\"b",source="regex"} 1.5\n' in text
+  assert '# TYPE nvchecker_run_seconds gauge\n' in text
@@ -136,3 +136,32 @@ async def test_regex_post_json2(get_version, httpbin):
     "post_data": '{"ABCDEF":234,"CDEFG":"xyz"}',
     "post_data_type": "application/json"
   }) == "xyz"
+
+async def test_max_bytes(get_version, httpbin):
+  assert await get_version("example", {
+    "source": "regex",
+    "url": httpbin.url + "/base64/" + base64_encode("version 1.12 released, version 1.13 released"),
+    "regex": r'version ([0-9.]+)',
+    "max_bytes": 20,
+  }) == "1.12"
+
+async def test_stop_on_match(get_version, httpbin):
+  assert await get_version("example", {
+    "source": "regex",
+    "url": httpbin.url + "/base64/" + base64_encode("version 1.12 released, version 1.13 released"),
+    "regex": r'version ([0-9.]+)',
+    "stop_on_match": True,
+  }) == "1.12"
+
+async def test_stop_on_match_chunked():
+  from nvchecker_source.regex import read_partial
+
+  async def chunks():
+    for c in b'version 1.12 released, version 1.13 released':
+      yield bytes([c])
+
+  # the match isn't cut off at chunk boundaries
+  text = await read_partial(chunks(), 'latin1', None, (r'version ([0-9.]+)', 1))
+  assert text == 'version 1.12'
+  text = await read_partial(chunks(), 'latin1', None, (r'version ([0-9.]+)', 2))
+  assert text == 'version 1.12 released, version 1.13'
@@ -0,0 +1,41 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import asyncio
+import socket
+
+import pytest
+
+from nvchecker.httpclient.resolver import CachingResolver
+
+pytestmark = pytest.mark.asyncio
+
+class CountingResolver(CachingResolver):
+  lookups = 0
+
+  async def _lookup(self, host, family):
+    self.lookups += 1
+    await asyncio.sleep(0.01)
+    return [(socket.AF_INET, '192.0.2.1')], 60
+
+async def test_resolver_cache():
+  r = CountingResolver()
+  addrs = await asyncio.gather(*(r.resolve('Example.org') for _ in range(5)))
+  assert addrs == [[(socket.AF_INET, '192.0.2.1')]] * 5
+  assert await r.resolve('example.org') == addrs[0]
+  assert r.lookups == 1
+
+  await r.resolve('example.net')
+  assert r.lookups == 2
+
+async def test_resolver_ip():
+  r = CountingResolver()
+  assert await r.resolve('127.0.0.1') == [(socket.AF_INET, '127.0.0.1')]
+  assert await r.resolve('[::1]') == [(socket.AF_INET6, '::1')]
+  assert r.lookups == 0
+
+async def test_resolver_system():
+  r = CachingResolver()
+  addrs = await r.resolve('localhost')
+  assert addrs
+  assert all(fam in (socket.AF_INET, socket.AF_INET6) for fam, _ in addrs)
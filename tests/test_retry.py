@@ -0,0 +1,71 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+from email.utils import formatdate
+import time
+
+import pytest
+from structlog.testing import capture_logs
+
+from nvchecker.ctxvars import tries
+from nvchecker.httpclient.base import (
+  BaseSession, RetryPolicy, TemporaryError, HTTPError, parse_retry_after,
+)
+
+class FakeResponse:
+  def __init__(self, headers):
+    self.headers = headers
+
+def test_parse_retry_after():
+  assert parse_retry_after('120') == 120
+  assert parse_retry_after('-1') == 0
+  t = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+  assert t is not None and 55 < t <= 60
+  assert parse_retry_after('soon') is None
+
+def test_retry_delay():
+  s = BaseSession()
+  s.set_retry_policy(RetryPolicy(backoff=2, max_delay=10))
+
+  e = TemporaryError(599, 'timeout', None)
+  for _ in range(10):
+    assert 0 <= s._retry_delay(3, e) <= 8
+    assert 0 <= s._retry_delay(10, e) <= 10
+
+  s.set_retry_policy(RetryPolicy(backoff=2, max_delay=10, budget=3))
+  s.begin_run()
+  e = TemporaryError(503, 'busy', FakeResponse({'Retry-After': '5'}))
+  assert s._retry_delay(1, e) == 5
+  # too long to wait
+  e = TemporaryError(503, 'busy', FakeResponse({'Retry-After': '3600'}))
+  assert s._retry_delay(1, e) is None
+
+  # the budget is used up
+  e = TemporaryError(599, 'timeout', None)
+  assert s._retry_delay(1, e) is not None
+  assert s._retry_delay(1, e) is not None
+  assert s._retry_delay(1, e) is None
+
+class RateLimitedSession(BaseSession):
+  def __init__(self):
+    self.count = 0
+
+  async def request_impl(self, url, **kwargs):
+    self.count += 1
+    raise HTTPError(429, 'Too Many Requests', FakeResponse({'Retry-After': '0'}))
+
+@pytest.mark.asyncio
+async def test_retry_rate_limited():
+  s = RateLimitedSession()
+  token = tries.set(3)
+  try:
+    with capture_logs(), pytest.raises(HTTPError):
+      await s.get('https://example.org/')
+    assert s.count == 3
+
+    # handled by the caller
+    with pytest.raises(HTTPError):
+      await s.get('https://example.org/', retry_rate_limited=False)
+    assert s.count == 4
+  finally:
+    tries.reset(token)
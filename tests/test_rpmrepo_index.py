@@ -0,0 +1,59 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import gzip
+
+import pytest
+
+pytest.importorskip('lxml')
+
+pytestmark = pytest.mark.asyncio
+
+REPO = 'https://rpm.example.org/repo/'
+
+REPOMD = b'''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <data type="primary"><location href="repodata/abc-primary.xml.gz"/></data>
+</repomd>
+'''
+
+def package(name, arch, ver):
+  return (
+    f'<package type="rpm"><name>{name}</name><arch>{arch}</arch>'
+    f'<version epoch="0" ver="{ver}" rel="1"/>'
+    f'<summary>{name} &lt;summary&gt;</summary></package>\n'
+  )
+
+PRIMARY = gzip.compress((
+  '<?xml version="1.0" encoding="UTF-8"?>\n'
+  '<metadata xmlns="http://linux.duke.edu/metadata/common" '
+  'xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="5">\n'
+  + package('foo', 'x86_64', '1.0')
+  + package('foo', 'src', '1.1')
+  + package('foo', 'aarch64', '1.0')
+  + package('bar', 'noarch', '2.0')
+  + package('bar', 'noarch', '2.1')
+  + '</metadata>\n'
+).encode())
+
+PRIMARY_URL = REPO + 'repodata/abc-primary.xml.gz'
+
+async def test_rpmrepo_index(stub_session):
+  stub_session.responses[REPO + 'repodata/repomd.xml'] = REPOMD
+  stub_session.responses[PRIMARY_URL] = PRIMARY
+  stub_session.chunk_size = 30
+  results = await stub_session.check({
+    'foo': {'source': 'rpmrepo', 'repo': REPO},
+    'foo-src': {'source': 'rpmrepo', 'repo': REPO, 'pkg': 'foo',
+                'arch': 'src'},
+    'foo-any': {'source': 'rpmrepo', 'repo': REPO, 'pkg': 'foo',
+                'arch': 'any'},
+    'bar': {'source': 'rpmrepo', 'repo': REPO},
+  })
+  assert {k: r.version for k, r in results.items()} == {
+    'foo': '1.0',
+    'foo-src': '1.1',
+    'foo-any': '1.1',
+    'bar': '2.1',
+  }
+  assert stub_session.urls.count(PRIMARY_URL) == 1
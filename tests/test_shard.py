@@ -0,0 +1,21 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+from nvchecker.core import shard_entries
+
+def test_shard_entries():
+  entries = {f'e{i}': {'source': 'none'} for i in range(100)}
+  entries['combined'] = {
+    'source': 'combiner', 'from': ['e1', 'e2'], 'format': '$1-$2',
+  }
+
+  shards = [shard_entries(entries, i, 4) for i in range(4)]
+  names = [name for shard in shards for name in shard]
+  assert sorted(names) == sorted(entries)
+  assert all(shards)
+  # stable between calls
+  assert shard_entries(entries, 1, 4) == shards[1]
+
+  # combined entries are checked in the same shard
+  shard = next(s for s in shards if 'combined' in s)
+  assert 'e1' in shard and 'e2' in shard
@@ -5,12 +5,30 @@ from nvchecker.sortversion import (
   vercmp, vercmp_available,
   AwesomeVersion, awesomeversion_available,
   portage_vercmp, portage_available,
+  dpkg_version,
 )
 
 def test_parse_version():
   assert parse_version("v6.0") < parse_version("6.1")
   assert parse_version("v6.0") > parse_version("v6.1-stable")
 
+def test_dpkg_version():
+  assert dpkg_version("1.0~rc1") < dpkg_version("1.0") < dpkg_version("1.0a")
+  assert dpkg_version("1.0") < dpkg_version("1.0+b1") < dpkg_version("1.0.1")
+  assert dpkg_version("1.0~") < dpkg_version("1.0")
+  assert dpkg_version("1.0~~") < dpkg_version("1.0~")
+  assert dpkg_version("1.9") < dpkg_version("1.10")
+  assert dpkg_version("1.0") == dpkg_version("1.0-0") == dpkg_version("0:1.0")
+  assert dpkg_version("1.01") == dpkg_version("1.1")
+  assert dpkg_version("9.9") < dpkg_version("1:0.1")
+  assert dpkg_version("2.0-1~bpo1") < dpkg_version("2.0-1")
+  assert dpkg_version("1.0-2-3") < dpkg_version("1.0-2-10")
+  assert dpkg_version("1.0") < dpkg_version("1.0.")
+  assert dpkg_version("0~rc1") < dpkg_version("0")
+  assert dpkg_version("0~git20200101-1") < dpkg_version("0-1")
+  assert dpkg_version("1:0~rc1") < dpkg_version("1:0")
+  assert dpkg_version("0~") < dpkg_version("")
+
 @pytest.mark.skipif(not vercmp_available,
                     reason="needs pyalpm")
 def test_vercmp():
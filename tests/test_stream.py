@@ -0,0 +1,83 @@
+# MIT licensed
+# Copyright (c) 2026 lilydjwg <lilydjwg@gmail.com>, et al.
+
+import asyncio
+import gzip
+import lzma
+
+import pytest
+
+from nvchecker.httpclient.base import TemporaryError
+from nvchecker.util import decompress_stream, compression_of, iter_lines
+
+pytestmark = pytest.mark.asyncio
+
+async def chunked(data, size=7):
+  for i in range(0, len(data), size):
+    yield data[i:i+size]
+
+async def collect(it):
+  return [x async for x in it]
+
+async def test_decompress_stream():
+  data = b''.join(b'line %d\n' % i for i in range(1000))
+  for kind, compressed in [
+    ('xz', lzma.compress(data)),
+    ('gz', gzip.compress(data)),
+    # concatenated members as produced by e.g. pigz
+    ('gz', gzip.compress(data[:100]) + gzip.compress(data[100:])),
+    (None, data),
+  ]:
+    out = await collect(decompress_stream(chunked(compressed), kind))
+    assert b''.join(out) == data
+
+async def test_compression_of():
+  assert compression_of('https://example.org/Packages.xz') == 'xz'
+  assert compression_of('https://example.org/primary.xml.zst') == 'zst'
+  assert compression_of('https://example.org/Packages') is None
+
+async def test_iter_lines():
+  data = 'α\nβγ\n\nlast'.encode()
+  # chunks of size 1 split the multi-byte characters
+  lines = await collect(iter_lines(chunked(data, 1)))
+  assert lines == ['α', 'βγ', '', 'last']
+
+async def serve_slowly(reader, writer, delays):
+  await reader.readuntil(b'\r\n\r\n')
+  writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(delays))
+  for delay in delays:
+    await asyncio.sleep(delay)
+    writer.write(b'x')
+    await writer.drain()
+  writer.close()
+
+@pytest.mark.parametrize('delays,ok', [
+  # longer than the timeout in total, but not between reads
+  ([0.3] * 8, True),
+  ([0, 3600], False),
+])
+async def test_tornado_stream_timeout(delays, ok):
+  tornado_httpclient = pytest.importorskip(
+    'nvchecker.httpclient.tornado_httpclient')
+  handlers = []
+  def handle(reader, writer):
+    handlers.append(asyncio.ensure_future(serve_slowly(reader, writer, delays)))
+  server = await asyncio.start_server(handle, '127.0.0.1', 0)
+  port = server.sockets[0].getsockname()[1]
+  s = tornado_httpclient.TornadoSession()
+  s.setup(timeout=1)
+
+  async def read():
+    async with s.stream(f'http://127.0.0.1:{port}/') as res:
+      return b''.join([chunk async for chunk in res])
+
+  try:
+    if ok:
+      assert await asyncio.wait_for(read(), 10) == b'x' * len(delays)
+    else:
+      with pytest.raises(TemporaryError):
+        await asyncio.wait_for(read(), 10)
+  finally:
+    server.close()
+    for fu in handlers:
+      fu.cancel()